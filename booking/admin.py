@@ -1,40 +1,142 @@
 from django.contrib import admin
-from .models import Train, Route, Passenger, Booking, Seat, Payment
+from django.db.models import OuterRef, Subquery
+from django.http import StreamingHttpResponse
+from railbooker.db_router import ReplicaAdminMixin
+from .models import Train, TrainClass, SeatClass, Station, StationAlias, Route, RouteFare, Passenger, Booking, Seat, Payment, SeatInventory, ClassSeatCount, SeatHold, TrainRun, StationEvent
+from . import services
+
+@admin.register(SeatClass)
+class SeatClassAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['code', 'name', 'position']
+    list_editable = ['name', 'position']
+    ordering = ['position', 'code']
+
+class TrainClassInline(admin.TabularInline):
+    model = TrainClass
+    extra = 1
 
 @admin.register(Train)
-class TrainAdmin(admin.ModelAdmin):
+class TrainAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'number', 'departure_time', 'arrival_time', 'duration']
     search_fields = ['name', 'number']
-    list_filter = ['departure_time', 'arrival_time']
+    list_filter = ['departure_time', 'arrival_time', 'classes__seat_class']
+    inlines = [TrainClassInline]
+
+class StationAliasInline(admin.TabularInline):
+    model = StationAlias
+    extra = 1
+
+@admin.register(Station)
+class StationAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['code', 'name']
+    search_fields = ['code', 'name', 'aliases__alias']
+    inlines = [StationAliasInline]
+
+class RouteFareInline(admin.TabularInline):
+    model = RouteFare
+    extra = 1
 
 @admin.register(Route)
-class RouteAdmin(admin.ModelAdmin):
-    list_display = ['train', 'from_station', 'to_station', 'distance']
+class RouteAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['train', 'from_station', 'to_station', 'from_code', 'to_code', 'distance']
     search_fields = ['from_station', 'to_station', 'train__name']
     list_filter = ['train']
+    list_select_related = ['train']
+    inlines = [RouteFareInline]
 
 @admin.register(Passenger)
-class PassengerAdmin(admin.ModelAdmin):
+class PassengerAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'age', 'gender', 'id_proof']
     search_fields = ['name', 'id_proof']
     list_filter = ['gender', 'age']
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
-    list_display = ['booking_id', 'pnr', 'user', 'train', 'travel_date', 'status', 'total_amount']
+class BookingAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['booking_id', 'pnr', 'user', 'train', 'travel_date', 'seat_class', 'fare', 'status', 'party_size', 'total_amount']
     search_fields = ['booking_id', 'pnr', 'user__username', 'train__name']
     list_filter = ['status', 'seat_class', 'booking_type', 'travel_date']
+    list_select_related = ['user', 'train']
     readonly_fields = ['booking_id', 'pnr']
+    actions = ['cancel_train_runs']
+    
+    def get_queryset(self, request):
+        # Base fare of the booked class on the booked route, from RouteFare
+        fares = RouteFare.objects.filter(route=OuterRef('route'), seat_class=OuterRef('seat_class'))
+        return super().get_queryset(request).annotate(base_fare=Subquery(fares.values('price')[:1]))
+    
+    @admin.display(description='Base fare', ordering='base_fare')
+    def fare(self, obj):
+        return obj.base_fare
+    
+    @admin.action(description='Cancel whole train runs of the selected bookings', permissions=['change'])
+    def cancel_train_runs(self, request, queryset):
+        runs = list(queryset.order_by().values_list('train', 'travel_date').distinct())
+        trains = Train.objects.in_bulk({train_id for train_id, _ in runs})
+        
+        def stream():
+            for train_id, travel_date in runs:
+                train = trains[train_id]
+                yield f'Cancelling {train.number} on {travel_date}\n'
+                for progress in services.cancel_train_run(train, travel_date):
+                    yield f"  {progress['cancelled']}/{progress['total']} cancelled, {progress['refunded']} refunded\n"
+            yield 'Done.\n'
+        
+        return StreamingHttpResponse(stream(), content_type='text/plain; charset=utf-8')
 
 @admin.register(Seat)
-class SeatAdmin(admin.ModelAdmin):
+class SeatAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['booking', 'seat_number', 'coach', 'seat_type', 'passenger']
     search_fields = ['seat_number', 'coach', 'passenger__name']
     list_filter = ['seat_type', 'coach']
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['booking', 'amount', 'payment_method', 'status', 'transaction_id']
     search_fields = ['transaction_id', 'booking__pnr']
     list_filter = ['status', 'payment_method']
-    readonly_fields = ['transaction_id']
\ No newline at end of file
+    readonly_fields = ['transaction_id']
+
+@admin.register(SeatInventory)
+class SeatInventoryAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['train', 'travel_date', 'seat_class', 'coach', 'booked_count', 'capacity']
+    list_filter = ['seat_class', 'travel_date']
+    search_fields = ['train__name', 'train__number', 'coach']
+    readonly_fields = ['layout', 'occupancy', 'booked_count', 'version']
+
+@admin.register(ClassSeatCount)
+class ClassSeatCountAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['train', 'travel_date', 'seat_class', 'booked', 'rac', 'waitlisted', 'updated_at']
+    list_filter = ['seat_class', 'travel_date']
+    search_fields = ['train__name', 'train__number']
+    list_select_related = ['train']
+    # Kept in step with the coach seat maps and queues by booking.inventory and
+    # booking.waitlist; see rebuild_seat_counts
+    readonly_fields = ['train', 'travel_date', 'seat_class', 'booked', 'rac', 'waitlisted']
+
+@admin.register(SeatHold)
+class SeatHoldAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['key', 'user', 'train', 'travel_date', 'seat_class', 'coach', 'seats', 'expires_at']
+    list_filter = ['seat_class', 'travel_date']
+    search_fields = ['key', 'user__username', 'train__number']
+    list_select_related = ['user', 'train']
+    
+    # Holds own seats in the occupancy bitmaps; only booking.holds may change them
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class StationEventInline(admin.TabularInline):
+    model = StationEvent
+    extra = 0
+
+@admin.register(TrainRun)
+class TrainRunAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['train', 'run_date', 'created_at']
+    list_filter = ['run_date']
+    search_fields = ['train__name', 'train__number']
+    inlines = [StationEventInline]
@@ -0,0 +1,506 @@
+"""Versioned JSON API for the React frontend, mounted under /api/v1/.
+
+Every endpoint answers with compact JSON (no whitespace) and reads the same
+modules as the HTML views, so caches and invalidation are shared:
+
+* ``GET search/``: routes between two stations with each class's
+  availability and the fare for the party, from the search cache. Unlike
+  the HTML search it writes nothing: a pair without routes has no results.
+* ``GET availability/?trains=1,2,3``: availability of several trains in
+  one call, in the same four queries whatever the number of trains.
+* ``GET fares/?routes=1,2``: fare breakdowns per passenger.
+* ``GET bookings/`` (keyset pages) and ``POST bookings/`` (confirm seats
+  or join the RAC/waitlist queue, honouring ``Idempotency-Key``).
+* ``GET pnr/<pnr>/``: the cached PNR snapshot.
+* ``GET routes/<id>/calendar/?days=60``: seats left per class for each
+  of the next 60 to 120 days, from booking.seat_calendar.
+* ``POST batch/``: up to ``API_BATCH_LIMIT`` GETs of the above in one
+  round trip, answered in order.
+* ``GET session/``: the signed-in user, if any. It sets the ``csrftoken``
+  cookie, which a client reads and sends back as ``X-CSRFToken`` on
+  ``POST bookings/``; ``batch/`` only runs GETs and needs no token.
+
+``?fields=a,b`` keeps only those keys of each result. GET responses carry
+an ETag of their body and must be revalidated, so a client polling
+unchanged data gets an empty 304.
+"""
+import copy
+import hashlib
+import json
+from datetime import date
+from functools import wraps
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.http import HttpResponse, QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+
+from railbooker.db_router import use_replica
+from .forms import TrainSearchForm, PassengerForm, PaymentForm, BookingFilterForm
+from .models import Booking, Route, Train
+from .pagination import KeysetPage
+from .views import add_class_options, search_trains
+from . import (
+    fares, idempotency, inventory, pnr_cache, search_cache, seat_calendar, services, stations, waitlist,
+)
+
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+
+def _batch_limit():
+    return getattr(settings, 'API_BATCH_LIMIT', 20)
+
+
+def _select(item, fields):
+    return {key: value for key, value in item.items() if key in fields} if isinstance(item, dict) else item
+
+
+def api_response(request, data, status=200, private=False):
+    """Compact JSON response; GETs get an ETag and are answered 304 when it matches
+
+    ``?fields=`` is applied to each of ``data['results']`` if there is such
+    a list, otherwise to ``data`` itself.
+    """
+    fields = {field for field in request.GET.get('fields', '').split(',') if field}
+    if fields and status == 200:
+        if isinstance(data.get('results'), list):
+            data = {**data, 'results': [_select(item, fields) for item in data['results']]}
+        else:
+            data = _select(data, fields)
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    response = HttpResponse(body, status=status, content_type='application/json')
+    if request.method != 'GET' or status != 200:
+        return response
+    response['ETag'] = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+    patch_cache_control(response, no_cache=True, **{'private' if private else 'public': True})
+    if private:
+        patch_vary_headers(response, ['Cookie'])
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def api_error(message, status=400, **extra):
+    body = json.dumps({'error': message, **extra}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+def api_login_required(view):
+    """login_required answering 401 instead of redirecting to the login page"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error('Authentication required.', status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _ids(value):
+    """Distinct integer ids of a comma separated parameter, at most ``API_BATCH_LIMIT``"""
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('Expected comma separated ids.')
+    if not ids or len(ids) > _batch_limit():
+        raise ValueError(f'Expected 1 to {_batch_limit()} ids.')
+    return ids
+
+
+def _party_size(value):
+    size = int(value or 1)
+    if not 1 <= size <= 6:
+        raise ValueError('A party has 1 to 6 passengers.')
+    return size
+
+
+def _form_errors(form):
+    return api_error('Invalid request.', errors=form.errors.get_json_data())
+
+
+def serialize_train(train):
+    return {
+        'id': train.id,
+        'number': train.number,
+        'name': train.name,
+        'departure_time': train.departure_time,
+        'arrival_time': train.arrival_time,
+        'duration': train.duration,
+    }
+
+
+def serialize_route(route):
+    return {
+        'id': route.id,
+        'train': serialize_train(route.train),
+        'from_station': route.from_station,
+        'to_station': route.to_station,
+        'departure_time': route.departs,
+        'arrival_time': route.arrives,
+        'distance': route.distance,
+        'classes': getattr(route, 'class_options', None),
+    }
+
+
+def serialize_booking(booking):
+    return {
+        'booking_id': booking.booking_id,
+        'pnr': booking.pnr,
+        'status': booking.status,
+        'travel_date': booking.travel_date,
+        'seat_class': booking.seat_class,
+        'booking_type': booking.booking_type,
+        'party_size': booking.party_size,
+        'total_amount': booking.total_amount,
+        'created_at': booking.created_at,
+        'train': {'number': booking.train.number, 'name': booking.train.name},
+        'route': {'from_station': booking.route.from_station, 'to_station': booking.route.to_station},
+    }
+
+
+def _class_availability(free, class_queue, party_size):
+    status = waitlist.status_for(free, class_queue, party_size)
+    return {
+        'seats_left': free,
+        'status': status,
+        'availability': waitlist.label(status, class_queue, free),
+        'rac': class_queue['rac'],
+        'waitlisted': class_queue['waitlisted'],
+    }
+
+
+@require_GET
+@use_replica
+def search(request):
+    """Routes between two stations with availability and party fares per class
+
+    Read-only: the mock routes the HTML search creates for an unknown pair are
+    not created here, and an empty result is not cached, so that the HTML
+    search still creates them on its next miss.
+    """
+    form = TrainSearchForm(request.GET)
+    if not form.is_valid():
+        return _form_errors(form)
+    search_data = dict(form.cleaned_data)
+    search_data['travel_date'] = search_data['travel_date'].isoformat()
+    seat_class = request.GET.get('seat_class') or None
+
+    trains, routes, itineraries, fare_table = search_cache.get_results(
+        search_data['from_station'],
+        search_data['to_station'],
+        search_data['travel_date'],
+        seat_class,
+        lambda: search_trains(search_data, seat_class, create_mock_routes=False),
+        keep=lambda results: results[1] or results[2]
+    )
+    # Adults without concessions until the passengers are known; see fares/
+    passengers_data = [{}] * search_data['passengers']
+    add_class_options(
+        routes,
+        inventory.seats_left(trains, search_data['travel_date']),
+        waitlist.queues(trains, search_data['travel_date']),
+        fare_table,
+        search_data,
+        passengers_data
+    )
+    return api_response(request, {
+        'travel_date': search_data['travel_date'],
+        'results': [serialize_route(route) for route in routes],
+        'itineraries': itineraries,
+    })
+
+
+@require_GET
+@use_replica
+def availability(request):
+    """Availability of every class of several trains on one date, for a party"""
+    try:
+        train_ids = _ids(request.GET.get('trains', ''))
+        travel_date = date.fromisoformat(request.GET.get('date', ''))
+        party_size = _party_size(request.GET.get('passengers'))
+    except ValueError as e:
+        return api_error(str(e) or 'Expected trains, date and passengers.')
+    seat_class = request.GET.get('seat_class')
+
+    trains = list(Train.objects.filter(id__in=train_ids).only('id'))
+    seats_left = inventory.seats_left(trains, travel_date)
+    queues = waitlist.queues(trains, travel_date)
+    results = []
+    for train in sorted(trains, key=lambda train: train_ids.index(train.id)):
+        classes = {}
+        for code, free in seats_left[train.id].items():
+            if (seat_class and code != seat_class) or code not in queues.get(train.id, {}):
+                continue
+            classes[code] = _class_availability(free, queues[train.id][code], party_size)
+        results.append({'train': train.id, 'classes': classes})
+    return api_response(request, {'travel_date': travel_date, 'results': results})
+
+
+def _passengers(values):
+    """Passengers of a fare query: each value is an age, optionally followed by ':' and a gender"""
+    passengers = []
+    for value in values:
+        age, _, gender = value.partition(':')
+        if not age.isdigit():
+            raise ValueError('Expected passenger=<age> or passenger=<age>:<gender>.')
+        passengers.append({'age': int(age), 'gender': gender or None})
+    return passengers or [{}]
+
+
+@require_GET
+@use_replica
+def fare_quotes(request):
+    """Fare breakdowns of several routes, per class and per passenger"""
+    try:
+        route_ids = _ids(request.GET.get('routes', ''))
+        passengers = _passengers(request.GET.getlist('passenger'))
+    except ValueError as e:
+        return api_error(str(e) or 'Expected routes and passenger ages.')
+    seat_class = request.GET.get('seat_class')
+    booking_type = request.GET.get('booking_type', 'regular')
+
+    routes = list(Route.objects.filter(id__in=route_ids).prefetch_related('fares'))
+    routes.sort(key=lambda route: route_ids.index(route.id))
+    fare_table = fares.FareTable(routes)
+    totals = fare_table.totals(passengers, booking_type)
+    results = []
+    for route in routes:
+        results.append({
+            'route': route.id,
+            'train': route.train_id,
+            'classes': {
+                code: fare_table.quote(route.id, code, passengers, booking_type)
+                for code in totals[route.id] if not seat_class or code == seat_class
+            },
+        })
+    return api_response(request, {'results': results})
+
+
+@require_GET
+@use_replica
+def route_calendar(request, route_id):
+    """Seats left per class of a route's train for each day from ``start`` (today)"""
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        days = int(request.GET.get('days', seat_calendar.DEFAULT_DAYS))
+    except ValueError:
+        return api_error('Expected start as YYYY-MM-DD and a number of days.')
+    if not 1 <= days <= seat_calendar.MAX_DAYS:
+        return api_error(f'A calendar covers 1 to {seat_calendar.MAX_DAYS} days.')
+    train_id = Route.objects.filter(pk=route_id).values_list('train_id', flat=True).first()
+    if train_id is None:
+        return api_error('Route not found.', status=404)
+    return api_response(request, {
+        'route': route_id,
+        'train': train_id,
+        'results': seat_calendar.calendar(train_id, start, days),
+    })
+
+
+@require_GET
+@use_replica
+def pnr(request, pnr):
+    """Status of a PNR, from the PNR cache"""
+    snapshot = pnr_cache.get_snapshot(pnr.upper())
+    if snapshot is None:
+        return api_error('PNR not found.', status=404)
+    # Names and ages of the passengers: never in a shared cache
+    return api_response(request, snapshot, private=True)
+
+
+@require_GET
+@ensure_csrf_cookie
+def session(request):
+    """The signed-in user; also sets the CSRF cookie for the client's POSTs"""
+    user = request.user
+    return api_response(request, {
+        'authenticated': user.is_authenticated,
+        'username': user.get_username() if user.is_authenticated else None,
+    }, private=True)
+
+
+@require_http_methods(['GET', 'POST'])
+@api_login_required
+def bookings(request):
+    """The user's bookings newest first (GET) or a new booking (POST)"""
+    if request.method == 'POST':
+        return create_booking(request)
+    return my_bookings(request)
+
+
+@use_replica
+def my_bookings(request):
+    bookings = Booking.objects.filter(user=request.user).select_related('train', 'route')
+    form = BookingFilterForm(request.GET or None)
+    filters = {}
+    if form.is_valid():
+        filters = form.cleaned_data
+        if filters['status']:
+            bookings = bookings.filter(status=filters['status'])
+        if filters['travel_date_from']:
+            bookings = bookings.filter(travel_date__gte=filters['travel_date_from'])
+        if filters['travel_date_to']:
+            bookings = bookings.filter(travel_date__lte=filters['travel_date_to'])
+
+    page = KeysetPage(
+        bookings,
+        per_page=10,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        params=filters
+    )
+    return api_response(request, {
+        'results': [serialize_booking(booking) for booking in page],
+        'next': page.next_query,
+        'previous': page.previous_query,
+    }, private=True)
+
+
+def _booking_request(request):
+    """Validated (search_data, passengers_data, payment_method) of a booking POST, or an error response"""
+    try:
+        payload = json.loads(request.body)
+        passengers = payload['passengers']
+    except (ValueError, KeyError, TypeError):
+        return api_error('Expected a JSON object with a "passengers" list.')
+    if not isinstance(payload, dict) or not isinstance(passengers, list):
+        return api_error('Expected a JSON object with a "passengers" list.')
+
+    form = TrainSearchForm({**payload, 'passengers': len(passengers)})
+    if not form.is_valid():
+        return _form_errors(form)
+    passengers_data = []
+    for passenger in passengers:
+        passenger_form = PassengerForm(passenger if isinstance(passenger, dict) else {})
+        if not passenger_form.is_valid():
+            return _form_errors(passenger_form)
+        passengers_data.append(passenger_form.cleaned_data)
+    payment_form = PaymentForm({'payment_method': payload.get('payment_method')})
+    if not payment_form.is_valid():
+        return _form_errors(payment_form)
+    return payload, form.cleaned_data, passengers_data, payment_form.cleaned_data['payment_method']
+
+
+def create_booking(request):
+    """Book seats picked on the seat map, or join the class's RAC or waitlist queue when it is full
+
+    The body holds the search fields, ``train``, ``seat_class``,
+    ``passengers``, ``payment_method`` and, for an available class,
+    ``coach`` and one of ``seats`` per passenger. The fare is priced here.
+    """
+    parsed = _booking_request(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    payload, search_data, passengers_data, payment_method = parsed
+
+    idempotency_key = idempotency.from_request(request)
+    booking_id = idempotency_key and idempotency.replayed(request.user, idempotency_key)
+    if booking_id:
+        booking = Booking.objects.select_related('train', 'route').get(booking_id=booking_id)
+        return api_response(request, serialize_booking(booking))
+
+    seat_class = payload.get('seat_class')
+    route = stations.routes_between(
+        search_data['from_station'], search_data['to_station']
+    ).select_related('train').prefetch_related('fares').filter(train_id=payload.get('train')).first()
+    fare_table = fares.FareTable([route] if route else [])
+    if (route is None or fare_table.base_fare(route.id, seat_class) is None
+            or not inventory.class_capacity(route.train, seat_class)):
+        return api_error('This class is not available on the selected train.', status=404)
+    train = route.train
+    travel_date = search_data['travel_date']
+    total_amount = fare_table.quote(route.id, seat_class, passengers_data, search_data['booking_type'])['total']
+
+    free = inventory.class_free_seats(train, travel_date, seat_class)
+    class_queue = waitlist.queues([train], travel_date)[train.id].get(seat_class)
+    status = class_queue and waitlist.status_for(free, class_queue, len(passengers_data))
+    if not status:
+        return api_error('This class is full and its waitlist is closed.', status=409)
+
+    booking_args = dict(
+        user=request.user,
+        train=train,
+        route=route,
+        travel_date=travel_date,
+        seat_class=seat_class,
+        booking_type=search_data['booking_type'],
+        passengers_data=passengers_data,
+        payment_method=payment_method,
+        total_amount=total_amount,
+        idempotency_key=idempotency_key,
+    )
+    try:
+        if status == 'available':
+            seats = [str(seat).strip().upper() for seat in payload.get('seats') or []]
+            if not payload.get('coach') or len(set(seats)) != len(passengers_data):
+                return api_error('Pick one seat per passenger in one coach.')
+            booking = services.create_booking(coach=payload['coach'], selected_seats=seats, **booking_args)
+        else:
+            booking = services.join_waitlist(**booking_args)
+    except inventory.SeatUnavailable as e:
+        return api_error(str(e), status=409)
+    except IntegrityError:
+        # A concurrent request with the same key committed first
+        booking_id = idempotency_key and idempotency.replayed(request.user, idempotency_key)
+        if not booking_id:
+            raise
+        booking = Booking.objects.get(booking_id=booking_id)
+
+    booking = Booking.objects.select_related('train', 'route').get(pk=booking.pk)
+    response = api_response(request, serialize_booking(booking), status=201)
+    response['Location'] = f'/api/v1/pnr/{booking.pnr}/'
+    return response
+
+
+def _subrequest(request, url):
+    """Run one GET of a batch through its view; returns (status, parsed body)
+
+    A body that is not JSON becomes ``{"error": ...}`` for that item alone.
+    """
+    parts = urlsplit(url)
+    try:
+        match = resolve(parts.path)
+    except Resolver404:
+        match = None
+    if match is None or match.namespace != 'api' or match.url_name == 'batch':
+        return 404, {'error': 'Not an API endpoint.'}
+
+    sub = copy.copy(request)
+    sub.method = 'GET'
+    sub.path = sub.path_info = parts.path
+    sub.GET = QueryDict(parts.query)
+    sub.META = {key: value for key, value in request.META.items() if key not in CONDITIONAL_HEADERS}
+    sub.META.update(REQUEST_METHOD='GET', QUERY_STRING=parts.query)
+    response = match.func(sub, *match.args, **match.kwargs)
+    try:
+        return response.status_code, json.loads(response.content)
+    except ValueError:
+        return response.status_code, {'error': 'The response is not JSON.'}
+
+
+@csrf_exempt
+@require_POST
+def batch(request):
+    """Several GETs of this API in one round trip
+
+    The body is ``{"requests": ["/api/v1/availability/?trains=1,2&date=...", ...]}``
+    and the answer lists ``{"status": ..., "body": ...}`` in the same order.
+    Every sub-request runs as a GET, which changes nothing, so like a plain
+    GET the batch needs no CSRF token.
+    """
+    try:
+        urls = json.loads(request.body)['requests']
+    except (ValueError, KeyError, TypeError):
+        return api_error('Expected a JSON object with a "requests" list.')
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return api_error('Expected a JSON object with a "requests" list.')
+    if len(urls) > _batch_limit():
+        return api_error(f'A batch holds at most {_batch_limit()} requests.')
+
+    responses = []
+    for url in urls:
+        status, body = _subrequest(request, url)
+        responses.append({'status': status, 'body': body})
+    return api_response(request, {'responses': responses})
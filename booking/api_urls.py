@@ -0,0 +1,15 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('search/', api.search, name='search'),
+    path('availability/', api.availability, name='availability'),
+    path('fares/', api.fare_quotes, name='fares'),
+    path('bookings/', api.bookings, name='bookings'),
+    path('routes/<int:route_id>/calendar/', api.route_calendar, name='route_calendar'),
+    path('pnr/<str:pnr>/', api.pnr, name='pnr'),
+    path('batch/', api.batch, name='batch'),
+    path('session/', api.session, name='session'),
+]
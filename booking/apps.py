@@ -2,4 +2,25 @@ from django.apps import AppConfig
 
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'booking'
\ No newline at end of file
+    name = 'booking'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from railbooker import sqlite
+        from railbooker.metrics import register_collector, track_queries
+        from .search_cache import stats
+        from .seat_classes import seed
+        
+        def search_cache_metrics():
+            snapshot = stats()
+            return [
+                (f'railbooker_search_cache_{name}_total', 'counter', (), snapshot[name])
+                for name in ('hits', 'misses', 'invalidations')
+            ]
+        
+        register_collector(search_cache_metrics)
+        connection_created.connect(sqlite.configure, dispatch_uid='railbooker.sqlite.configure')
+        connection_created.connect(track_queries, dispatch_uid='railbooker.metrics.track_queries')
+        post_migrate.connect(seed, sender=self, dispatch_uid='booking.seat_classes.seed')
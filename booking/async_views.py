@@ -0,0 +1,188 @@
+"""Async versions of the read-only views, served when running under ASGI.
+
+They wait on the database and the cache without holding a thread, so one
+worker can keep many slow connections open at once. The ORM calls use the
+async queryset API; what Django 4.2 only offers synchronously (the lazy
+``request.user``, template rendering with its context processors and the
+search cache loader) runs through ``sync_to_async``. booking.urls selects
+these views when ``ASYNC_READ_VIEWS`` is set, which railbooker.asgi does.
+"""
+import asyncio
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
+
+from railbooker.db_router import use_replica
+from .forms import PNRStatusForm, TrainStatusForm, BookingFilterForm
+from .models import Booking
+from .pagination import KeysetPage
+from .views import add_class_options, search_trains
+from . import inventory, pnr_cache, running_status, search_cache, waitlist
+
+arender = sync_to_async(render)
+
+
+def login_required(view):
+    """login_required for async views, which Django 4.2's decorator does not support"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Resolves the lazy user once; later attribute reads do not query
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@use_replica
+async def train_results(request):
+    """Display available trains"""
+    wizard = await request.wizard.aload()
+    search_data = wizard.get('search_data')
+    passengers_data = wizard.get('passengers_data')
+
+    if not search_data or not passengers_data:
+        messages.error(request, 'Please complete the search and passenger details first.')
+        return redirect('booking:index')
+
+    seat_class = request.GET.get('seat_class')
+    trains, routes, itineraries, fare_table = await sync_to_async(search_cache.get_results)(
+        search_data['from_station'],
+        search_data['to_station'],
+        search_data['travel_date'],
+        seat_class,
+        lambda: search_trains(search_data, seat_class)
+    )
+
+    seats_left = await inventory.aseats_left(trains, search_data['travel_date'])
+    queues = await waitlist.aqueues(trains, search_data['travel_date'])
+    add_class_options(routes, seats_left, queues, fare_table, search_data, passengers_data)
+
+    context = {
+        'trains': trains,
+        'routes': routes,
+        'itineraries': itineraries,
+        'search_data': search_data,
+        'passengers_data': passengers_data,
+    }
+
+    return await arender(request, 'booking/train_results.html', context)
+
+
+@use_replica
+async def pnr_status(request):
+    """PNR status check"""
+    form = PNRStatusForm()
+    booking = None
+
+    if request.method == 'POST':
+        form = PNRStatusForm(request.POST)
+        if form.is_valid():
+            booking = await pnr_cache.aget_snapshot(form.cleaned_data['pnr'])
+            if booking is None:
+                messages.error(request, 'PNR not found.')
+
+    context = {
+        'form': form,
+        'booking': booking,
+    }
+
+    if booking:
+        context.update({
+            'passengers': booking['passengers'],
+            'seats': booking['seats'],
+        })
+
+    return await arender(request, 'booking/pnr_status.html', context)
+
+
+async def train_status(request):
+    """Train status tracking"""
+    form = TrainStatusForm()
+    train_data = None
+
+    if request.method == 'POST' or 'query' in request.GET:
+        form = TrainStatusForm(request.POST if request.method == 'POST' else request.GET)
+        if form.is_valid():
+            query = form.cleaned_data['query'].strip().upper()
+            # Accept a PNR as well as a train number
+            snapshot = await pnr_cache.aget_snapshot(query) if query.startswith('PNR') else None
+            train_number = snapshot['train']['number'] if snapshot else query
+            state = await running_status.aget_state(train_number)
+            if state:
+                train_data = running_status.position(state)
+            else:
+                messages.info(request, 'No running status is available for this train yet.')
+
+    context = {
+        'form': form,
+        'train_data': train_data,
+    }
+
+    return await arender(request, 'booking/train_status.html', context)
+
+
+@login_required
+@use_replica
+async def my_bookings(request):
+    """User's booking history"""
+    bookings = Booking.objects.filter(user=request.user).select_related('train', 'route')
+
+    form = BookingFilterForm(request.GET or None)
+    filters = {}
+    if form.is_valid():
+        filters = form.cleaned_data
+        if filters['status']:
+            bookings = bookings.filter(status=filters['status'])
+        if filters['travel_date_from']:
+            bookings = bookings.filter(travel_date__gte=filters['travel_date_from'])
+        if filters['travel_date_to']:
+            bookings = bookings.filter(travel_date__lte=filters['travel_date_to'])
+
+    page_obj = await KeysetPage.acreate(
+        bookings,
+        per_page=10,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        params=filters
+    )
+
+    context = {
+        'page_obj': page_obj,
+        'filter_form': form,
+    }
+
+    return await arender(request, 'booking/my_bookings.html', context)
+
+
+async def train_status_stream(request, train_number):
+    """Server-sent events with the live position of a train, for up to RUNNING_STATUS_STREAM_SECONDS
+
+    Waiting between polls costs no thread here; the browser reconnects when
+    the stream ends.
+    """
+    interval = settings.RUNNING_STATUS_STREAM_INTERVAL
+    deadline = time.monotonic() + settings.RUNNING_STATUS_STREAM_SECONDS
+
+    async def events():
+        yield f'retry: {interval * 1000}\n\n'
+        last_sent = None
+        while time.monotonic() < deadline:
+            state = await running_status.aget_state(train_number)
+            data = running_status.position(state) if state else None
+            if data != last_sent:
+                last_sent = data
+                yield running_status.encode_event(data)
+            else:
+                yield ': keep-alive\n\n'
+            await asyncio.sleep(interval)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
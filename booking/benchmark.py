@@ -0,0 +1,294 @@
+"""End-to-end benchmark of the booking funnel.
+
+Drives index -> passenger_details -> train_results -> payment ->
+seat_selection -> e_ticket -> pnr_status -> cancellation through the Django
+test client against a freshly seeded throwaway database, and records for
+every step its latency, the number of queries it issued and the rows it
+read and wrote. A step that fails, by status or by raising, counts as an
+error (its time is still recorded) and ends that funnel. Used by the
+``benchmark_funnel`` management command.
+"""
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta, time as clock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.backends import utils as backend_utils
+from django.test import Client
+
+from .models import Train, TrainClass, Route, RouteFare, Booking
+from .stations import normalize
+
+STEPS = [
+    'index', 'passenger_details', 'train_results', 'payment',
+    'seat_selection', 'e_ticket', 'pnr_status', 'cancellation',
+]
+
+SEATS = {'1st-ac': 24, '2nd-ac': 48, '3rd-ac': 64, 'sleeper': 72, 'general': 90}
+PRICES = {'1st-ac': 3500, '2nd-ac': 2200, '3rd-ac': 1500, 'sleeper': 900, 'general': 500}
+STATIONS = ['New Delhi', 'Mumbai Central', 'Howrah', 'Chennai Central', 'Bengaluru', 'Secunderabad', 'Pune', 'Bhopal']
+
+_AVAILABLE_SEAT = re.compile(r'class="seat available[^"]*"\s+data-seat="([^"]+)"')
+_counters = threading.local()
+
+
+def seed(trains=50, routes_per_train=4, users=10, bookings_per_user=0):
+    """Fill the database with a synthetic timetable and users"""
+    Train.objects.bulk_create([
+        Train(
+            name=f'Express {n}',
+            number=f'{10000 + n}',
+            departure_time=clock(n % 24, (n * 7) % 60),
+            arrival_time=clock((n + 9) % 24, (n * 11) % 60),
+            duration='9h',
+        )
+        for n in range(trains)
+    ])
+    TrainClass.objects.bulk_create([
+        TrainClass(train=train, seat_class=seat_class, seats=seats)
+        for train in Train.objects.order_by('id')
+        for seat_class, seats in SEATS.items()
+    ], batch_size=1000)
+    routes = []
+    for n, train in enumerate(Train.objects.order_by('id')):
+        for k in range(routes_per_train):
+            origin = STATIONS[(n + k) % len(STATIONS)]
+            destination = STATIONS[(n + k + 1) % len(STATIONS)]
+            routes.append(Route(
+                train=train, from_station=origin, to_station=destination,
+                from_code=normalize(origin), to_code=normalize(destination),
+                distance=500 + k * 100,
+            ))
+    Route.objects.bulk_create(routes, batch_size=1000)
+    RouteFare.objects.bulk_create([
+        RouteFare(route=route, seat_class=seat_class, price=price)
+        for route in Route.objects.order_by('id')
+        for seat_class, price in PRICES.items()
+    ], batch_size=1000)
+
+    created = []
+    for n in range(users):
+        user = User(username=f'bench{n}')
+        user.set_unusable_password()
+        created.append(user)
+    User.objects.bulk_create(created)
+
+    if bookings_per_user:
+        route = Route.objects.select_related('train').first()
+        Booking.objects.bulk_create([
+            Booking(
+                booking_id=f'HIST{u.pk}X{i}', pnr=f'H{u.pk:04d}{i:05d}'[:10], user=u,
+                train=route.train, route=route, travel_date=date.today(),
+                seat_class='general', total_amount=500, status='confirmed',
+            )
+            for u in User.objects.filter(username__startswith='bench')
+            for i in range(bookings_per_user)
+        ], batch_size=1000)
+
+
+@contextmanager
+def instrumented():
+    """Count queries, rows read and rows written on this thread's connection"""
+    stats = {'queries': 0, 'rows_read': 0, 'rows_written': 0}
+    _counters.stats = stats
+
+    def execute(execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        stats['queries'] += 1
+        if not sql.lstrip().upper().startswith('SELECT'):
+            stats['rows_written'] += max(context['cursor'].rowcount, 0)
+        return result
+
+    with connection.execute_wrapper(execute):
+        try:
+            yield stats
+        finally:
+            _counters.stats = None
+
+
+FETCHES = ('fetchone', 'fetchmany', 'fetchall')
+
+
+def _counting(name):
+    def fetch(self, *args, **kwargs):
+        rows = self.db.wrap_database_errors(getattr(self.cursor, name))(*args, **kwargs)
+        stats = getattr(_counters, 'stats', None)
+        if stats is not None and rows:
+            stats['rows_read'] += 1 if name == 'fetchone' else len(rows)
+        return rows
+    fetch.__name__ = name
+    return fetch
+
+
+@contextmanager
+def counting_fetches():
+    """Shadow the cursor's delegated fetch methods for a run so reads can be counted"""
+    for name in FETCHES:
+        setattr(backend_utils.CursorWrapper, name, _counting(name))
+    try:
+        yield
+    finally:
+        for name in FETCHES:
+            delattr(backend_utils.CursorWrapper, name)
+
+
+class FunnelRunner:
+    """One simulated customer going through the whole booking funnel"""
+
+    def __init__(self, user, passengers, record):
+        self.client = Client()
+        self.client.force_login(user)
+        self.passengers = passengers
+        self.record = record
+
+    def step(self, name, method, url, data=None, expect=(200, 302)):
+        with instrumented() as stats:
+            started = time.perf_counter()
+            try:
+                response = getattr(self.client, method)(url, data or {})
+            except Exception as e:
+                # The test client re-raises what the view raised; count it like an error status
+                self.record(name, time.perf_counter() - started, stats, False)
+                raise RuntimeError(f'{name} raised {type(e).__name__}: {e}') from e
+            elapsed = time.perf_counter() - started
+        ok = response.status_code in expect
+        self.record(name, elapsed, stats, ok)
+        if not ok:
+            raise RuntimeError(f'{name} returned {response.status_code}')
+        return response
+
+    def run(self, route, travel_date, seat_class='general'):
+        count = self.passengers
+        self.step('index', 'post', '/', {
+            'from_station': route.from_station,
+            'to_station': route.to_station,
+            'travel_date': travel_date.isoformat(),
+            'passengers': count,
+            'booking_type': 'regular',
+        }, expect=(302,))
+        passengers = {}
+        for i in range(count):
+            passengers.update({
+                f'passenger_{i}-name': f'Passenger {i}',
+                f'passenger_{i}-age': 30 + i,
+                f'passenger_{i}-gender': 'Female' if i % 2 else 'Male',
+                f'passenger_{i}-id_proof': f'ID{i:06d}',
+            })
+        self.step('passenger_details', 'post', '/passenger-details/', passengers, expect=(302,))
+        self.step('train_results', 'get', '/train-results/')
+        self.step('payment', 'post', f'/payment/{route.train_id}/?seat_class={seat_class}',
+                  {'payment_method': 'upi'}, expect=(302,))
+        page = self.step('seat_selection', 'get', f'/seat-selection/{route.train_id}/')
+        seats = _AVAILABLE_SEAT.findall(page.content.decode())[:count]
+        response = self.step('seat_selection', 'post', f'/seat-selection/{route.train_id}/',
+                             {'selected_seats': ','.join(seats)}, expect=(302,))
+        booking_id = response['Location'].rstrip('/').rsplit('/', 1)[-1]
+        self.step('e_ticket', 'get', f'/e-ticket/{booking_id}/')
+        pnr = Booking.objects.filter(booking_id=booking_id).values_list('pnr', flat=True).first()
+        self.step('pnr_status', 'post', '/pnr-status/', {'pnr': pnr})
+        self.step('cancellation', 'post', '/cancellation/', {'check_pnr': '1', 'pnr': pnr})
+        self.step('cancellation', 'post', '/cancellation/', {'cancel_booking': '1', 'booking_id': booking_id})
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples, errors):
+    steps = {}
+    for name in STEPS:
+        runs = samples.get(name, [])
+        if not runs:
+            continue
+        latencies = [elapsed * 1000 for elapsed, _ in runs]
+        queries = [stats['queries'] for _, stats in runs]
+        steps[name] = {
+            'count': len(runs),
+            'errors': errors.get(name, 0),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_queries': round(statistics.mean(queries), 2),
+            'max_queries': max(queries),
+            'mean_rows_read': round(statistics.mean(stats['rows_read'] for _, stats in runs), 2),
+            'mean_rows_written': round(statistics.mean(stats['rows_written'] for _, stats in runs), 2),
+        }
+    return steps
+
+
+def run(iterations=20, concurrency=1, passengers=2, seat_class='general'):
+    """Run the funnel iterations times on each of concurrency threads"""
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    failures = []
+    lock = threading.Lock()
+    routes = list(Route.objects.order_by('id'))
+    users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    if len(users) < concurrency:
+        raise ValueError(f'Need at least {concurrency} seeded users, found {len(users)}.')
+
+    def record(name, elapsed, stats, ok):
+        # Failed steps are timed too, so a step that only fails still shows up
+        with lock:
+            samples[name].append((elapsed, dict(stats)))
+            if not ok:
+                errors[name] += 1
+
+    def worker(number):
+        runner = FunnelRunner(users[number], passengers, record)
+        for iteration in range(iterations):
+            route = routes[(number * iterations + iteration) % len(routes)]
+            # A fresh travel date per funnel keeps workers from contending for seats
+            travel_date = date.today() + timedelta(days=1 + number * iterations + iteration)
+            try:
+                runner.run(route, travel_date, seat_class)
+            except Exception as e:
+                with lock:
+                    failures.append(f'worker {number} iteration {iteration}: {e}')
+        connection.close()
+
+    started = time.perf_counter()
+    with counting_fetches():
+        if concurrency == 1:
+            worker(0)
+        else:
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'config': {
+            'iterations': iterations,
+            'concurrency': concurrency,
+            'passengers': passengers,
+            'seat_class': seat_class,
+        },
+        'wall_seconds': round(wall, 3),
+        'funnels_per_second': round(iterations * concurrency / wall, 3) if wall else None,
+        'failures': failures[:20],
+        'steps': summarize(samples, errors),
+    }
+
+
+def compare(result, baseline, tolerance=0.25):
+    """List the steps that got slower than the baseline or issue more queries"""
+    regressions = []
+    for name, current in result['steps'].items():
+        previous = baseline.get('steps', {}).get(name)
+        if not previous:
+            continue
+        if current['max_queries'] > previous['max_queries']:
+            regressions.append(f"{name}: max queries {previous['max_queries']} -> {current['max_queries']}")
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+    return regressions
@@ -0,0 +1,179 @@
+"""Fare engine.
+
+A FareTable holds, for a list of routes, the per-passenger fare components
+of every class and quota (regular and tatkal), in paise:
+
+* the base fare from the route's RouteFare rows,
+* a reservation charge by class and a charge by distance slab,
+* the tatkal surcharge, a share of the base fare clamped per class,
+* GST on AC classes.
+
+Age concessions (senior citizens and children, regular quota only) depend
+on the passengers, so they are applied when a page is priced: the whole
+routes x classes x passengers grid is computed in one pass, with NumPy when
+it is installed and plain integer loops otherwise. Both give the same
+results since everything is integer arithmetic in paise.
+"""
+from decimal import Decimal
+
+from . import seat_classes
+from .models import Booking
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+QUOTAS = [value for value, _ in Booking.BOOKING_TYPE_CHOICES]
+
+# Per passenger, in rupees; classes these rules do not list pay none of the charge
+RESERVATION_CHARGE = {'1st-ac': 60, '2nd-ac': 50, '3rd-ac': 40, 'sleeper': 20, 'general': 0}
+# (up to km, charge in rupees); the last slab has no upper bound
+DISTANCE_SLABS = [(500, 10), (1000, 20), (2000, 30), (None, 45)]
+# Share of the base fare in percent, with minimum and maximum in rupees
+TATKAL_SURCHARGE = {
+    '1st-ac': (30, 400, 500),
+    '2nd-ac': (30, 400, 500),
+    '3rd-ac': (30, 300, 400),
+    'sleeper': (30, 100, 200),
+    'general': (10, 10, 15),
+}
+GST_PERCENT = {'1st-ac': 5, '2nd-ac': 5, '3rd-ac': 5, 'sleeper': 0, 'general': 0}
+# (minimum age, genders or None for all, percent off the base fare), first match wins
+SENIOR_CONCESSIONS = [(58, {'Female'}, 50), (60, None, 40)]
+CHILD_MAX_AGE = 11
+CHILD_CONCESSION = 50
+
+
+def distance_charge(distance):
+    for limit, charge in DISTANCE_SLABS:
+        if limit is None or distance <= limit:
+            return charge * 100
+    return 0
+
+
+def concession(passenger, quota='regular'):
+    """Percent off the base fare for a passenger; tatkal tickets get none"""
+    if quota == 'tatkal':
+        return 0
+    age = int(passenger.get('age') or 0)
+    if age and age <= CHILD_MAX_AGE:
+        return CHILD_CONCESSION
+    for min_age, genders, percent in SENIOR_CONCESSIONS:
+        if age >= min_age and (genders is None or passenger.get('gender') in genders):
+            return percent
+    return 0
+
+
+def _rupees(paise):
+    return Decimal(int(paise)) / 100
+
+
+class FareTable:
+    """Precomputed fare components of routes by class and quota
+
+    Reads ``route.fares``, so prefetch it when pricing many routes.
+    """
+
+    def __init__(self, routes):
+        self.route_ids = [route.id for route in routes]
+        self.index = {route_id: i for i, route_id in enumerate(self.route_ids)}
+        # Columns of the grids, in catalogue order
+        self.classes = classes = seat_classes.codes()
+        # Classes each route has a fare for
+        self.offered = []
+        # base[r][c], fixed[r][c] (reservation and distance), tatkal[r][c]
+        self.base, self.fixed, self.tatkal = [], [], []
+        for route in routes:
+            prices = {fare.seat_class: fare.price for fare in route.fares.all()}
+            self.offered.append({cls for cls in classes if cls in prices})
+            base = [int(prices.get(cls, 0) * 100) for cls in classes]
+            slab = distance_charge(route.distance)
+            self.base.append(base)
+            self.fixed.append([RESERVATION_CHARGE.get(cls, 0) * 100 + slab for cls in classes])
+            self.tatkal.append([
+                min(max(price * percent // 100, minimum * 100), maximum * 100)
+                for price, (percent, minimum, maximum) in zip(
+                    base, (TATKAL_SURCHARGE.get(cls, (0, 0, 0)) for cls in classes)
+                )
+            ])
+        self.gst = [GST_PERCENT.get(cls, 0) for cls in classes]
+        if np is not None:
+            self.base, self.fixed, self.tatkal, self.gst = (
+                np.array(values, dtype=np.int64).reshape(shape)
+                for values, shape in (
+                    (self.base, (len(routes), len(classes))),
+                    (self.fixed, (len(routes), len(classes))),
+                    (self.tatkal, (len(routes), len(classes))),
+                    (self.gst, (len(classes),)),
+                )
+            )
+
+    def base_fare(self, route_id, seat_class):
+        """Base fare of one passenger, or None if the route has no fare for the class"""
+        r = self.index[route_id]
+        if seat_class not in self.offered[r]:
+            return None
+        return _rupees(self.base[r][self.classes.index(seat_class)])
+
+    def components(self, passengers, quota='regular'):
+        """Per-passenger fare components as [route][class][passenger] grids, in paise"""
+        percents = [concession(passenger, quota) for passenger in passengers]
+        tatkal = quota == 'tatkal'
+        if np is not None:
+            percents = np.array(percents, dtype=np.int64)
+            base = np.repeat(self.base[:, :, None], len(percents), axis=2)
+            discount = base * percents // 100
+            charges = np.repeat(self.fixed[:, :, None], len(percents), axis=2)
+            surcharge = np.repeat(self.tatkal[:, :, None], len(percents), axis=2) * tatkal
+            fare = base - discount + charges + surcharge
+            tax = fare * self.gst[None, :, None] // 100
+            return {'base': base, 'discount': discount, 'charges': charges,
+                    'tatkal': surcharge, 'tax': tax, 'total': fare + tax}
+
+        grids = {name: [] for name in ('base', 'discount', 'charges', 'tatkal', 'tax', 'total')}
+        for base_row, fixed_row, tatkal_row in zip(self.base, self.fixed, self.tatkal):
+            rows = {name: [] for name in grids}
+            for base, fixed, surcharge, gst in zip(base_row, fixed_row, tatkal_row, self.gst):
+                cells = {name: [] for name in grids}
+                for percent in percents:
+                    discount = base * percent // 100
+                    fare = base - discount + fixed + (surcharge if tatkal else 0)
+                    tax = fare * gst // 100
+                    for name, value in (('base', base), ('discount', discount), ('charges', fixed),
+                                        ('tatkal', surcharge if tatkal else 0), ('tax', tax),
+                                        ('total', fare + tax)):
+                        cells[name].append(value)
+                for name in grids:
+                    rows[name].append(cells[name])
+            for name in grids:
+                grids[name].append(rows[name])
+        return grids
+
+    def totals(self, passengers, quota='regular'):
+        """{route_id: {class: total fare for all passengers}} of the offered classes of a whole page"""
+        if not self.route_ids:
+            return {}
+        total = self.components(passengers, quota)['total']
+        if np is not None:
+            sums = total.sum(axis=2).tolist()
+        else:
+            sums = [[sum(cell) for cell in row] for row in total]
+        return {
+            route_id: {cls: _rupees(amount) for cls, amount in zip(self.classes, row) if cls in offered}
+            for route_id, row, offered in zip(self.route_ids, sums, self.offered)
+        }
+
+    def quote(self, route_id, seat_class, passengers, quota='regular'):
+        """Fare breakdown of one route and class, per passenger and summed, in rupees"""
+        grids = self.components(passengers, quota)
+        r, c = self.index[route_id], self.classes.index(seat_class)
+        lines = []
+        for p, passenger in enumerate(passengers):
+            line = {name: _rupees(grid[r][c][p]) for name, grid in grids.items()}
+            line.update(name=passenger.get('name'), age=passenger.get('age'),
+                        concession=concession(passenger, quota))
+            lines.append(line)
+        quote = {name: sum((line[name] for line in lines), Decimal(0)) for name in grids}
+        quote['passengers'] = lines
+        return quote
@@ -16,14 +16,18 @@ class TrainSearchForm(forms.Form):
         max_length=100,
         widget=forms.TextInput(attrs={
             'placeholder': 'Departure city',
-            'class': 'form-control'
+            'class': 'form-control',
+            'list': 'station-options',
+            'autocomplete': 'off'
         })
     )
     to_station = forms.CharField(
         max_length=100,
         widget=forms.TextInput(attrs={
             'placeholder': 'Destination city',
-            'class': 'form-control'
+            'class': 'form-control',
+            'list': 'station-options',
+            'autocomplete': 'off'
         })
     )
     travel_date = forms.DateField(
@@ -174,4 +178,19 @@ class TrainStatusForm(forms.Form):
                 ),
                 css_class='form-row'
             )
-        )
\ No newline at end of file
+        )
+
+class BookingFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        required=False,
+        choices=[('', 'All statuses')] + Booking.BOOKING_STATUS_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    travel_date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    travel_date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
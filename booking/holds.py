@@ -0,0 +1,178 @@
+"""Time-limited seat holds between payment and seat selection.
+
+Paying for a class grants a hold: seats for the whole party are claimed in
+the coach occupancy bitmaps straight away, so they stop counting as free
+everywhere (search results, the waitlist, other users' seat maps), and a
+SeatHold row per coach records the lease and when it runs out. When the
+booking is confirmed ``convert`` turns the hold into the booking's seats in
+the booking's transaction, swapping any seats the user picked instead. A
+hold past its expiry that has not been reaped yet still converts, since its
+seats are still set in the bitmaps. Paying again replaces the user's hold
+rather than adding a second one.
+
+Holds that were never converted are released in bulk by ``reap``: one
+indexed range scan over the expiry index per batch, one bitmap update per
+coach and one DELETE. It runs lazily, at most every
+``SEAT_HOLD_REAP_INTERVAL`` seconds, when holds are granted or seat maps
+are shown, and from the ``reap_seat_holds`` command for a cron job.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from railbooker.sqlite import retry_on_busy
+from . import inventory, waitlist
+from .models import SeatHold
+
+REAP_KEY = 'seat-holds:reaped'
+
+
+def _seconds():
+    return getattr(settings, 'SEAT_HOLD_SECONDS', 10 * 60)
+
+
+def _reap_interval():
+    return getattr(settings, 'SEAT_HOLD_REAP_INTERVAL', 30)
+
+
+@retry_on_busy
+def grant(user, train, travel_date, seat_class, count, replaces=None):
+    """Hold ``count`` seats of a class for a user; returns the hold's key
+
+    The user's hold under ``replaces``, if any, is released first in the
+    same transaction. Raises SeatUnavailable, keeping that hold, if the
+    class has fewer free seats.
+    """
+    reap_if_due()
+    expires_at = timezone.now() + timedelta(seconds=_seconds())
+    key = uuid.uuid4().hex
+    with transaction.atomic():
+        if replaces:
+            release(replaces, user)
+        allocated = inventory.allocate_seats(train, travel_date, seat_class, count)
+        if len(allocated) < count:
+            # Rolls the partial claim back
+            raise inventory.SeatUnavailable(f'Only {len(allocated)} seats are left in this class.')
+        by_coach = defaultdict(list)
+        for coach, number in allocated:
+            by_coach[coach].append(number)
+        SeatHold.objects.bulk_create([
+            SeatHold(
+                key=key,
+                user=user,
+                train=train,
+                travel_date=travel_date,
+                seat_class=seat_class,
+                coach=coach,
+                seats=','.join(numbers),
+                expires_at=expires_at
+            )
+            for coach, numbers in by_coach.items()
+        ])
+    return key
+
+
+def active(key, user):
+    """Unexpired rows of a user's hold, one per coach"""
+    if not key:
+        return SeatHold.objects.none()
+    return SeatHold.objects.filter(key=key, user=user, expires_at__gt=timezone.now()).order_by('coach')
+
+
+def held_seats(train, travel_date, seat_class, coach, key=None):
+    """(seats held by others, seats held under ``key``) in a coach, for its seat map"""
+    held, mine = set(), set()
+    rows = SeatHold.objects.filter(
+        train=train, travel_date=travel_date, seat_class=seat_class, coach=coach
+    ).values_list('key', 'seats')
+    for row_key, seats in rows:
+        (mine if key and row_key == key else held).update(seats.split(','))
+    return held, mine
+
+
+def convert(key, user, train, travel_date, seat_class, coach, selected_seats):
+    """Turn a hold into the given seats; call inside the booking's transaction
+
+    Held seats the user did not pick go back to the pool and picked seats
+    that were not held are claimed. Returns False, changing nothing, if the
+    hold has been released or does not exist.
+    """
+    if not key:
+        return False
+    # Expired rows too: until they are reaped their seats are still claimed
+    rows = list(SeatHold.objects.select_for_update().filter(
+        key=key, user=user, train=train, travel_date=travel_date, seat_class=seat_class
+    ))
+    if not rows:
+        return False
+    SeatHold.objects.filter(pk__in=[row.pk for row in rows]).delete()
+
+    held_in_coach = set()
+    for row in rows:
+        held = row.seat_numbers()
+        if row.coach == coach:
+            held_in_coach.update(held)
+        unused = [number for number in held if row.coach != coach or number not in selected_seats]
+        if unused:
+            inventory.release_seats(train, travel_date, seat_class, row.coach, unused)
+    picked = [number for number in selected_seats if number not in held_in_coach]
+    if picked:
+        inventory.claim_seats(train, travel_date, seat_class, coach, picked)
+    return True
+
+
+def _release_rows(rows):
+    """Delete hold rows and free their seats; call inside a transaction with the rows locked"""
+    SeatHold.objects.filter(pk__in=[row.pk for row in rows]).delete()
+
+    seats, trains = defaultdict(list), {}
+    for row in rows:
+        trains[row.train_id] = row.train
+        seats[row.train_id, row.travel_date, row.seat_class, row.coach].extend(row.seat_numbers())
+    for (train_id, travel_date, seat_class, coach), numbers in seats.items():
+        inventory.release_seats(trains[train_id], travel_date, seat_class, coach, numbers)
+    # Released seats go to anyone queued for them first
+    for train_id, travel_date, seat_class in {key[:3] for key in seats}:
+        waitlist.promote(trains[train_id], travel_date, seat_class)
+
+
+@retry_on_busy
+def release(key, user):
+    """Give up a user's hold, expired or not; returns the number of hold rows released"""
+    if not key:
+        return 0
+    with transaction.atomic():
+        rows = list(SeatHold.objects.select_for_update().select_related('train').filter(key=key, user=user))
+        if rows:
+            _release_rows(rows)
+    return len(rows)
+
+
+@retry_on_busy
+def reap(batch_size=500):
+    """Release every expired hold in batches; returns the number of hold rows released"""
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                SeatHold.objects.select_for_update().select_related('train')
+                .filter(expires_at__lte=timezone.now()).order_by('expires_at')[:batch_size]
+            )
+            if not rows:
+                break
+            _release_rows(rows)
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
+
+
+def reap_if_due():
+    """Reap unless another request did so in the last ``SEAT_HOLD_REAP_INTERVAL`` seconds"""
+    if cache.add(REAP_KEY, True, _reap_interval()):
+        reap()
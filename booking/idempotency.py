@@ -0,0 +1,59 @@
+"""Idempotency keys for booking confirmation.
+
+The payment step issues a key that the seat selection form posts back (a
+client may send its own in an ``Idempotency-Key`` header instead). The
+booking created for a key is recorded in the same transaction as the
+booking itself, under a unique (user, key) constraint, so a double submit
+or a retried request is answered with the original booking instead of
+writing a second one. Lookups go to the cache first and fall back to the
+IdempotencyKey table.
+"""
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import IdempotencyKey
+
+KEY = 'idempotency:{}:{}'
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+_VALID = re.compile(r'^[A-Za-z0-9_.:-]{8,64}$')
+
+
+def _timeout():
+    return getattr(settings, 'IDEMPOTENCY_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def from_request(request, default=None):
+    """The key sent with a request, from the header or the form, if it is well formed"""
+    key = request.headers.get(HEADER) or request.POST.get(FIELD) or default
+    return key if key and _VALID.match(key) else None
+
+
+def replayed(user, key):
+    """booking_id of the booking already created for this key, or None"""
+    booking_id = cache.get(KEY.format(user.pk, key))
+    if booking_id is None:
+        booking_id = IdempotencyKey.objects.filter(user=user, key=key).values_list(
+            'booking__booking_id', flat=True
+        ).first()
+        if booking_id is not None:
+            cache.set(KEY.format(user.pk, key), booking_id, _timeout())
+    return booking_id
+
+
+def remember(user, key, booking):
+    """Record the booking for a key; call inside the transaction that created it
+
+    Raises IntegrityError, rolling the transaction back, if another request
+    with the same key got there first.
+    """
+    IdempotencyKey.objects.create(user=user, key=key, booking=booking)
+    transaction.on_commit(lambda: cache.set(KEY.format(user.pk, key), booking.booking_id, _timeout()))
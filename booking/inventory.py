@@ -0,0 +1,289 @@
+"""Seat inventory backed by per-coach occupancy bitmaps.
+
+Every (train, travel date, class, coach) has a single ``SeatInventory`` row
+holding one bit per seat or berth, in the order of the coach's layout (see
+booking.layouts), so reading a seat map is one query and O(coach size)
+work. Seats are claimed with a compare-and-swap on ``version``: the
+UPDATE only succeeds if nobody else changed the coach since we read it, which
+keeps parallel bookings from handing out the same seat on any database.
+Every successful swap also moves the class's ClassSeatCount, which serves
+the availability calendar (booking.seat_calendar).
+"""
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import layouts, seat_calendar, seat_maps
+from .models import SeatInventory, TrainClass
+
+# Coach prefix of a class; classes added later default to their first letter
+COACH_PREFIXES = {
+    '1st-ac': 'H',
+    '2nd-ac': 'A',
+    '3rd-ac': 'B',
+    'sleeper': 'S',
+    'general': 'D',
+}
+
+MAX_CLAIM_ATTEMPTS = 5
+
+
+class SeatUnavailable(Exception):
+    """Raised when a requested seat does not exist or is already taken"""
+
+
+def seat_type(seat_class, seat_number):
+    """Type of a seat or berth, e.g. 'window' or 'side-lower'
+
+    Chair car numbers ('3C') of coaches opened before berth layouts are told
+    apart from berth numbers ('12') by their form.
+    """
+    layout = layouts.for_class(seat_class)
+    if seat_number not in layout.index:
+        layout = layouts.get(layouts.DEFAULT_LAYOUT)
+    return layout.seat_type(seat_number) if seat_number in layout.index else 'middle'
+
+
+def coach_prefix(seat_class):
+    return COACH_PREFIXES.get(seat_class) or seat_class[:1].upper()
+
+
+def capacities(train):
+    """{seat_class: seats} of a train, read once per instance (or from a prefetch of classes)"""
+    if not hasattr(train, '_class_seats'):
+        train._class_seats = {row.seat_class: row.seats for row in train.classes.all()}
+    return train._class_seats
+
+
+def class_capacity(train, seat_class):
+    return capacities(train).get(seat_class, 0)
+
+
+def _run_coaches(train, travel_date, seat_class):
+    """[(coach, capacity, layout), ...] of a class on a train run, or on a run not yet opened
+
+    Coaches are opened one at a time as they are first used, in the layout
+    of the class at that moment. A run with open coaches keeps their layout
+    for the rest, so its coach numbers and capacities never change under
+    the seats already booked in them.
+    """
+    opened = {}
+    if travel_date is not None:
+        rows = SeatInventory.objects.filter(
+            train=train, travel_date=travel_date, seat_class=seat_class
+        ).values_list('coach', 'capacity', 'layout')
+        opened = {coach: (capacity, layout) for coach, capacity, layout in rows}
+    name = next(iter(opened.values()))[1] if opened else layouts.layout_name(seat_class)
+    prefix = coach_prefix(seat_class)
+    remaining = class_capacity(train, seat_class)
+    per_coach = layouts.get(name).capacity
+    coaches = []
+    while remaining > 0:
+        coach = f'{prefix}{len(coaches) + 1}'
+        capacity, layout = opened.pop(coach, (min(remaining, per_coach), name))
+        coaches.append((coach, capacity, layout))
+        remaining -= capacity
+    # Coaches of a class whose capacity has shrunk since the run was opened
+    coaches.extend((coach, capacity, layout) for coach, (capacity, layout) in sorted(opened.items()))
+    return coaches
+
+
+def coaches_for(train, seat_class, travel_date=None):
+    """Return [(coach, capacity), ...] for the coaches of a class, on the run of ``travel_date`` if given"""
+    return [(coach, capacity) for coach, capacity, _ in _run_coaches(train, travel_date, seat_class)]
+
+
+def get_inventory(train, travel_date, seat_class, coach):
+    """Fetch the occupancy record of a coach, creating an empty one on first use"""
+    coach_filter = {'train': train, 'travel_date': travel_date, 'seat_class': seat_class, 'coach': coach}
+    inventory = SeatInventory.objects.filter(**coach_filter).first()
+    if inventory is not None:
+        return inventory
+    coaches = {name: (capacity, layout) for name, capacity, layout in _run_coaches(train, travel_date, seat_class)}
+    if coach not in coaches:
+        raise SeatUnavailable(f'Coach {coach} is not part of this train.')
+    capacity, layout = coaches[coach]
+    inventory, _ = SeatInventory.objects.get_or_create(
+        **coach_filter,
+        defaults={
+            'capacity': capacity,
+            'occupancy': bytes((capacity + 7) // 8),
+            'layout': layout,
+        }
+    )
+    return inventory
+
+
+def _is_set(bitmap, index):
+    return bitmap[index >> 3] & (1 << (index & 7))
+
+
+def taken(inventory):
+    """Bit indexes of the taken places of a coach"""
+    bitmap = bytes(inventory.occupancy)
+    return [index for index in range(inventory.capacity) if _is_set(bitmap, index)]
+
+
+def seat_map(inventory, held=(), mine=()):
+    """Build the seat layout of a coach from its bitmap, as rows of seats with None for the aisle
+
+    Taken seats listed in ``held`` (on hold for someone else) or ``mine``
+    (on hold for this user, shown selected) are told apart from booked ones.
+    """
+    layout = layouts.get(inventory.layout)
+    bitmap = bytes(inventory.occupancy)
+    rows = []
+    for cells in layout.rows:
+        row = []
+        for index in cells:
+            if index is None:
+                row.append(None)
+                continue
+            if index >= inventory.capacity:
+                continue
+            number, kind = layout.seats[index]
+            status = 'available'
+            if _is_set(bitmap, index):
+                status = 'selected' if number in mine else 'held' if number in held else 'occupied'
+            row.append({'id': number, 'number': number, 'index': index, 'type': kind, 'status': status})
+        if any(row):
+            rows.append(row)
+    return rows
+
+
+def _swap(train, travel_date, seat_class, coach, seat_numbers, occupied):
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        inventory = get_inventory(train, travel_date, seat_class, coach)
+        layout = layouts.get(inventory.layout)
+        bitmap = bytearray(inventory.occupancy)
+        flipped = []
+        for number in dict.fromkeys(seat_numbers):
+            index = layout.index.get(number)
+            if index is None or index >= inventory.capacity:
+                raise SeatUnavailable(f'Seat {number} does not exist in coach {coach}.')
+            if bool(_is_set(bitmap, index)) == occupied:
+                if occupied:
+                    raise SeatUnavailable(f'Seat {number} in coach {coach} is already booked.')
+                continue
+            bitmap[index >> 3] ^= 1 << (index & 7)
+            flipped.append(index)
+        if not flipped:
+            return inventory.version
+        booked_count = sum(bin(byte).count('1') for byte in bitmap)
+        updated = SeatInventory.objects.filter(
+            pk=inventory.pk, version=inventory.version
+        ).update(
+            occupancy=bytes(bitmap),
+            booked_count=booked_count,
+            version=inventory.version + 1,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            version = inventory.version + 1
+            # The availability calendar's per-class count moves with the bitmap
+            seat_calendar.record(train, travel_date, seat_class, len(flipped) if occupied else -len(flipped))
+            # Seat map clients pick the change up once it is committed
+            transaction.on_commit(partial(
+                seat_maps.publish, inventory, version, flipped if occupied else [], [] if occupied else flipped
+            ))
+            return version
+    raise SeatUnavailable('Seats are being booked heavily right now. Please try again.')
+
+
+def claim_seats(train, travel_date, seat_class, coach, seat_numbers):
+    """Mark seats as booked, failing if any of them is already taken"""
+    return _swap(train, travel_date, seat_class, coach, seat_numbers, occupied=True)
+
+
+def release_seats(train, travel_date, seat_class, coach, seat_numbers):
+    """Return seats to the pool; releasing a free seat is a no-op"""
+    return _swap(train, travel_date, seat_class, coach, seat_numbers, occupied=False)
+
+
+def allocate_seats(train, travel_date, seat_class, count):
+    """Claim up to ``count`` free seats of a class, filling coaches in order
+
+    Returns [(coach, seat_number), ...], shorter than ``count`` if the class
+    runs out of seats.
+    """
+    allocated = []
+    for coach, _ in coaches_for(train, seat_class, travel_date):
+        for _ in range(MAX_CLAIM_ATTEMPTS):
+            wanted = count - len(allocated)
+            if not wanted:
+                return allocated
+            inventory = get_inventory(train, travel_date, seat_class, coach)
+            layout = layouts.get(inventory.layout)
+            bitmap = bytes(inventory.occupancy)
+            free = [
+                layout.seats[index][0] for index in range(inventory.capacity) if not _is_set(bitmap, index)
+            ][:wanted]
+            if not free:
+                break
+            try:
+                claim_seats(train, travel_date, seat_class, coach, free)
+            except SeatUnavailable:
+                # Another booking took one of them first; look at the coach again
+                continue
+            allocated.extend((coach, number) for number in free)
+            break
+    return allocated
+
+
+def release_booking(booking):
+    """Free every seat held by a booking"""
+    by_coach = defaultdict(list)
+    for seat in booking.seats.all():
+        by_coach[seat.coach].append(seat.seat_number)
+    for coach, seat_numbers in by_coach.items():
+        release_seats(booking.train, booking.travel_date, booking.seat_class, coach, seat_numbers)
+
+
+def free_seats(travel_date, seat_class=None):
+    """TrainClass rows annotated with the seats still free on a date
+
+    Filtering the result on ``free`` answers "trains with at least N free
+    seats in a class" with one query. No index serves that filter, as
+    ``free`` is computed per row: the (seat_class, seats) index on TrainClass
+    narrows the rows to a class, and each row then sums its coaches through
+    the unique index on SeatInventory.
+    """
+    booked = SeatInventory.objects.filter(
+        train=OuterRef('train'), travel_date=travel_date, seat_class=OuterRef('seat_class')
+    ).order_by().values('train').annotate(total=Sum('booked_count')).values('total')
+    rows = TrainClass.objects.all()
+    if seat_class:
+        rows = rows.filter(seat_class=seat_class)
+    return rows.annotate(
+        free=F('seats') - Coalesce(Subquery(booked, output_field=IntegerField()), Value(0))
+    )
+
+
+def _seats_left_rows(trains, travel_date):
+    return free_seats(travel_date).filter(train__in=trains).values_list('train_id', 'seat_class', 'free')
+
+
+def class_free_seats(train, travel_date, seat_class):
+    """Free seats of one class on a train run, 0 if the class is not offered"""
+    free = free_seats(travel_date, seat_class).filter(train=train).values_list('free', flat=True).first()
+    return free or 0
+
+
+def seats_left(trains, travel_date):
+    """Return {train_id: {seat_class: free seats}} for the classes the trains offer, in one query"""
+    left = {train.id: {} for train in trains}
+    for train_id, seat_class, free in _seats_left_rows(trains, travel_date):
+        left[train_id][seat_class] = free
+    return left
+
+
+async def aseats_left(trains, travel_date):
+    """seats_left for async views"""
+    left = {train.id: {} for train in trains}
+    async for train_id, seat_class, free in _seats_left_rows(trains, travel_date):
+        left[train_id][seat_class] = free
+    return left
@@ -0,0 +1,106 @@
+"""Coach layouts: the seats or berths of a coach of each class.
+
+A layout lists a coach's places in bitmap order, so bit ``i`` of a
+SeatInventory row is ``layout.seats[i]``, and arranges them in rows (a
+chair car row or a sleeper bay) with ``None`` marking the aisle. Layouts
+are built from ``LAYOUTS`` once per process and cached along with their
+JSON form and its ETag, so serving one costs nothing after the first time.
+
+Every SeatInventory row records the layout it was created with. Coaches
+opened before berth layouts existed keep the chair car numbering ('1A' to
+'5F') of the ``chair`` layout.
+"""
+import hashlib
+import json
+from functools import lru_cache
+
+CHAIR_LETTERS = 'ABCDEF'
+CHAIR_TYPES = {'A': 'window', 'B': 'middle', 'C': 'aisle', 'D': 'aisle', 'E': 'middle', 'F': 'window'}
+
+# Berths of one bay, aisle side first, then the two side berths across the aisle
+BERTH_TYPES = {
+    'LB': 'lower', 'MB': 'middle', 'UB': 'upper', 'SL': 'side-lower', 'SU': 'side-upper',
+}
+LAYOUTS = {
+    # Chair car: rows of 3 + 3 seats numbered by row and letter
+    'chair': {'label': 'Chair car', 'rows': 5},
+    'first_ac': {'label': 'AC First Class', 'bays': 6, 'bay': ['LB', 'UB', 'LB', 'UB'], 'side': []},
+    'two_tier': {'label': 'AC 2 Tier', 'bays': 8, 'bay': ['LB', 'UB', 'LB', 'UB'], 'side': ['SL', 'SU']},
+    'three_tier': {'label': '3 Tier', 'bays': 9, 'bay': ['LB', 'MB', 'UB', 'LB', 'MB', 'UB'], 'side': ['SL', 'SU']},
+}
+CLASS_LAYOUTS = {
+    '1st-ac': 'first_ac',
+    '2nd-ac': 'two_tier',
+    '3rd-ac': 'three_tier',
+    'sleeper': 'three_tier',
+    'general': 'chair',
+}
+DEFAULT_LAYOUT = 'chair'
+
+
+class CoachLayout:
+    def __init__(self, name, label, seats, rows):
+        self.name = name
+        self.label = label
+        # [(number, type)] in bitmap order
+        self.seats = seats
+        self.rows = rows
+        self.capacity = len(seats)
+        self.index = {number: i for i, (number, _) in enumerate(seats)}
+        self.payload = {
+            'name': name,
+            'label': label,
+            'capacity': self.capacity,
+            'seats': [{'number': number, 'type': seat_type} for number, seat_type in seats],
+            'rows': rows,
+        }
+        self.json = json.dumps(self.payload, separators=(',', ':'))
+        self.etag = '"%s"' % hashlib.md5(self.json.encode()).hexdigest()
+
+    def seat_type(self, number):
+        return self.seats[self.index[number]][1]
+
+
+def _chair(name, spec):
+    seats, rows = [], []
+    for row in range(1, spec['rows'] + 1):
+        cells = []
+        for position, letter in enumerate(CHAIR_LETTERS):
+            if position == len(CHAIR_LETTERS) // 2:
+                cells.append(None)
+            cells.append(len(seats))
+            seats.append((f'{row}{letter}', CHAIR_TYPES[letter]))
+        rows.append(cells)
+    return CoachLayout(name, spec['label'], seats, rows)
+
+
+def _berths(name, spec):
+    seats, rows = [], []
+    for _ in range(spec['bays']):
+        cells = []
+        for berth in spec['bay']:
+            cells.append(len(seats))
+            seats.append((str(len(seats) + 1), BERTH_TYPES[berth]))
+        if spec['side']:
+            cells.append(None)
+        for berth in spec['side']:
+            cells.append(len(seats))
+            seats.append((str(len(seats) + 1), BERTH_TYPES[berth]))
+        rows.append(cells)
+    return CoachLayout(name, spec['label'], seats, rows)
+
+
+@lru_cache(maxsize=None)
+def get(name):
+    """The layout called ``name``, built on first use"""
+    spec = LAYOUTS[name]
+    return _berths(name, spec) if 'bays' in spec else _chair(name, spec)
+
+
+def layout_name(seat_class):
+    return CLASS_LAYOUTS.get(seat_class, DEFAULT_LAYOUT)
+
+
+def for_class(seat_class):
+    """Layout of the coaches a class opens from now on"""
+    return get(layout_name(seat_class))
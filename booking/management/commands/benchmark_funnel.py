@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from booking import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the booking funnel end to end against a seeded throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trains', type=int, default=50)
+        parser.add_argument('--routes-per-train', type=int, default=4)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--bookings-per-user', type=int, default=0,
+                            help='Booking history to seed for every user')
+        parser.add_argument('--iterations', type=int, default=20, help='Funnels per worker')
+        parser.add_argument('--concurrency', type=int, default=1, help='Parallel workers')
+        parser.add_argument('--passengers', type=int, default=2, choices=range(1, 7))
+        parser.add_argument('--seat-class', default='general')
+        parser.add_argument('--output', help='Write the JSON results to this file')
+        parser.add_argument('--baseline', help='Compare against a JSON file from an earlier run')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        test_dir = tempfile.mkdtemp(prefix='railbooker-bench-')
+        if connection.vendor == 'sqlite':
+            # A file, not the shared in-memory database, so workers get real connections
+            connection.settings_dict['TEST']['NAME'] = os.path.join(test_dir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for cache in caches.all():
+                cache.clear()
+            benchmark.seed(
+                trains=options['trains'],
+                routes_per_train=options['routes_per_train'],
+                users=max(options['users'], options['concurrency']),
+                bookings_per_user=options['bookings_per_user'],
+            )
+            result = benchmark.run(
+                iterations=options['iterations'],
+                concurrency=options['concurrency'],
+                passengers=options['passengers'],
+                seat_class=options['seat_class'],
+            )
+            result['dataset'] = {
+                key: options[key] for key in ('trains', 'routes_per_train', 'users', 'bookings_per_user')
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(result)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmark.compare(result, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}.')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def report(self, result):
+        header = f"{'step':<18}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'max q':>7}{'read':>8}{'written':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, step in result['steps'].items():
+            self.stdout.write(
+                f"{name:<18}{step['count']:>6}{step['errors']:>5}{step['p50_ms']:>10.2f}{step['p95_ms']:>10.2f}"
+                f"{step['p99_ms']:>10.2f}{step['mean_queries']:>9.1f}{step['max_queries']:>7}"
+                f"{step['mean_rows_read']:>8.1f}{step['mean_rows_written']:>9.1f}"
+            )
+        self.stdout.write(
+            f"{result['funnels_per_second']} funnels/s over {result['wall_seconds']}s"
+        )
+        for failure in result['failures']:
+            self.stderr.write(failure)
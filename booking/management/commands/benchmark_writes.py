@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from booking import write_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Book from several processes at once against a throwaway SQLite file, with and without the concurrency profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Writer processes')
+        parser.add_argument('--bookings', type=int, default=100, help='Bookings per worker')
+        parser.add_argument('--profile', choices=sorted(write_benchmark.PROFILES), action='append',
+                            help='Profile to run; may be repeated (default: all)')
+        parser.add_argument('--output', help='Write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The write benchmark only applies to SQLite databases.')
+        profiles = options['profile'] or ['default', 'concurrent']
+
+        test_dir = tempfile.mkdtemp(prefix='railbooker-writes-')
+        seeded = os.path.join(test_dir, 'seed.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = seeded
+        results = []
+        try:
+            with override_settings(SQLITE_CONCURRENCY=False):
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                write_benchmark.seed(options['workers'])
+                for profile in profiles:
+                    # Each profile starts from the same rows in a fresh copy of the file
+                    db_name = os.path.join(test_dir, f'{profile}.sqlite3')
+                    shutil.copyfile(seeded, db_name)
+                    results.append(write_benchmark.run(db_name, profile, options['workers'], options['bookings']))
+                    self.report(results[-1])
+            finally:
+                connection.close()
+                connection.settings_dict['NAME'] = old_name
+        finally:
+            shutil.rmtree(test_dir, ignore_errors=True)
+
+        by_profile = {result['profile']: result for result in results}
+        if {'default', 'concurrent'} <= set(by_profile) and by_profile['default']['bookings_per_second']:
+            gain = by_profile['concurrent']['bookings_per_second'] / by_profile['default']['bookings_per_second']
+            self.stdout.write(self.style.SUCCESS(f'Concurrent profile: {gain:.1f}x the default throughput.'))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['profile']:<11} {result['workers']} workers: {result['booked']} booked, "
+            f"{result['locked_errors']} locked, {result['other_errors']} other errors in {result['wall_seconds']}s "
+            f"({result['bookings_per_second']} bookings/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms)"
+        )
@@ -0,0 +1,35 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from booking.models import Train
+from booking import services
+
+
+class Command(BaseCommand):
+    help = 'Cancel and refund every booking of a train on a travel date; safe to rerun after an interruption'
+
+    def add_arguments(self, parser):
+        parser.add_argument('train', help='Train number')
+        parser.add_argument('travel_date', type=date.fromisoformat, help='Travel date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            train = Train.objects.get(number=options['train'])
+        except Train.DoesNotExist:
+            raise CommandError(f"Train {options['train']} does not exist.")
+
+        started = time.perf_counter()
+        progress = {'total': 0, 'cancelled': 0, 'refunded': 0}
+        for progress in services.cancel_train_run(train, options['travel_date'], options['batch_size']):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{progress['cancelled']}/{progress['total']} cancelled, {progress['refunded']} refunded "
+                f"(up to booking #{progress['last_id']}, {progress['cancelled'] / max(elapsed, 0.001):.0f}/s)"
+            )
+            self.stdout.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"Cancelled {progress['cancelled']} bookings of {train.number} on {options['travel_date']} "
+            f"and refunded {progress['refunded']} payments in {time.perf_counter() - started:.2f}s."
+        ))
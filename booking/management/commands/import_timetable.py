@@ -0,0 +1,49 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from booking.timetable_import import TimetableError, TimetableImporter
+from railbooker import caches
+
+
+class Command(BaseCommand):
+    help = 'Stream a timetable (flat CSV file or GTFS-like directory) into trains and routes, writing only changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, or directory with trains.txt and stop_times.txt')
+        parser.add_argument('--format', choices=['csv', 'gtfs'],
+                            help='Defaults to gtfs for a directory and csv otherwise')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Routes written per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        layout = options['format'] or ('gtfs' if os.path.isdir(path) else 'csv')
+        importer = TimetableImporter(chunk_size=options['chunk_size'], progress=self.progress)
+        try:
+            if layout == 'gtfs':
+                stats = importer.import_gtfs(path)
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    stats = importer.import_csv(f)
+        except (OSError, TimetableError) as e:
+            raise CommandError(str(e))
+
+        for error in stats.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {stats.rows} rows in {stats.elapsed:.2f}s ({stats.rows_per_second:.0f} rows/s): '
+            f'{stats.trains_written} trains, {stats.routes_written} routes and '
+            f'{stats.classes_written} classes/fares written, '
+            f'{stats.unchanged} unchanged, {stats.rejected} rejected.'
+        ))
+        if stats.changed_trains and not caches.is_shared():
+            self.stderr.write(self.style.WARNING(
+                'CACHE_URL is a per-process cache, so running servers will not see the new timetable '
+                'until they restart.'
+            ))
+
+    def progress(self, stats):
+        self.stdout.write(
+            f'{stats.rows} rows, {stats.trains_written + stats.routes_written + stats.classes_written} written, '
+            f'{stats.unchanged} unchanged ({stats.rows_per_second:.0f} rows/s)'
+        )
+        self.stdout.flush()
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from booking.models import Train, TrainClass, Route, RouteFare
+from booking import search_cache
+
+# Legacy per-class columns of booking_train and booking_route
+SEAT_COLUMNS = {
+    '1st-ac': 'first_ac_seats', '2nd-ac': 'second_ac_seats', '3rd-ac': 'third_ac_seats',
+    'sleeper': 'sleeper_seats', 'general': 'general_seats',
+}
+PRICE_COLUMNS = {
+    '1st-ac': 'first_ac_price', '2nd-ac': 'second_ac_price', '3rd-ac': 'third_ac_price',
+    'sleeper': 'sleeper_price', 'general': 'general_price',
+}
+
+
+class Command(BaseCommand):
+    help = ('Copy the per-class seat and price columns of trains and routes into the TrainClass '
+            'and RouteFare tables, then drop them; safe to rerun')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-columns', action='store_true',
+                            help='Copy the data but leave the legacy columns in place')
+
+    def handle(self, *args, **options):
+        tables = [
+            (Train, TrainClass, 'train', 'seats', SEAT_COLUMNS),
+            (Route, RouteFare, 'route', 'price', PRICE_COLUMNS),
+        ]
+        copied = 0
+        with transaction.atomic():
+            for model, target, parent, value, columns in tables:
+                for seat_class, column in self.legacy_columns(model, columns).items():
+                    copied += self.copy(model, target, parent, value, seat_class, column)
+        if copied:
+            search_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Copied {copied} class rows.'))
+
+        if options['keep_columns']:
+            return
+        # Outside the copy's transaction: SQLite cannot alter tables inside one
+        for model, _, _, _, columns in tables:
+            legacy = self.legacy_columns(model, columns)
+            if legacy:
+                self.drop(model, legacy.values())
+                self.stdout.write(f"Dropped {', '.join(legacy.values())} from {model._meta.db_table}.")
+
+    def legacy_columns(self, model, columns):
+        with connection.cursor() as cursor:
+            present = {column.name for column in connection.introspection.get_table_description(
+                cursor, model._meta.db_table
+            )}
+        return {seat_class: column for seat_class, column in columns.items() if column in present}
+
+    def copy(self, model, target, parent, value, seat_class, column):
+        """One INSERT ... SELECT per class, skipping classes not offered and rows already copied"""
+        qn = connection.ops.quote_name
+        source, table = qn(model._meta.db_table), qn(target._meta.db_table)
+        parent_column = qn(target._meta.get_field(parent).column)
+        # Other columns (RAC berths, waitlist limit) get their model defaults
+        defaults = {
+            field.column: field.get_default() for field in target._meta.concrete_fields
+            if field.has_default() and field.name not in ('id', parent, 'seat_class', value)
+        }
+        extra_columns = ''.join(f', {qn(name)}' for name in defaults)
+        extra_values = ', %s' * len(defaults)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({parent_column}, {qn("seat_class")}, {qn(value)}{extra_columns}) '
+                f'SELECT s.{qn("id")}, %s, s.{qn(column)}{extra_values} FROM {source} s '
+                f'WHERE s.{qn(column)} > 0 AND NOT EXISTS ('
+                f'SELECT 1 FROM {table} t WHERE t.{parent_column} = s.{qn("id")} AND t.{qn("seat_class")} = %s)',
+                [seat_class, *defaults.values(), seat_class],
+            )
+            return cursor.rowcount
+
+    def drop(self, model, columns):
+        with connection.schema_editor() as editor:
+            for column in columns:
+                field = models.IntegerField(null=True)
+                field.set_attributes_from_name(column)
+                field.model = model
+                editor.remove_field(model, field)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from booking import holds
+
+
+class Command(BaseCommand):
+    help = 'Release the seats of expired seat holds; run every minute or so from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = holds.reap(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired seat holds.'))
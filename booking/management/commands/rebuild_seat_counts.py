@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from booking import seat_calendar
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-class seat counts of the availability calendar from the coach seat maps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = seat_calendar.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} class seat counts.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from booking.models import Route
+from booking import stations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the station codes of every route after bulk station changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        stations.invalidate_index()
+        batch_size = options['batch_size']
+        batch = []
+        updated = 0
+        for route in Route.objects.only('id', 'from_station', 'to_station', 'from_code', 'to_code').iterator(chunk_size=batch_size):
+            from_code = stations.station_code(route.from_station)
+            to_code = stations.station_code(route.to_station)
+            if (from_code, to_code) != (route.from_code, route.to_code):
+                route.from_code, route.to_code = from_code, to_code
+                batch.append(route)
+            if len(batch) >= batch_size:
+                Route.objects.bulk_update(batch, ['from_code', 'to_code'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            Route.objects.bulk_update(batch, ['from_code', 'to_code'])
+            updated += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Re-coded {updated} routes.'))
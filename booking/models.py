@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 
@@ -10,31 +11,88 @@ class Train(models.Model):
     arrival_time = models.TimeField()
     duration = models.CharField(max_length=10)
     
-    # Seat availability
-    first_ac_seats = models.IntegerField(default=0)
-    second_ac_seats = models.IntegerField(default=0)
-    third_ac_seats = models.IntegerField(default=0)
-    sleeper_seats = models.IntegerField(default=0)
-    general_seats = models.IntegerField(default=0)
-    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.name} ({self.number})"
 
+class SeatClass(models.Model):
+    """A class of travel trains can offer; see booking.seat_classes"""
+    code = models.CharField(max_length=10, unique=True)
+    name = models.CharField(max_length=50)
+    position = models.PositiveSmallIntegerField(default=0, help_text="Order in listings")
+    
+    class Meta:
+        ordering = ['position', 'code']
+    
+    def __str__(self):
+        return self.name
+
+def validate_seat_class(value):
+    from .seat_classes import codes
+    if value not in codes():
+        raise ValidationError(f"Unknown seat class {value!r}.")
+
+class Station(models.Model):
+    code = models.CharField(max_length=10, unique=True)
+    name = models.CharField(max_length=100)
+    
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+
+class StationAlias(models.Model):
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='aliases')
+    alias = models.CharField(max_length=100, unique=True, help_text="Stored in normalized form")
+    
+    def save(self, *args, **kwargs):
+        from .stations import normalize
+        self.alias = normalize(self.alias)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.alias} -> {self.station.code}"
+
 class Route(models.Model):
     train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='routes')
     from_station = models.CharField(max_length=100)
     to_station = models.CharField(max_length=100)
+    
+    # Resolved station codes, filled in on save and used for lookups
+    from_code = models.CharField(max_length=100, blank=True, editable=False)
+    to_code = models.CharField(max_length=100, blank=True, editable=False)
+    
     distance = models.IntegerField(help_text="Distance in kilometers")
     
-    # Pricing for different classes
-    first_ac_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
-    second_ac_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
-    third_ac_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
-    sleeper_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
-    general_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    # Times at the two stops; blank means the train's own departure and arrival
+    departure_time = models.TimeField(null=True, blank=True)
+    arrival_time = models.TimeField(null=True, blank=True)
+    
+    # Cleared when the route drops out of the timetable; kept for its bookings
+    active = models.BooleanField(default=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_code', 'to_code'], name='route_station_pair_idx'),
+            models.Index(fields=['to_code'], name='route_to_code_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['train', 'from_station', 'to_station'], name='unique_train_route'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        from .stations import station_code
+        self.from_code = station_code(self.from_station)
+        self.to_code = station_code(self.to_station)
+        super().save(*args, **kwargs)
+    
+    @property
+    def departs(self):
+        return self.departure_time or self.train.departure_time
+    
+    @property
+    def arrives(self):
+        return self.arrival_time or self.train.arrival_time
     
     def __str__(self):
         return f"{self.from_station} to {self.to_station}"
@@ -58,9 +116,14 @@ class Booking(models.Model):
     BOOKING_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
+        ('rac', 'RAC'),
+        ('waitlisted', 'Waitlisted'),
         ('cancelled', 'Cancelled'),
     ]
+    # Bookings waiting for seats, RAC ones first; see booking.waitlist
+    QUEUED_STATUSES = ['rac', 'waitlisted']
     
+    # The catalogue a new database starts with; classes live in SeatClass
     SEAT_CLASS_CHOICES = [
         ('1st-ac', '1st AC'),
         ('2nd-ac', '2nd AC'),
@@ -82,20 +145,40 @@ class Booking(models.Model):
     passengers = models.ManyToManyField(Passenger)
     
     travel_date = models.DateField()
-    seat_class = models.CharField(max_length=10, choices=SEAT_CLASS_CHOICES)
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
     booking_type = models.CharField(max_length=10, choices=BOOKING_TYPE_CHOICES, default='regular')
     
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=BOOKING_STATUS_CHOICES, default='pending')
+    party_size = models.PositiveSmallIntegerField(default=1, help_text="Passengers on the booking")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's bookings, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='booking_user_recent_idx'),
+            # Every booking of one train run, for bulk cancellation
+            models.Index(fields=['train', 'travel_date'], name='booking_train_run_idx'),
+            # The RAC and waitlist queues of a train run and class in booking order;
+            # covers the head reads of booking.waitlist
+            models.Index(
+                fields=['train', 'travel_date', 'seat_class', 'status', 'id', 'party_size'],
+                name='booking_waitlist_idx',
+            ),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.pnr:
-            self.pnr = f"PNR{uuid.uuid4().hex[:6].upper()}"
+            self.pnr = f"PNR{uuid.uuid4().hex[:7].upper()}"
         super().save(*args, **kwargs)
     
+    @property
+    def seat_class_label(self):
+        from .seat_classes import label
+        return label(self.seat_class)
+    
     def __str__(self):
         return f"Booking {self.booking_id} - {self.pnr}"
 
@@ -104,6 +187,10 @@ class Seat(models.Model):
         ('window', 'Window'),
         ('middle', 'Middle'),
         ('aisle', 'Aisle'),
+        ('lower', 'Lower'),
+        ('upper', 'Upper'),
+        ('side-lower', 'Side Lower'),
+        ('side-upper', 'Side Upper'),
     ]
     
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='seats')
@@ -115,6 +202,177 @@ class Seat(models.Model):
     def __str__(self):
         return f"Seat {self.seat_number} - Coach {self.coach}"
 
+class TrainClass(models.Model):
+    """Seats a train carries in one class on every run; a class without a row is not offered"""
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='classes')
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
+    seats = models.PositiveIntegerField()
+    rac_berths = models.PositiveIntegerField(default=0, help_text="Berths shared by two RAC passengers")
+    waitlist_limit = models.PositiveIntegerField(default=100, help_text="Waitlisted passengers accepted")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['train', 'seat_class'], name='unique_train_class'),
+        ]
+        indexes = [
+            # Trains offering a class with at least N seats
+            models.Index(fields=['seat_class', 'seats'], name='train_class_seats_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.train.number} {self.seat_class}: {self.seats}"
+
+class RouteFare(models.Model):
+    """Base fare of one class on a route"""
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='fares')
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
+    price = models.DecimalField(max_digits=8, decimal_places=2)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'seat_class'], name='unique_route_fare'),
+        ]
+    
+    def __str__(self):
+        return f"{self.route} {self.seat_class}: {self.price}"
+
+class SeatInventory(models.Model):
+    """Occupancy of one coach for one train run, one bit per seat"""
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='inventories')
+    travel_date = models.DateField()
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
+    coach = models.CharField(max_length=10)
+
+    capacity = models.PositiveSmallIntegerField()
+    # booking.layouts layout the bits follow; older coaches are chair cars
+    layout = models.CharField(max_length=20, default='chair')
+    occupancy = models.BinaryField()
+    booked_count = models.PositiveSmallIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['train', 'travel_date', 'seat_class', 'coach'],
+                name='unique_seat_inventory',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.train.number} {self.travel_date} {self.seat_class} {self.coach}"
+
+class ClassSeatCount(models.Model):
+    """Seats taken in a class of a train run, the sum of its coaches' booked_count, and its queue lengths
+
+    See booking.seat_calendar.
+    """
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='seat_counts')
+    travel_date = models.DateField()
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
+    booked = models.PositiveIntegerField(default=0)
+    rac = models.PositiveIntegerField(default=0, help_text="Passengers in RAC")
+    waitlisted = models.PositiveIntegerField(default=0, help_text="Passengers on the waitlist")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Also serves a calendar's range scan over (train, travel_date)
+            models.UniqueConstraint(
+                fields=['train', 'travel_date', 'seat_class'],
+                name='unique_class_seat_count',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.train.number} {self.travel_date} {self.seat_class}: {self.booked}"
+
+class SeatHold(models.Model):
+    """Seats of one coach leased to a user between payment and seat selection, see booking.holds"""
+    key = models.CharField(max_length=32, help_text="Shared by the coaches of one hold")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seat_holds')
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='seat_holds')
+    travel_date = models.DateField()
+    seat_class = models.CharField(max_length=10, validators=[validate_seat_class])
+    coach = models.CharField(max_length=10)
+    seats = models.CharField(max_length=200, help_text="Comma separated seat numbers")
+    expires_at = models.DateTimeField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['key'], name='seat_hold_key_idx'),
+            # Holds due for release, oldest first
+            models.Index(fields=['expires_at'], name='seat_hold_expiry_idx'),
+            # Held seats of a coach for its seat map
+            models.Index(fields=['train', 'travel_date', 'seat_class', 'coach'], name='seat_hold_coach_idx'),
+        ]
+    
+    def seat_numbers(self):
+        return self.seats.split(',')
+    
+    def __str__(self):
+        return f"{self.key} {self.coach} {self.seats} until {self.expires_at}"
+
+class TrainRun(models.Model):
+    """One day's journey of a train, the unit live running status is reported for"""
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='runs')
+    run_date = models.DateField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['train', 'run_date'], name='unique_train_run'),
+        ]
+    
+    def __str__(self):
+        return f"{self.train.number} on {self.run_date}"
+
+class StationEvent(models.Model):
+    """Schedule and reported arrival/departure of a train run at one stop"""
+    run = models.ForeignKey(TrainRun, on_delete=models.CASCADE, related_name='events')
+    sequence = models.PositiveSmallIntegerField()
+    station_code = models.CharField(max_length=10)
+    station_name = models.CharField(max_length=100, blank=True)
+    distance = models.IntegerField(default=0, help_text="Distance from origin in kilometers")
+    
+    scheduled_arrival = models.TimeField(null=True, blank=True)
+    scheduled_departure = models.TimeField(null=True, blank=True)
+    actual_arrival = models.DateTimeField(null=True, blank=True)
+    actual_departure = models.DateTimeField(null=True, blank=True)
+    delay_minutes = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['run', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'sequence'], name='unique_run_stop'),
+        ]
+    
+    def __str__(self):
+        return f"{self.run} - {self.station_code}"
+
+class TicketArtifact(models.Model):
+    """E-ticket of a booking rendered once and served until the booking changes"""
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='ticket')
+    version = models.PositiveIntegerField(default=1)
+    digest = models.CharField(max_length=64)
+    html = models.TextField()
+    pdf = models.BinaryField(null=True, blank=True)
+    
+    rendered_at = models.DateTimeField()
+    
+    def etag(self, suffix=''):
+        return f'"{self.booking.booking_id}-{self.version}-{self.digest[:12]}{suffix}"'
+    
+    def __str__(self):
+        return f"Ticket of {self.booking} v{self.version}"
+
 class Payment(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -139,4 +397,20 @@ class Payment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"Payment {self.transaction_id} - {self.status}"
\ No newline at end of file
+        return f"Payment {self.transaction_id} - {self.status}"
+
+class IdempotencyKey(models.Model):
+    """Booking created for a client-supplied request key, returned again on replays"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='idempotency_keys')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} -> {self.booking_id}"
@@ -0,0 +1,95 @@
+"""Keyset (cursor) pagination over (created_at, id).
+
+Unlike ``Paginator`` there is no COUNT(*) and no OFFSET: each page is a
+single indexed range scan that starts right after the last row of the
+previous page, so page 500 costs the same as page 1.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.http import urlencode
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) or None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a queryset ordered newest first by (created_at, id)"""
+
+    def __init__(self, queryset, per_page=10, after=None, before=None, params=None):
+        self._setup(queryset, per_page, after, before, params)
+        self._paginate(list(self.queryset))
+
+    @classmethod
+    async def acreate(cls, queryset, per_page=10, after=None, before=None, params=None):
+        """Build a page with the async ORM"""
+        page = cls.__new__(cls)
+        page._setup(queryset, per_page, after, before, params)
+        page._paginate([row async for row in page.queryset])
+        return page
+
+    def _setup(self, queryset, per_page, after, before, params):
+        self.params = {key: value for key, value in (params or {}).items() if value not in (None, '')}
+        self.per_page = per_page
+        self.after, self.before = decode_cursor(after), decode_cursor(before)
+        self.queryset = self._page_queryset(queryset)
+
+    def _page_queryset(self, queryset):
+        if self.before:
+            created_at, pk = self.before
+            return queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            ).order_by('created_at', 'id')[:self.per_page + 1]
+        if self.after:
+            created_at, pk = self.after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        return queryset.order_by('-created_at', '-id')[:self.per_page + 1]
+
+    def _paginate(self, rows):
+        per_page = self.per_page
+        if self.before:
+            self.has_previous = len(rows) > per_page
+            self.has_next = True
+            self.object_list = rows[:per_page][::-1]
+        else:
+            self.has_next = len(rows) > per_page
+            self.has_previous = self.after is not None
+            self.object_list = rows[:per_page]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _query(self, **cursor):
+        return '?' + urlencode({**self.params, **cursor})
+
+    @property
+    def next_query(self):
+        return self._query(after=encode_cursor(self.object_list[-1])) if self.has_next and self.object_list else ''
+
+    @property
+    def previous_query(self):
+        return self._query(before=encode_cursor(self.object_list[0])) if self.has_previous and self.object_list else ''
@@ -0,0 +1,218 @@
+"""Connection planner for journeys that need one or two changes.
+
+Every active Route is a direct connection between two stations, timed by its
+own stop times or, when it has none, by its train's departure and arrival. The planner keeps all connections in one list sorted
+by departure (a connection-scan timetable) and answers queries with a
+round-based scan: round k finds the earliest arrival at every station using
+at most k trains, reading only the results of round k-1, so the first round
+that reaches the destination is the minimum-transfer journey and the last
+round is the earliest-arrival one.
+
+Trains run daily, so connections are repeated for a few consecutive days to
+let a journey wait overnight for its next leg. Each process keeps its own
+index; changes are published as a sequence of train ids in the default cache
+so every process patches just the trains that changed.
+"""
+import bisect
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models.functions import Coalesce
+
+from .models import Route
+
+MINUTES_PER_DAY = 24 * 60
+SCHEDULE_DAYS = 3
+MIN_TRANSFER_MINUTES = 30
+MAX_TRANSFERS = 2
+
+SEQUENCE_KEY = 'planner:sequence'
+CHANGE_KEY = 'planner:change:{}'
+CHANGE_TTL = 24 * 60 * 60
+MAX_INCREMENTAL_CHANGES = 500
+
+ROUTE_FIELDS = (
+    'id', 'train_id', 'from_code', 'to_code', 'from_station', 'to_station',
+    'train__name', 'train__number',
+    Coalesce('departure_time', 'train__departure_time'), Coalesce('arrival_time', 'train__arrival_time'),
+)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class TimetableIndex:
+    def __init__(self, sequence=0):
+        self.sequence = sequence
+        self.connections = []
+        self.by_train = {}
+        self.names = {}
+        self.trains = {}
+
+    def _connections_for(self, row):
+        (route_id, train_id, from_code, to_code, from_name, to_name,
+         train_name, train_number, departure_time, arrival_time) = row
+        self.names.setdefault(from_code, from_name)
+        self.names.setdefault(to_code, to_name)
+        self.trains[train_id] = (train_name, train_number)
+        departure = _minutes(departure_time)
+        arrival = _minutes(arrival_time)
+        if arrival <= departure:
+            arrival += MINUTES_PER_DAY
+        return [
+            (departure + day * MINUTES_PER_DAY, arrival + day * MINUTES_PER_DAY,
+             from_code, to_code, train_id, route_id)
+            for day in range(SCHEDULE_DAYS)
+        ]
+
+    def load(self, rows):
+        by_train = {}
+        for row in rows:
+            by_train.setdefault(row[1], []).extend(self._connections_for(row))
+        self.by_train = by_train
+        self.connections = sorted(c for connections in by_train.values() for c in connections)
+
+    def replace_train(self, train_id, rows):
+        """Swap the connections of one train without rebuilding the index"""
+        for connection in self.by_train.pop(train_id, []):
+            position = bisect.bisect_left(self.connections, connection)
+            if position < len(self.connections) and self.connections[position] == connection:
+                del self.connections[position]
+        connections = [c for row in rows for c in self._connections_for(row)]
+        if connections:
+            self.by_train[train_id] = connections
+            for connection in connections:
+                bisect.insort(self.connections, connection)
+
+    def scan(self, origin, destination, max_legs):
+        """Earliest arrival at the destination using at most 1..max_legs trains"""
+        ready = {origin: 0}
+        parents = {}
+        results = []
+        for leg in range(1, max_legs + 1):
+            arrival = dict(ready)
+            leg_parents = dict(parents)
+            transfer = MIN_TRANSFER_MINUTES if leg > 1 else 0
+            for connection in self.connections:
+                departure, arrives, from_code, to_code = connection[:4]
+                if departure >= arrival.get(destination, float('inf')):
+                    break
+                reached = ready.get(from_code)
+                if reached is None or (from_code != origin and reached + transfer > departure):
+                    continue
+                if arrives < arrival.get(to_code, float('inf')):
+                    arrival[to_code] = arrives
+                    leg_parents[to_code] = (connection, parents.get(from_code))
+            ready, parents = arrival, leg_parents
+            results.append(parents.get(destination))
+        return results
+
+    def itinerary(self, chain, travel_date):
+        legs = []
+        arrives = chain[0][1]
+        while chain:
+            connection, chain = chain
+            departure, arrival, from_code, to_code, train_id, route_id = connection
+            name, number = self.trains[train_id]
+            legs.append({
+                'route_id': route_id,
+                'train_id': train_id,
+                'train_name': name,
+                'train_number': number,
+                'from_code': from_code,
+                'from_station': self.names[from_code],
+                'to_code': to_code,
+                'to_station': self.names[to_code],
+                'departure': _moment(travel_date, departure),
+                'arrival': _moment(travel_date, arrival),
+            })
+        legs.reverse()
+        departs = connection[0]
+        return {
+            'legs': legs,
+            'transfers': len(legs) - 1,
+            'departure': legs[0]['departure'],
+            'arrival': legs[-1]['arrival'],
+            'duration_minutes': arrives - departs,
+        }
+
+
+def _moment(travel_date, minutes):
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return {
+        'date': travel_date + timedelta(days=day),
+        'time': f'{minute // 60:02d}:{minute % 60:02d}',
+        'day': day + 1,
+    }
+
+
+_index = None
+
+
+def _route_rows(**filters):
+    return Route.objects.filter(active=True, **filters).exclude(from_code='').values_list(*ROUTE_FIELDS)
+
+
+def get_index():
+    """Return this process's timetable index, patched up to the latest change"""
+    global _index
+    sequence = cache.get(SEQUENCE_KEY, 0)
+    if _index is not None and sequence == _index.sequence:
+        return _index
+    if _index is not None and 0 < sequence - _index.sequence <= MAX_INCREMENTAL_CHANGES:
+        keys = [CHANGE_KEY.format(n) for n in range(_index.sequence + 1, sequence + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) == len(keys):
+            train_ids = set(changes.values())
+            rows = {}
+            for row in _route_rows(train_id__in=train_ids):
+                rows.setdefault(row[1], []).append(row)
+            for train_id in train_ids:
+                _index.replace_train(train_id, rows.get(train_id, []))
+            _index.sequence = sequence
+            return _index
+    index = TimetableIndex(sequence)
+    index.load(_route_rows())
+    _index = index
+    return _index
+
+
+def train_changed(train_id):
+    """Publish a timetable change so every process re-reads this train"""
+    if cache.add(SEQUENCE_KEY, 1, timeout=None):
+        sequence = 1
+    else:
+        sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(CHANGE_KEY.format(sequence), train_id, CHANGE_TTL)
+
+
+def timetable_replaced():
+    """Make every process rebuild its whole index, after bulk changes to many trains"""
+    if not cache.add(SEQUENCE_KEY, MAX_INCREMENTAL_CHANGES + 1, timeout=None):
+        cache.incr(SEQUENCE_KEY, MAX_INCREMENTAL_CHANGES + 1)
+
+
+def plan(from_code, to_code, travel_date, max_transfers=MAX_TRANSFERS):
+    """Return the minimum-transfer and earliest-arrival itineraries, if any"""
+    if not from_code or not to_code or from_code == to_code:
+        return []
+    if isinstance(travel_date, str):
+        travel_date = date.fromisoformat(travel_date)
+    index = get_index()
+    chains = index.scan(from_code, to_code, max_transfers + 1)
+    itineraries = []
+    seen = set()
+    fewest = next((chain for chain in chains if chain), None)
+    for label, chain in (('fewest_transfers', fewest), ('earliest_arrival', chains[-1])):
+        if chain is None:
+            continue
+        key = id(chain)
+        if key in seen:
+            itineraries[-1]['labels'].append(label)
+            continue
+        seen.add(key)
+        itinerary = index.itinerary(chain, travel_date)
+        itinerary['labels'] = [label]
+        itineraries.append(itinerary)
+    return itineraries
@@ -0,0 +1,104 @@
+"""Read-through cache of PNR snapshots.
+
+A snapshot is a plain dict holding everything the PNR status page shows
+(booking, train, route, passengers, seats and payment status), so a repeat
+lookup is a single cache get. Any write to a booking, its seats, passengers
+or payment evicts the entry; see booking.signals.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from railbooker import db_router
+from .models import Booking
+
+KEY = 'pnr:{}'
+MISSING = 'missing'
+
+
+def _timeout():
+    return getattr(settings, 'PNR_CACHE_TIMEOUT', 600)
+
+
+def build_snapshot(booking):
+    payment = getattr(booking, 'payment', None)
+    return {
+        'pnr': booking.pnr,
+        'booking_id': booking.booking_id,
+        'status': booking.status,
+        'status_display': booking.get_status_display(),
+        'travel_date': booking.travel_date,
+        'seat_class': booking.seat_class,
+        'seat_class_display': booking.seat_class_label,
+        'train': {
+            'name': booking.train.name,
+            'number': booking.train.number,
+            'departure_time': booking.train.departure_time,
+            'arrival_time': booking.train.arrival_time,
+        },
+        'route': {
+            'from_station': booking.route.from_station,
+            'to_station': booking.route.to_station,
+        },
+        'passengers': [
+            {'name': p.name, 'age': p.age, 'gender': p.gender}
+            for p in booking.passengers.all()
+        ],
+        'seats': [
+            {'seat_number': s.seat_number, 'coach': s.coach, 'seat_type': s.seat_type}
+            for s in booking.seats.all()
+        ],
+        'payment_status': payment.status if payment else None,
+    }
+
+
+def _bookings(pnr):
+    return Booking.objects.select_related(
+        'train', 'route', 'payment'
+    ).prefetch_related('passengers', 'seats').filter(pnr=pnr)
+
+
+def load_snapshot(pnr):
+    booking = _bookings(pnr).first()
+    return build_snapshot(booking) if booking else None
+
+
+async def aload_snapshot(pnr):
+    booking = await _bookings(pnr).afirst()
+    return build_snapshot(booking) if booking else None
+
+
+def _entry(snapshot):
+    """Cached value and lifetime for a loaded snapshot"""
+    # Unknown PNRs are remembered briefly so repeated typos stay cheap
+    if snapshot is None:
+        return MISSING, db_router.cache_timeout(min(_timeout(), 60))
+    return snapshot, db_router.cache_timeout(_timeout())
+
+
+def get_snapshot(pnr):
+    """Return the snapshot for a PNR, or None if there is no such booking"""
+    key = KEY.format(pnr)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot, timeout = _entry(load_snapshot(pnr))
+        cache.set(key, snapshot, timeout)
+    return None if snapshot == MISSING else snapshot
+
+
+async def aget_snapshot(pnr):
+    """get_snapshot for async views"""
+    key = KEY.format(pnr)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot, timeout = _entry(await aload_snapshot(pnr))
+        await cache.aset(key, snapshot, timeout)
+    return None if snapshot == MISSING else snapshot
+
+
+def evict(*pnrs):
+    """Drop cached snapshots now and again once the current transaction commits"""
+    keys = [KEY.format(pnr) for pnr in pnrs if pnr]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
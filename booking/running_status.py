@@ -0,0 +1,279 @@
+"""Live running status of trains.
+
+Position reports arrive in bulk through ``ingest``, which merges them into
+StationEvent rows with a fixed number of queries per batch and then
+publishes a compact per-train state to the cache. Reads never touch the
+database while that state is cached; the train's position between two
+stations is interpolated from the state at read time, so it keeps moving
+between reports without any writes.
+"""
+import json
+from datetime import date, datetime, timedelta
+
+from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from .models import Train, TrainRun, StationEvent
+
+STATE_KEY = 'running:{}'
+EVENT_FIELDS = [
+    'station_code', 'station_name', 'distance', 'scheduled_arrival', 'scheduled_departure',
+    'actual_arrival', 'actual_departure', 'delay_minutes',
+]
+
+
+class InvalidUpdate(ValueError):
+    """Raised for a position update that is missing fields or malformed"""
+
+
+def _timeout():
+    return getattr(settings, 'RUNNING_STATUS_TIMEOUT', 6 * 60 * 60)
+
+
+def _aware(value):
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def _parse_update(update):
+    try:
+        parsed = {
+            'train': str(update['train']),
+            'date': date.fromisoformat(update['date']),
+            'sequence': int(update['sequence']),
+            'station_code': str(update['station_code']).upper(),
+        }
+        for field in ('station_name',):
+            if field in update:
+                parsed[field] = str(update[field])
+        for field in ('distance', 'delay'):
+            if field in update:
+                parsed['delay_minutes' if field == 'delay' else field] = int(update[field])
+        for field in ('scheduled_arrival', 'scheduled_departure'):
+            if update.get(field):
+                parsed[field] = parse_time(update[field])
+        for field, target in (('arrived_at', 'actual_arrival'), ('departed_at', 'actual_departure')):
+            if update.get(field):
+                parsed[target] = _aware(parse_datetime(update[field]))
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidUpdate(f'Invalid update {update!r}: {e}')
+    return parsed
+
+
+def _scheduled(run_date, events):
+    """Turn per-stop schedule times into datetimes, rolling over midnight"""
+    day = 0
+    previous = None
+    schedule = []
+    for event in events:
+        moments = []
+        for value in (event.scheduled_arrival, event.scheduled_departure):
+            if value is None:
+                moments.append(None)
+                continue
+            if previous is not None and value < previous:
+                day += 1
+            previous = value
+            moments.append(timezone.make_aware(datetime.combine(run_date + timedelta(days=day), value)))
+        schedule.append(moments)
+    return schedule
+
+
+def build_state(train, run, events):
+    events = sorted(events, key=lambda event: event.sequence)
+    stations = []
+    for event, (arrival, departure) in zip(events, _scheduled(run.run_date, events)):
+        stations.append({
+            'code': event.station_code,
+            'name': event.station_name or event.station_code,
+            'distance': event.distance,
+            'scheduled_arrival': arrival.isoformat() if arrival else None,
+            'scheduled_departure': departure.isoformat() if departure else None,
+            'actual_arrival': event.actual_arrival.isoformat() if event.actual_arrival else None,
+            'actual_departure': event.actual_departure.isoformat() if event.actual_departure else None,
+            'delay': event.delay_minutes,
+        })
+    return {
+        'train_number': train.number,
+        'train_name': train.name,
+        'run_date': run.run_date.isoformat(),
+        'version': max((event.updated_at for event in events if event.updated_at), default=timezone.now()).isoformat(),
+        'stations': stations,
+    }
+
+
+def ingest(updates):
+    """Merge a batch of position updates and refresh the cached train states
+
+    Returns (accepted, rejected) counts. The number of queries does not
+    depend on the batch size.
+    """
+    parsed, rejected = [], 0
+    for update in updates:
+        try:
+            parsed.append(_parse_update(update))
+        except InvalidUpdate:
+            rejected += 1
+
+    trains = Train.objects.in_bulk({update['train'] for update in parsed}, field_name='number')
+    accepted = [update for update in parsed if update['train'] in trains]
+    rejected += len(parsed) - len(accepted)
+    if not accepted:
+        return 0, rejected
+
+    keys = {(trains[update['train']].id, update['date']) for update in accepted}
+    run_filter = {
+        'train_id__in': {train_id for train_id, _ in keys},
+        'run_date__in': {run_date for _, run_date in keys},
+    }
+    runs = {(run.train_id, run.run_date): run for run in TrainRun.objects.filter(**run_filter)}
+    missing = [TrainRun(train_id=train_id, run_date=run_date) for train_id, run_date in keys - runs.keys()]
+    if missing:
+        TrainRun.objects.bulk_create(missing, ignore_conflicts=True)
+        runs = {(run.train_id, run.run_date): run for run in TrainRun.objects.filter(**run_filter)}
+
+    events = {
+        (event.run_id, event.sequence): event
+        for event in StationEvent.objects.filter(run__in=[runs[key] for key in keys])
+    }
+    now = timezone.now()
+    created, changed = {}, {}
+    for update in accepted:
+        run = runs[(trains[update['train']].id, update['date'])]
+        key = (run.id, update['sequence'])
+        event = events.get(key)
+        if event is None:
+            event = StationEvent(run=run, sequence=update['sequence'])
+            events[key] = created[key] = event
+        elif key not in created:
+            changed[key] = event
+        for field in EVENT_FIELDS:
+            if field in update:
+                setattr(event, field, update[field])
+        event.updated_at = now
+
+    if created:
+        StationEvent.objects.bulk_create(created.values())
+    if changed:
+        StationEvent.objects.bulk_update(changed.values(), EVENT_FIELDS + ['updated_at'])
+
+    by_run = {}
+    for (run_id, _), event in events.items():
+        by_run.setdefault(run_id, []).append(event)
+    trains_by_id = {train.id: train for train in trains.values()}
+    cached = cache.get_many([STATE_KEY.format(trains_by_id[train_id].number) for train_id, _ in keys])
+    states = {}
+    for (train_id, run_date), run in runs.items():
+        if (train_id, run_date) not in keys:
+            continue
+        train = trains_by_id[train_id]
+        key = STATE_KEY.format(train.number)
+        current = states.get(key) or cached.get(key)
+        # Only the most recent run of a train is tracked live
+        if current and current['run_date'] > run_date.isoformat():
+            continue
+        states[key] = build_state(train, run, by_run.get(run.id, []))
+    cache.set_many(states, _timeout())
+    return len(accepted), rejected
+
+
+def _latest_run(train_number):
+    return TrainRun.objects.select_related('train').filter(
+        train__number=train_number
+    ).order_by('-run_date')
+
+
+def get_state(train_number):
+    """Cached state of a train's latest run, loaded from the database on a miss"""
+    key = STATE_KEY.format(train_number)
+    state = cache.get(key)
+    if state is None:
+        run = _latest_run(train_number).first()
+        if run is None:
+            return None
+        state = build_state(run.train, run, list(run.events.all()))
+        cache.set(key, state, _timeout())
+    return state
+
+
+async def aget_state(train_number):
+    """get_state for async views"""
+    key = STATE_KEY.format(train_number)
+    state = await cache.aget(key)
+    if state is None:
+        run = await _latest_run(train_number).afirst()
+        if run is None:
+            return None
+        state = build_state(run.train, run, [event async for event in run.events.all()])
+        await cache.aset(key, state, _timeout())
+    return state
+
+
+def _time_label(value):
+    return timezone.localtime(datetime.fromisoformat(value)).strftime('%H:%M') if value else '--'
+
+
+def position(state, now=None):
+    """Where the train is now, interpolating between the last and next stop"""
+    now = now or timezone.now()
+    stations = state['stations']
+    reached = -1
+    for index, station in enumerate(stations):
+        if station['actual_arrival'] or station['actual_departure']:
+            reached = index
+    delay = stations[reached]['delay'] if reached >= 0 else 0
+
+    current = stations[reached] if reached >= 0 else None
+    upcoming = stations[reached + 1] if reached + 1 < len(stations) else None
+    distance = current['distance'] if current else 0
+    progress = 0.0
+    if current and upcoming and current['actual_departure']:
+        departed = datetime.fromisoformat(current['actual_departure'])
+        expected = upcoming['scheduled_arrival'] or upcoming['scheduled_departure']
+        if expected:
+            expected = datetime.fromisoformat(expected) + timedelta(minutes=delay)
+            span = (expected - departed).total_seconds()
+            if span > 0:
+                progress = min(max((now - departed).total_seconds() / span, 0.0), 1.0)
+        distance += round((upcoming['distance'] - current['distance']) * progress)
+
+    if current is None:
+        status = 'Not started yet'
+    elif upcoming is None:
+        status = 'Reached destination'
+    elif delay > 0:
+        status = f'Running {delay} min late'
+    else:
+        status = 'Running On Time'
+
+    timeline = []
+    for index, station in enumerate(stations):
+        timeline.append({
+            'name': station['name'],
+            'code': station['code'],
+            'arrival': 'Source' if index == 0 else _time_label(station['actual_arrival'] or station['scheduled_arrival']),
+            'departure': 'Destination' if index == len(stations) - 1 else _time_label(station['actual_departure'] or station['scheduled_departure']),
+            'distance': f"{station['distance']} km",
+            'status': 'completed' if index < reached else ('current' if index == reached else 'upcoming'),
+        })
+
+    return {
+        'name': state['train_name'],
+        'number': state['train_number'],
+        'date': date.fromisoformat(state['run_date']).strftime('%d %b %Y'),
+        'status': status,
+        'current_station': current['name'] if current else '--',
+        'next_station': upcoming['name'] if upcoming else '--',
+        'delay': delay,
+        'distance_covered': distance,
+        'progress': round(progress, 3),
+        'version': state['version'],
+        'stations': timeline,
+    }
+
+
+def encode_event(data):
+    return f'event: position\ndata: {json.dumps(data)}\n\n'
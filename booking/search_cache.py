@@ -0,0 +1,94 @@
+"""Cache of train search results.
+
+Results are stored per (from, to, travel date, class) in the cache alias named
+by ``SEARCH_CACHE_ALIAS``. Entries expire after ``SEARCH_CACHE_TIMEOUT``
+seconds and are evicted least-recently-used by the backend (``MAX_ENTRIES``
+on the local-memory backend, the eviction policy on Redis/Memcached).
+
+Invalidation does not need to enumerate keys, which most backends cannot do:
+every key embeds a generation number and any Train or Route change bumps it
+once its transaction commits, so older entries simply stop being read and
+age out.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from railbooker import db_router
+from . import stations
+
+GENERATION_KEY = 'search:generation'
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+    return snapshot
+
+
+def _new_generation():
+    # Seeded from the clock so a lost generation key never revives old entries
+    return int(time.time() * 1000)
+
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY) or _new_generation()
+    return generation
+
+
+def cache_key(cache, from_station, to_station, travel_date, seat_class=None):
+    return 'search:{}:{}:{}:{}:{}'.format(
+        _generation(cache),
+        stations.station_code(from_station),
+        stations.station_code(to_station),
+        travel_date,
+        seat_class or 'all',
+    ).replace(' ', '_')
+
+
+def get_results(from_station, to_station, travel_date, seat_class, loader, keep=None):
+    """Return cached search results, calling loader() to fill a miss
+
+    A miss is stored unless ``keep(results)`` is false.
+    """
+    cache = _cache()
+    key = cache_key(cache, from_station, to_station, travel_date, seat_class)
+    results = cache.get(key)
+    if results is not None:
+        _count('hits')
+        return results
+    _count('misses')
+    results = loader()
+    if keep is not None and not keep(results):
+        return results
+    cache.set(key, results, db_router.cache_timeout(getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300)))
+    return results
+
+
+def invalidate():
+    """Make every cached search stale"""
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, _new_generation(), timeout=None)
+    _count('invalidations')
@@ -0,0 +1,131 @@
+"""Availability calendar of a train: seats left per class for the coming weeks.
+
+Counting Booking or Seat rows would cost an aggregate per day of the
+calendar. ClassSeatCount instead keeps the seats taken per (train, travel
+date, class), moved by ``record`` in the same transaction as every
+compare-and-swap of a coach bitmap in booking.inventory, so bookings,
+cancellations, waitlist promotions and seat holds keep it current without
+knowing about it. A calendar is then one range scan over the (train,
+travel_date, seat_class) unique index; a date without a row has every seat
+free.
+
+The same row keeps the passengers in RAC and on the waitlist, moved by
+``record_queue`` wherever booking.services and booking.waitlist change a
+queued booking's status, so booking.waitlist reads a queue's length without
+summing the queue.
+
+``rebuild`` recomputes the counts from the coach bitmaps and the queued
+bookings, for runs booked before the table existed; see the
+``rebuild_seat_counts`` command.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import seat_classes
+from .models import Booking, ClassSeatCount, SeatInventory, TrainClass
+
+DEFAULT_DAYS = 60
+MAX_DAYS = 120
+
+
+def _class_inventories(train, travel_date, seat_class):
+    return SeatInventory.objects.filter(train=train, travel_date=travel_date, seat_class=seat_class)
+
+
+def _queued(train, travel_date, seat_class):
+    passengers = dict(
+        Booking.objects.filter(
+            train=train, travel_date=travel_date, seat_class=seat_class, status__in=Booking.QUEUED_STATUSES
+        ).order_by().values('status').annotate(total=Sum('party_size')).values_list('status', 'total')
+    )
+    return {status: passengers.get(status, 0) for status in Booking.QUEUED_STATUSES}
+
+
+def _adjust(train, travel_date, seat_class, **deltas):
+    counts = ClassSeatCount.objects.filter(train=train, travel_date=travel_date, seat_class=seat_class)
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if counts.update(**changes, updated_at=timezone.now()):
+        return
+    # First change of the run: start from the coaches and the queue, which already hold this change
+    booked = _class_inventories(train, travel_date, seat_class).aggregate(total=Sum('booked_count'))['total']
+    _, created = ClassSeatCount.objects.get_or_create(
+        train_id=getattr(train, 'pk', train), travel_date=travel_date, seat_class=seat_class,
+        defaults={'booked': booked or 0, **_queued(train, travel_date, seat_class)},
+    )
+    if not created:
+        counts.update(**changes, updated_at=timezone.now())
+
+
+def record(train, travel_date, seat_class, delta):
+    """Add ``delta`` (negative when seats are freed) to the seats taken in a class of a train run
+
+    Call in the transaction that changed the class's bitmaps.
+    """
+    _adjust(train, travel_date, seat_class, booked=delta)
+
+
+def record_queue(train, travel_date, seat_class, rac=0, waitlisted=0):
+    """Add to the passengers in RAC and on the waitlist of a class of a train run
+
+    Call in the transaction that changed the bookings' statuses, after the change.
+    """
+    deltas = {field: delta for field, delta in (('rac', rac), ('waitlisted', waitlisted)) if delta}
+    if deltas:
+        _adjust(train, travel_date, seat_class, **deltas)
+
+
+def rebuild(batch_size=1000):
+    """Recompute every count from the coach bitmaps and queued bookings; returns the number of counts written"""
+    with transaction.atomic():
+        counts = {}
+        totals = SeatInventory.objects.order_by().values_list('train_id', 'travel_date', 'seat_class').annotate(
+            total=Sum('booked_count')
+        )
+        for train_id, travel_date, seat_class, total in totals:
+            counts[train_id, travel_date, seat_class] = ClassSeatCount(
+                train_id=train_id, travel_date=travel_date, seat_class=seat_class, booked=total
+            )
+        queued = Booking.objects.filter(status__in=Booking.QUEUED_STATUSES).order_by().values_list(
+            'train_id', 'travel_date', 'seat_class', 'status'
+        ).annotate(total=Sum('party_size'))
+        for train_id, travel_date, seat_class, status, total in queued:
+            key = (train_id, travel_date, seat_class)
+            if key not in counts:
+                counts[key] = ClassSeatCount(train_id=train_id, travel_date=travel_date, seat_class=seat_class)
+            setattr(counts[key], status, total)
+        ClassSeatCount.objects.all().delete()
+        ClassSeatCount.objects.bulk_create(counts.values(), batch_size=batch_size)
+    return len(counts)
+
+
+def calendar(train_id, start=None, days=DEFAULT_DAYS):
+    """[{'date': ..., 'classes': {seat_class: seats left}}] for ``days`` days from ``start`` (today)
+
+    ``days`` is capped at ``MAX_DAYS``.
+    """
+    start = start or timezone.localdate()
+    days = max(1, min(days, MAX_DAYS))
+    capacities = dict(TrainClass.objects.filter(train_id=train_id).values_list('seat_class', 'seats'))
+    order = seat_classes.codes()
+    classes = sorted(capacities, key=lambda code: order.index(code) if code in order else len(order))
+
+    taken = defaultdict(dict)
+    rows = ClassSeatCount.objects.filter(
+        train_id=train_id, travel_date__gte=start, travel_date__lt=start + timedelta(days=days)
+    ).values_list('travel_date', 'seat_class', 'booked')
+    for travel_date, seat_class, booked in rows:
+        taken[travel_date][seat_class] = booked
+
+    results = []
+    for offset in range(days):
+        travel_date = start + timedelta(days=offset)
+        booked = taken.get(travel_date, {})
+        results.append({
+            'date': travel_date,
+            'classes': {code: max(capacities[code] - booked.get(code, 0), 0) for code in classes},
+        })
+    return results
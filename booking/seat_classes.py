@@ -0,0 +1,68 @@
+"""The catalogue of seat classes.
+
+Classes are SeatClass rows rather than field choices, so a class is added
+from the admin: give it a code, a name and a position, then TrainClass and
+RouteFare rows for the trains that carry it. Fare rules, coach prefixes and
+coach layouts fall back to defaults for a code they do not list.
+
+The catalogue is read on almost every page, so each process keeps it in
+memory, and a change bumps a version in the default cache so that every
+process reloads it on its next read. A new database is seeded with
+``Booking.SEAT_CLASS_CHOICES``.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Booking, SeatClass
+
+VERSION_KEY = 'seat_classes:version'
+
+_catalogue = None
+_version = None
+
+
+def catalogue():
+    """[(code, name)] of every class, in listing order"""
+    global _catalogue, _version
+    version = cache.get(VERSION_KEY, 0)
+    if not _catalogue or _version != version:
+        # An empty catalogue is read again, so a database seeded later is seen
+        _catalogue = list(SeatClass.objects.values_list('code', 'name'))
+        _version = version
+    return _catalogue
+
+
+def codes():
+    return [code for code, _ in catalogue()]
+
+
+def label(code):
+    return dict(catalogue()).get(code, code)
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate():
+    """Make every process reload the catalogue, now and again once the current transaction commits"""
+    global _catalogue
+    _catalogue = None
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def seed(using='default', **kwargs):
+    """Create the default classes in a database that has none
+
+    Runs after ``migrate``, possibly before the cache table exists, so it
+    leaves the cache alone; no process keeps an empty catalogue.
+    """
+    if not SeatClass.objects.using(using).exists():
+        SeatClass.objects.using(using).bulk_create([
+            SeatClass(code=code, name=name, position=position)
+            for position, (code, name) in enumerate(Booking.SEAT_CLASS_CHOICES)
+        ])
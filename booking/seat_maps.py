@@ -0,0 +1,86 @@
+"""Incremental seat map updates for the JSON seat map endpoint.
+
+A seat map is a coach layout (static, see booking.layouts) plus an
+occupancy overlay: the bit indexes taken at the coach's SeatInventory
+version. booking.inventory publishes every committed change of a coach's
+bitmap here: the coach's current version and, under a key of its own per
+version, the indexes the change took and freed. A client polling with the
+version it already has is then answered, without touching the database,
+with
+
+* 304 Not Modified when the version is still current, or
+* the indexes taken and freed since its version, merged from the
+  per-version entries while at most ``MAX_DIFF_VERSIONS`` are needed and
+  all are still cached.
+
+Anything else (first load, evicted entries, a client ahead of the cache)
+gets a full overlay read from the database.
+
+A per-process cache (see railbooker.caches) only sees the changes its own
+process made, so there the cached version is checked against the coach's
+stored version, one read of the unique index, before it is trusted.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from railbooker import caches
+
+MAX_DIFF_VERSIONS = 50
+
+
+def _timeout():
+    return getattr(settings, 'SEAT_MAP_CACHE_TIMEOUT', 120)
+
+
+def coach_key(train_id, travel_date, seat_class, coach):
+    return f'seatmap:{train_id}:{travel_date}:{seat_class}:{coach}'
+
+
+def etag(version):
+    return f'W/"v{version}"'
+
+
+def publish(inventory, version, taken, freed):
+    """Record a committed change of a coach's bitmap; call from transaction.on_commit"""
+    key = coach_key(inventory.train_id, inventory.travel_date, inventory.seat_class, inventory.coach)
+    cache.set_many({f'{key}:v{version}': (taken, freed), f'{key}:version': version}, _timeout())
+
+
+def remember(key, version):
+    """Note the version read from the database unless a newer one was published meanwhile"""
+    if caches.is_shared():
+        cache.add(f'{key}:version', version, _timeout())
+    else:
+        # Nothing else publishes to this process's cache; what was just read is current
+        cache.set(f'{key}:version', version, _timeout())
+
+
+def current_version(key, stored_version):
+    """The coach's current version, or None to read it from the database
+
+    ``stored_version()`` reads the version from the database; it is only
+    called when the cache is per-process.
+    """
+    version = cache.get(f'{key}:version')
+    if version is None or caches.is_shared():
+        return version
+    return version if stored_version() == version else None
+
+
+def changes(key, since, version):
+    """{'taken': [...], 'freed': [...]} between two versions, or None if the cache cannot tell"""
+    if not 0 <= since < version or version - since > MAX_DIFF_VERSIONS:
+        return None
+    keys = [f'{key}:v{number}' for number in range(since + 1, version + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    state = {}
+    for entry_key in keys:
+        taken, freed = entries[entry_key]
+        state.update(dict.fromkeys(taken, True))
+        state.update(dict.fromkeys(freed, False))
+    return {
+        'taken': sorted(index for index, is_taken in state.items() if is_taken),
+        'freed': sorted(index for index, is_taken in state.items() if not is_taken),
+    }
@@ -0,0 +1,187 @@
+"""Write paths of the booking flow.
+
+Each service runs in a single transaction so a failure part way through
+leaves nothing behind, and writes child rows with ``bulk_create`` so the
+number of statements does not grow with the number of passengers.
+"""
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from railbooker.sqlite import retry_on_busy
+from . import holds, idempotency, inventory, pnr_cache, seat_calendar, tickets, waitlist
+from .models import Booking, Passenger, Seat, Payment, TicketArtifact
+
+
+def _bulk_create_passengers(passengers):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Passenger.objects.bulk_create(passengers)
+    # Backends that cannot return primary keys from a bulk insert
+    for passenger in passengers:
+        passenger.save()
+    return passengers
+
+
+def _write_booking(user, train, route, travel_date, seat_class, booking_type, status,
+                   passengers_data, payment_method, total_amount, idempotency_key):
+    """Insert a booking with its passengers, passenger links and payment; returns (booking, passengers)"""
+    booking = Booking.objects.create(
+        booking_id=f"TKT{uuid.uuid4().hex[:8].upper()}",
+        user=user,
+        train=train,
+        route=route,
+        travel_date=travel_date,
+        seat_class=seat_class,
+        booking_type=booking_type,
+        total_amount=total_amount,
+        status=status,
+        party_size=len(passengers_data)
+    )
+
+    passengers = _bulk_create_passengers([Passenger(**data) for data in passengers_data])
+
+    BookingPassenger = Booking.passengers.through
+    BookingPassenger.objects.bulk_create([
+        BookingPassenger(booking_id=booking.pk, passenger_id=passenger.pk)
+        for passenger in passengers
+    ])
+
+    Payment.objects.create(
+        booking=booking,
+        amount=total_amount,
+        payment_method=payment_method,
+        transaction_id=f"TXN{uuid.uuid4().hex[:10].upper()}",
+        status='completed'
+    )
+
+    if idempotency_key:
+        idempotency.remember(user, idempotency_key, booking)
+
+    booking_pk = booking.pk
+    transaction.on_commit(lambda: tickets.render_ticket(booking_pk))
+    return booking, passengers
+
+
+@retry_on_busy
+def create_booking(user, train, route, travel_date, seat_class, booking_type,
+                   coach, selected_seats, passengers_data, payment_method, total_amount,
+                   idempotency_key=None, hold_key=None):
+    """Claim seats and write a confirmed booking with its passengers, seats and payment
+
+    Issues the same statements for one passenger or six: the inventory
+    claim, then one INSERT each for the booking, passengers, passenger
+    links, seats and payment, plus one for the idempotency key if given.
+    A live seat hold under ``hold_key`` is converted instead of claiming.
+    A key that was already used raises IntegrityError and writes nothing.
+    On SQLite the whole transaction is retried if the database is locked.
+    """
+    with transaction.atomic():
+        # Claim the seats first so a clash aborts before anything is written
+        if not holds.convert(hold_key, user, train, travel_date, seat_class, coach, selected_seats):
+            # Seats freed while others are queued belong to the queue
+            if waitlist.queue(train, travel_date, seat_class).exists():
+                raise inventory.SeatUnavailable('Seats in this class are held for the waitlist.')
+            inventory.claim_seats(train, travel_date, seat_class, coach, selected_seats)
+
+        booking, passengers = _write_booking(
+            user, train, route, travel_date, seat_class, booking_type, 'confirmed',
+            passengers_data, payment_method, total_amount, idempotency_key,
+        )
+
+        Seat.objects.bulk_create([
+            Seat(
+                booking=booking,
+                seat_number=seat_id,
+                coach=coach,
+                seat_type=inventory.seat_type(seat_class, seat_id),
+                passenger=passenger
+            )
+            for passenger, seat_id in zip(passengers, selected_seats)
+        ])
+
+    return booking
+
+
+@retry_on_busy
+def join_waitlist(user, train, route, travel_date, seat_class, booking_type,
+                  passengers_data, payment_method, total_amount, idempotency_key=None):
+    """Write a RAC or waitlisted booking for a full class, paid now and confirmed by ``waitlist.promote``
+
+    Raises SeatUnavailable if the class has seats for the party or its
+    waitlist is full.
+    """
+    with transaction.atomic():
+        status = waitlist.join(train, travel_date, seat_class, len(passengers_data))
+        booking, _ = _write_booking(
+            user, train, route, travel_date, seat_class, booking_type, status,
+            passengers_data, payment_method, total_amount, idempotency_key,
+        )
+        seat_calendar.record_queue(train, travel_date, seat_class, **{status: booking.party_size})
+    return booking
+
+
+@retry_on_busy
+def cancel_booking(booking):
+    """Release a booking's seats, cancel it and refund its payment in one transaction
+
+    The seats (or the RAC berth or waitlist place) it gives up go to the
+    bookings queued for its class in the same transaction.
+    """
+    with transaction.atomic():
+        # Re-read so a retry or a concurrent cancellation does not release the seats twice
+        booking.refresh_from_db(fields=['status'])
+        was_live = booking.status != 'cancelled'
+        queued = booking.status if booking.status in Booking.QUEUED_STATUSES else None
+        if was_live and not queued:
+            inventory.release_booking(booking)
+        booking.status = 'cancelled'
+        booking.save()
+        if queued:
+            seat_calendar.record_queue(
+                booking.train_id, booking.travel_date, booking.seat_class, **{queued: -booking.party_size}
+            )
+        
+        if hasattr(booking, 'payment'):
+            booking.payment.status = 'refunded'
+            booking.payment.save()
+        
+        if was_live:
+            waitlist.promote(booking.train, booking.travel_date, booking.seat_class)
+    return booking
+
+
+def cancel_train_run(train, travel_date, batch_size=2000):
+    """Cancel every live booking of a train on a date, yielding progress after each batch
+
+    Each batch is a primary key range cancelled with set-based UPDATEs of
+    the bookings and their completed payments in its own transaction, so an
+    interrupted run keeps what it did and a rerun picks up the bookings that
+    are still live. Seats stay taken since the run will not operate; stored
+    e-tickets are dropped and rendered again on their next view.
+    """
+    live = Booking.objects.filter(train=train, travel_date=travel_date).exclude(status='cancelled')
+    progress = {'total': live.count(), 'cancelled': 0, 'refunded': 0, 'last_id': 0}
+    while True:
+        batch = list(live.filter(pk__gt=progress['last_id']).order_by('pk').values_list('pk', 'pnr')[:batch_size])
+        if not batch:
+            break
+        in_batch = {'pk__gt': progress['last_id'], 'pk__lte': batch[-1][0]}
+        run_batch = Booking.objects.filter(train=train, travel_date=travel_date, **in_batch)
+        now = timezone.now()
+        with transaction.atomic():
+            queued = list(
+                live.filter(status__in=Booking.QUEUED_STATUSES, **in_batch).order_by()
+                .values_list('seat_class', 'status').annotate(passengers=Sum('party_size'))
+            )
+            progress['cancelled'] += live.filter(**in_batch).update(status='cancelled', updated_at=now)
+            for seat_class, status, passengers in queued:
+                seat_calendar.record_queue(train, travel_date, seat_class, **{status: -passengers})
+            progress['refunded'] += Payment.objects.filter(
+                booking__in=run_batch, status='completed'
+            ).update(status='refunded', updated_at=now)
+            TicketArtifact.objects.filter(booking__in=run_batch).delete()
+            pnr_cache.evict(*[pnr for _, pnr in batch])
+        progress['last_id'] = batch[-1][0]
+        yield dict(progress)
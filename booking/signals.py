@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Train, TrainClass, Route, RouteFare, SeatClass, Station, StationAlias, Booking, Seat, Payment
+from railbooker import db_router
+from . import planner, pnr_cache, search_cache, seat_classes, stations, tickets
+
+@receiver(post_save, sender=Station)
+def station_saved(sender, instance, **kwargs):
+    stations.invalidate_index()
+    stations.recode_routes([stations.normalize(instance.name), stations.normalize(instance.code)], instance.code)
+
+@receiver(post_save, sender=StationAlias)
+def station_alias_saved(sender, instance, **kwargs):
+    stations.invalidate_index()
+    stations.recode_routes([instance.alias], instance.station.code)
+
+@receiver(post_delete, sender=Station)
+@receiver(post_delete, sender=StationAlias)
+def station_deleted(sender, instance, **kwargs):
+    stations.invalidate_index()
+
+@receiver(post_save, sender=Train)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Train)
+@receiver(post_delete, sender=Route)
+def timetable_changed(sender, instance, **kwargs):
+    # After commit, so a concurrent miss cannot cache the old rows under the new generation
+    transaction.on_commit(search_cache.invalidate)
+    train_id = instance.pk if sender is Train else instance.train_id
+    transaction.on_commit(lambda: planner.train_changed(train_id))
+
+@receiver(post_save, sender=TrainClass)
+@receiver(post_save, sender=RouteFare)
+@receiver(post_delete, sender=TrainClass)
+@receiver(post_delete, sender=RouteFare)
+def classes_changed(sender, instance, **kwargs):
+    # Cached search results carry the routes' fares
+    transaction.on_commit(search_cache.invalidate)
+
+@receiver(post_save, sender=SeatClass)
+@receiver(post_delete, sender=SeatClass)
+def seat_class_changed(sender, instance, **kwargs):
+    seat_classes.invalidate()
+    transaction.on_commit(search_cache.invalidate)
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    pnr_cache.evict(instance.pnr)
+
+@receiver(post_save, sender=Booking)
+def booking_written(sender, instance, **kwargs):
+    # Read-your-writes: the owner reads from the primary while replicas catch up
+    user_id = instance.user_id
+    transaction.on_commit(lambda: db_router.pin(user_id))
+
+@receiver(post_save, sender=Booking)
+def booking_updated(sender, instance, created, **kwargs):
+    # New bookings are rendered by services.create_booking once they are complete
+    if not created:
+        booking_pk = instance.pk
+        transaction.on_commit(lambda: tickets.render_ticket(booking_pk))
+
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def seat_changed(sender, instance, **kwargs):
+    booking_pk = instance.booking_id
+    transaction.on_commit(lambda: tickets.render_ticket(booking_pk))
+
+@receiver(post_save, sender=Seat)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Seat)
+@receiver(post_delete, sender=Payment)
+def booking_detail_changed(sender, instance, **kwargs):
+    pnr_cache.evict(instance.booking.pnr)
+
+@receiver(m2m_changed, sender=Booking.passengers.through)
+def booking_passengers_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Booking):
+        pnr_cache.evict(instance.pnr)
@@ -0,0 +1,118 @@
+"""Station name resolution and autocomplete.
+
+Free-text station names are normalized and resolved to a station code once,
+so route lookups are exact matches on the indexed (from_code, to_code) pair
+instead of ``icontains`` scans. Names, codes and aliases are kept in an
+in-process index that is built lazily. A Station or StationAlias change
+bumps a version in the default cache, so every process (workers and
+management commands alike) rebuilds its index on its next lookup.
+"""
+import bisect
+import re
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Route, Station, StationAlias
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+VERSION_KEY = 'stations:version'
+
+
+def normalize(name):
+    """Upper-case a station name and collapse punctuation and whitespace"""
+    return ' '.join(_PUNCTUATION.sub(' ', name or '').upper().split())
+
+
+class StationIndex:
+    """Exact lookups through a dict and prefix lookups through a sorted key list"""
+
+    def __init__(self, stations, version=0):
+        self.version = version
+        self.codes = {}
+        self.names = {}
+        keys = set()
+        for code, name, aliases in stations:
+            self.names[code] = name
+            for key in {normalize(code), normalize(name), *map(normalize, aliases)}:
+                self.codes.setdefault(key, code)
+                # Every word start is a prefix entry, so 'central' finds 'Mumbai Central'
+                words = key.split()
+                for i in range(len(words)):
+                    keys.add((' '.join(words[i:]), code))
+        self.keys = sorted(keys)
+
+    def resolve(self, text):
+        return self.codes.get(normalize(text))
+
+    def autocomplete(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        for key, code in self.keys[bisect.bisect_left(self.keys, (prefix, '')):]:
+            if not key.startswith(prefix):
+                break
+            if code not in seen:
+                seen.add(code)
+                results.append({'code': code, 'name': self.names[code]})
+                if len(results) == limit:
+                    break
+        return results
+
+
+_index = None
+
+
+def get_index():
+    """Return this process's station index, rebuilt if any process changed a station since"""
+    global _index
+    version = cache.get(VERSION_KEY, 0)
+    if _index is None or _index.version != version:
+        aliases = {}
+        for station_id, alias in StationAlias.objects.values_list('station_id', 'alias'):
+            aliases.setdefault(station_id, []).append(alias)
+        _index = StationIndex(
+            ((station.code, station.name, aliases.get(station.id, [])) for station in Station.objects.all()),
+            version
+        )
+    return _index
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_index():
+    """Make every process rebuild its index, now and again once the current transaction commits"""
+    global _index
+    _index = None
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def station_code(text):
+    """Resolve a station name to its code, or its normalized form if unknown"""
+    return get_index().resolve(text) or normalize(text)
+
+
+def routes_between(from_station, to_station):
+    """Active routes matching two user supplied station names"""
+    return Route.objects.filter(
+        from_code=station_code(from_station),
+        to_code=station_code(to_station),
+        active=True,
+    )
+
+
+def recode_routes(names, code):
+    """Point routes stored under any of the normalized names at a station code"""
+    names = [name for name in names if name != code]
+    with transaction.atomic():
+        Route.objects.filter(from_code__in=names).update(from_code=code)
+        Route.objects.filter(to_code__in=names).update(to_code=code)
@@ -0,0 +1,11 @@
+from django import template
+
+register = template.Library()
+
+@register.filter
+def div(value, arg):
+    """Divide value by arg, returning 0 when arg is zero"""
+    try:
+        return float(value) / float(arg)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0
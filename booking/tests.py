@@ -0,0 +1,581 @@
+import os
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from . import fares, holds, idempotency, inventory, layouts, search_cache, seat_calendar, services, waitlist, wizard
+from .pagination import KeysetPage, decode_cursor, encode_cursor
+from .timetable_import import TimetableImporter
+from .models import (
+    Booking, ClassSeatCount, Route, RouteFare, SeatClass, SeatHold, SeatInventory, Train, TrainClass,
+)
+
+TRAVEL_DATE = date(2030, 1, 15)
+
+
+def passengers(count):
+    return [
+        {'name': f'Passenger {n}', 'age': 30 + n, 'gender': 'Male', 'id_proof': f'ID{n}'}
+        for n in range(count)
+    ]
+
+
+class BookingFixtures:
+    """A train with every class on one route, and a user to book it"""
+
+    @classmethod
+    def create_fixtures(cls):
+        cls.user = User.objects.create_user('traveller', password='secret')
+        cls.train = Train.objects.create(
+            name='Rajdhani Express', number='12951', departure_time=time(16, 30),
+            arrival_time=time(8, 35), duration='16h 5m'
+        )
+        for seat_class, seats in (('1st-ac', 24), ('2nd-ac', 48), ('3rd-ac', 72), ('sleeper', 72), ('general', 90)):
+            TrainClass.objects.create(train=cls.train, seat_class=seat_class, seats=seats)
+        cls.route = Route.objects.create(
+            train=cls.train, from_station='New Delhi', to_station='Mumbai Central', distance=1384
+        )
+        for seat_class, price in (('1st-ac', 4000), ('2nd-ac', 2500), ('3rd-ac', 1800), ('sleeper', 900), ('general', 500)):
+            RouteFare.objects.create(route=cls.route, seat_class=seat_class, price=price)
+
+    def setUp(self):
+        # Cached state (idempotency keys, seat map versions, wizards) must not leak between tests
+        for cache in caches.all():
+            cache.clear()
+
+    def start_wizard(self, client, user=None, wizard_id='test-wizard', **state):
+        """Log ``client`` in and give it booking wizard state in the cache store"""
+        client.force_login(user or self.user)
+        cookie = HttpResponse()
+        cookie.set_signed_cookie(wizard.COOKIE_NAME, wizard_id, salt=wizard.COOKIE_SALT)
+        client.cookies[wizard.COOKIE_NAME] = cookie.cookies[wizard.COOKIE_NAME].value
+        caches['default'].set(f'wizard:{wizard_id}', wizard.encode(state))
+
+    def book(self, seats, seat_class='2nd-ac', coach='A1', travel_date=TRAVEL_DATE, **kwargs):
+        return services.create_booking(
+            user=self.user, train=self.train, route=self.route, travel_date=travel_date,
+            seat_class=seat_class, booking_type='regular', coach=coach, selected_seats=seats,
+            passengers_data=passengers(len(seats)), payment_method='upi', total_amount=100, **kwargs
+        )
+
+
+class BookingTestCase(BookingFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixtures()
+
+
+class CreateBookingTests(BookingTestCase):
+    def test_statements_do_not_grow_with_passengers(self):
+        # Reads the train's class capacities, which are kept on the instance
+        self.book(['1A'], seat_class='general', coach='D1')
+        with CaptureQueriesContext(connection) as single:
+            self.book(['1'], travel_date=date(2030, 1, 1))
+        with self.assertNumQueries(len(single)):
+            self.book(['1', '2', '3', '4', '5', '6'], travel_date=date(2030, 1, 2))
+
+    def test_writes_passengers_seats_and_payment(self):
+        booking = self.book(['1', '2'])
+        self.assertEqual(booking.status, 'confirmed')
+        self.assertEqual(booking.passengers.count(), 2)
+        self.assertEqual(sorted(booking.seats.values_list('seat_number', flat=True)), ['1', '2'])
+        self.assertEqual(booking.payment.status, 'completed')
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class SeatInventoryTests(BookingTestCase):
+    def claim(self, seats):
+        return inventory.claim_seats(self.train, TRAVEL_DATE, '2nd-ac', 'A1', seats)
+
+    def test_claiming_a_taken_seat_fails(self):
+        self.claim(['1', '2'])
+        with self.assertRaises(inventory.SeatUnavailable):
+            self.claim(['2', '3'])
+        # Nothing of the failed claim was applied
+        self.assertEqual(inventory.taken(inventory.get_inventory(self.train, TRAVEL_DATE, '2nd-ac', 'A1')), [0, 1])
+
+    def test_lost_compare_and_swap_is_retried_on_fresh_state(self):
+        stale = inventory.get_inventory(self.train, TRAVEL_DATE, '2nd-ac', 'A1')
+        # Another booking takes seat 1 after this one read the coach
+        self.claim(['1'])
+        reads = [stale]
+        real_get_inventory = inventory.get_inventory
+
+        def get_inventory(*args):
+            return reads.pop() if reads else real_get_inventory(*args)
+
+        with mock.patch.object(inventory, 'get_inventory', side_effect=get_inventory):
+            version = self.claim(['2'])
+        row = SeatInventory.objects.get(pk=stale.pk)
+        self.assertEqual(version, 2)
+        self.assertEqual(row.version, 2)
+        self.assertEqual(row.booked_count, 2)
+        self.assertEqual(inventory.taken(row), [0, 1])
+
+    def test_releasing_frees_seats_for_the_next_claim(self):
+        self.claim(['1'])
+        inventory.release_seats(self.train, TRAVEL_DATE, '2nd-ac', 'A1', ['1'])
+        self.claim(['1'])
+        self.assertEqual(SeatInventory.objects.get().booked_count, 1)
+
+
+
+class CoachTests(BookingTestCase):
+    def open_chair_coach(self):
+        # Opened while sleeper coaches were chair cars of 30 seats
+        SeatInventory.objects.create(
+            train=self.train, travel_date=TRAVEL_DATE, seat_class='sleeper', coach='S1',
+            capacity=30, layout='chair', occupancy=bytes(4),
+        )
+
+    def test_run_keeps_the_layout_it_was_opened_with(self):
+        self.open_chair_coach()
+        self.assertEqual(
+            inventory.coaches_for(self.train, 'sleeper', TRAVEL_DATE), [('S1', 30), ('S2', 30), ('S3', 12)]
+        )
+        self.assertEqual(inventory.coaches_for(self.train, 'sleeper', date(2030, 2, 1)), [('S1', 72)])
+        holds.grant(self.user, self.train, TRAVEL_DATE, 'sleeper', 40)
+        self.assertEqual(
+            sorted(SeatInventory.objects.filter(seat_class='sleeper').values_list('coach', 'layout', 'booked_count')),
+            [('S1', 'chair', 30), ('S2', 'chair', 10)],
+        )
+
+
+class SeatMapTests(BookingTestCase):
+    url = f'/seat-map/{{}}/{TRAVEL_DATE}/2nd-ac/A1/'
+
+    def get(self, **params):
+        return self.client.get(self.url.format(self.train.id), params)
+
+    def test_poll_gets_the_seats_claimed_since(self):
+        self.book(['1'])
+        version = self.get().json()['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(['3', '4'])
+        diff = self.get(since=version).json()
+        index = layouts.get('two_tier').index
+        self.assertEqual((diff['full'], diff['taken'], diff['freed']), (False, [index['3'], index['4']], []))
+        self.assertEqual(self.get(since=diff['version']).status_code, 304)
+
+    def test_per_process_cache_is_checked_against_the_coach(self):
+        self.book(['1'])
+        version = self.get().json()['version']
+        # A claim in another process, published to that process's cache only
+        SeatInventory.objects.update(version=version + 1)
+        with mock.patch('railbooker.caches.is_shared', return_value=False):
+            data = self.get(since=version).json()
+        self.assertEqual((data['full'], data['version']), (True, version + 1))
+
+
+class KeysetPageTests(BookingTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Shared timestamps make the id the tie breaker
+        Booking.objects.bulk_create([
+            Booking(
+                booking_id=f'TKT{n:08d}', pnr=f'PNR{n:07d}', user=cls.user, train=cls.train, route=cls.route,
+                travel_date=TRAVEL_DATE, seat_class='2nd-ac', total_amount=100
+            )
+            for n in range(25)
+        ])
+        cls.newest_first = list(Booking.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def page(self, **cursor):
+        return KeysetPage(Booking.objects.all(), per_page=10, **cursor)
+
+    def test_pages_forward_cover_every_row_once(self):
+        seen, page = [], self.page()
+        while True:
+            seen.extend(booking.pk for booking in page)
+            if not page.has_next:
+                break
+            page = self.page(after=page.next_query.split('after=')[1])
+        self.assertEqual(seen, self.newest_first)
+
+    def test_previous_page_returns_the_same_rows(self):
+        first = self.page()
+        second = self.page(after=encode_cursor(first.object_list[-1]))
+        back = self.page(before=encode_cursor(second.object_list[0]))
+        self.assertEqual([b.pk for b in back], [b.pk for b in first])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(second.has_previous)
+
+    def test_malformed_cursor_starts_from_the_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertEqual([b.pk for b in self.page(after='not-a-cursor')], self.newest_first[:10])
+
+
+class IdempotencyTests(BookingTestCase):
+    def test_reused_key_writes_nothing(self):
+        booking = self.book(['1', '2'], idempotency_key='retry-key-1')
+        self.assertEqual(idempotency.replayed(self.user, 'retry-key-1'), booking.booking_id)
+        with self.assertRaises(IntegrityError):
+            self.book(['3', '4'], idempotency_key='retry-key-1')
+        self.assertEqual(Booking.objects.count(), 1)
+        # The second attempt's seat claim was rolled back with it
+        self.assertEqual(SeatInventory.objects.get().booked_count, 2)
+
+    def test_resubmitted_seat_selection_gets_the_original_booking(self):
+        self.start_wizard(
+            self.client,
+            search_data={
+                'from_station': 'New Delhi', 'to_station': 'Mumbai Central',
+                'travel_date': TRAVEL_DATE.isoformat(), 'passengers': 2, 'booking_type': 'regular',
+            },
+            passengers_data=passengers(2),
+            payment_data={
+                'train_id': self.train.id, 'seat_class': '2nd-ac', 'total_price': 5000.0, 'payment_method': 'upi',
+            },
+        )
+        url = f'/seat-selection/{self.train.id}/'
+        form = {'coach': 'A1', 'selected_seats': '1,2', 'idempotency_key': 'double-submit-1'}
+        first = self.client.post(url, form)
+        second = self.client.post(url, form)
+        booking = Booking.objects.get()
+        self.assertRedirects(first, f'/e-ticket/{booking.booking_id}/', fetch_redirect_response=False)
+        self.assertRedirects(second, f'/e-ticket/{booking.booking_id}/', fetch_redirect_response=False)
+
+
+class WaitlistTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        TrainClass.objects.filter(train=self.train, seat_class='2nd-ac').update(rac_berths=1)
+        # A1 is full: seven parties of six, one of five and one of one
+        for first in range(1, 43, 6):
+            self.book([str(n) for n in range(first, first + 6)])
+        self.book([str(n) for n in range(43, 48)])
+        self.single = self.book(['48'])
+
+    def join(self, size):
+        return services.join_waitlist(
+            self.user, self.train, self.route, TRAVEL_DATE, '2nd-ac', 'regular',
+            passengers(size), 'upi', 100
+        )
+
+    def counts(self):
+        return ClassSeatCount.objects.values_list('rac', 'waitlisted').get(
+            train=self.train, travel_date=TRAVEL_DATE, seat_class='2nd-ac'
+        )
+
+    def assertCountsMatchQueue(self):
+        queued = {status: 0 for status in Booking.QUEUED_STATUSES}
+        for booking in waitlist.queue(self.train, TRAVEL_DATE, '2nd-ac'):
+            queued[booking.status] += booking.party_size
+        self.assertEqual(self.counts(), (queued['rac'], queued['waitlisted']))
+
+    def test_parties_join_rac_then_the_waitlist(self):
+        statuses = [self.join(size).status for size in (1, 1, 1, 2)]
+        self.assertEqual(statuses, ['rac', 'rac', 'waitlisted', 'waitlisted'])
+        self.assertEqual(self.counts(), (2, 3))
+        self.assertEqual(waitlist.queues([self.train], TRAVEL_DATE)[self.train.id]['2nd-ac']['waitlisted'], 3)
+
+    def test_freed_seat_promotes_the_head_and_refills_rac(self):
+        first_rac, second_rac, first_wl, second_wl = (self.join(size) for size in (1, 1, 1, 2))
+        services.cancel_booking(self.single)
+
+        statuses = dict(Booking.objects.filter(
+            pk__in=[first_rac.pk, second_rac.pk, first_wl.pk, second_wl.pk]
+        ).values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            first_rac.pk: 'confirmed', second_rac.pk: 'rac', first_wl.pk: 'rac', second_wl.pk: 'waitlisted',
+        })
+        self.assertEqual(first_rac.seats.get().seat_number, '48')
+        self.assertCountsMatchQueue()
+
+    def test_cancelled_queued_booking_leaves_its_queue(self):
+        self.join(1)
+        waitlisted = self.join(2)
+        self.join(2)
+        services.cancel_booking(waitlisted)
+        self.assertCountsMatchQueue()
+        list(services.cancel_train_run(self.train, TRAVEL_DATE, batch_size=3))
+        self.assertEqual(self.counts(), (0, 0))
+
+
+
+class SeatHoldTests(BookingTestCase):
+    def grant(self, count=2, **kwargs):
+        return holds.grant(self.user, self.train, TRAVEL_DATE, '2nd-ac', count, **kwargs)
+
+    def booked(self):
+        return SeatInventory.objects.get(seat_class='2nd-ac').booked_count
+
+    def expire(self, key):
+        SeatHold.objects.filter(key=key).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_paying_again_replaces_the_hold(self):
+        self.start_wizard(
+            self.client,
+            search_data={
+                'from_station': 'New Delhi', 'to_station': 'Mumbai Central',
+                'travel_date': TRAVEL_DATE.isoformat(), 'passengers': 2, 'booking_type': 'regular',
+            },
+            passengers_data=passengers(2),
+        )
+        url = f'/payment/{self.train.id}/?seat_class=2nd-ac'
+        for _ in range(2):
+            self.client.post(url, {'payment_method': 'upi'})
+        self.assertEqual(SeatHold.objects.values('key').distinct().count(), 1)
+        self.assertEqual(self.booked(), 2)
+
+    def test_convert_swaps_unpicked_seats(self):
+        key = self.grant()
+        held = SeatHold.objects.get(key=key).seat_numbers()
+        booking = self.book([held[0], '40'], hold_key=key)
+        self.assertEqual(sorted(booking.seats.values_list('seat_number', flat=True)), sorted([held[0], '40']))
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(self.booked(), 2)
+
+    def test_expired_hold_converts_until_reaped(self):
+        key = self.grant()
+        held = SeatHold.objects.get(key=key).seat_numbers()
+        self.expire(key)
+        self.book(held, hold_key=key)
+        self.assertEqual(self.booked(), 2)
+
+    def test_reap_releases_expired_holds_only(self):
+        expired, live = self.grant(), self.grant()
+        self.expire(expired)
+        self.assertEqual(holds.reap(), 1)
+        self.assertEqual(list(SeatHold.objects.values_list('key', flat=True)), [live])
+        self.assertEqual(self.booked(), 2)
+
+
+
+class ConcurrentPaymentTests(BookingFixtures, TransactionTestCase):
+    """Payments committed from several threads, each on its own connection"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_fixtures()
+
+    def test_concurrent_payments_all_hold_seats(self):
+        clients = []
+        for n in range(4):
+            client = Client()
+            self.start_wizard(
+                client,
+                user=User.objects.create_user(f'payer{n}'),
+                wizard_id=f'payer-{n}',
+                search_data={
+                    'from_station': 'New Delhi', 'to_station': 'Mumbai Central',
+                    'travel_date': TRAVEL_DATE.isoformat(), 'passengers': 2, 'booking_type': 'regular',
+                },
+                passengers_data=passengers(2),
+            )
+            clients.append(client)
+        url = f'/payment/{self.train.id}/?seat_class=2nd-ac'
+        start = threading.Barrier(len(clients))
+        statuses = []
+
+        def pay(client):
+            try:
+                start.wait()
+                response = client.post(url, {'payment_method': 'upi'})
+                statuses.append(response.url)
+            except Exception as e:
+                statuses.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=pay, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [f'/seat-selection/{self.train.id}/'] * len(clients))
+        self.assertEqual(SeatHold.objects.values('key').distinct().count(), len(clients))
+        self.assertEqual(SeatInventory.objects.get(seat_class='2nd-ac').booked_count, 2 * len(clients))
+
+
+class SeatCalendarTests(BookingTestCase):
+    def counted(self):
+        return dict(ClassSeatCount.objects.values_list('seat_class', 'booked'))
+
+    def coach_totals(self):
+        totals = {}
+        for seat_class, booked in SeatInventory.objects.values_list('seat_class', 'booked_count'):
+            totals[seat_class] = totals.get(seat_class, 0) + booked
+        return totals
+
+    def test_counts_follow_bookings_holds_and_cancellations(self):
+        self.book(['1', '2', '3'])
+        cancelled = self.book(['1A', '1B'], seat_class='general', coach='D1')
+        expired = holds.grant(self.user, self.train, TRAVEL_DATE, '2nd-ac', 2)
+        holds.grant(self.user, self.train, TRAVEL_DATE, 'general', 4)
+        services.cancel_booking(cancelled)
+        SeatHold.objects.filter(key=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+        holds.reap()
+
+        self.assertEqual(self.counted(), {'2nd-ac': 3, 'general': 4})
+        self.assertEqual(self.counted(), self.coach_totals())
+        days = seat_calendar.calendar(self.train.id, start=TRAVEL_DATE, days=2)
+        self.assertEqual(days[0]['classes']['2nd-ac'], 45)
+        self.assertEqual(days[1]['classes']['2nd-ac'], 48)
+
+    def test_rebuild_repairs_drifted_counts(self):
+        self.book(['1', '2'])
+        ClassSeatCount.objects.update(booked=40, rac=3)
+        self.assertEqual(seat_calendar.rebuild(), 1)
+        self.assertEqual(
+            list(ClassSeatCount.objects.values_list('seat_class', 'booked', 'rac', 'waitlisted')),
+            [('2nd-ac', 2, 0, 0)],
+        )
+
+
+
+class SearchCacheTests(BookingTestCase):
+    def generation(self):
+        return search_cache._cache().get(search_cache.GENERATION_KEY)
+
+    def test_fare_change_invalidates_once_committed(self):
+        search_cache.cache_key(search_cache._cache(), 'New Delhi', 'Mumbai Central', TRAVEL_DATE)
+        before = self.generation()
+        with self.captureOnCommitCallbacks() as callbacks:
+            RouteFare.objects.filter(route=self.route, seat_class='general').first().save()
+        self.assertEqual(self.generation(), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.generation(), before)
+
+
+class SeatClassTests(BookingTestCase):
+    def test_added_class_is_offered_without_a_schema_change(self):
+        SeatClass.objects.create(code='exec', name='Executive', position=9)
+        TrainClass.objects.create(train=self.train, seat_class='exec', seats=30)
+        RouteFare.objects.create(route=self.route, seat_class='exec', price=3000)
+
+        table = fares.FareTable(Route.objects.prefetch_related('fares').filter(pk=self.route.pk))
+        self.assertEqual(table.base_fare(self.route.pk, 'exec'), 3000)
+        days = seat_calendar.calendar(self.train.id, start=TRAVEL_DATE, days=1)
+        self.assertEqual(list(days[0]['classes'])[-1], 'exec')
+        self.assertEqual(self.book(['1A'], seat_class='exec', coach='E1').seat_class_label, 'Executive')
+
+
+class TimetableImportTests(TestCase):
+    TRAINS = 'train_number,train_name,first_ac_seats,second_ac_seats,third_ac_seats,sleeper_seats,general_seats\n' \
+             '22221,Duronto,0,48,72,0,0\n'
+
+    def import_stops(self, *stops):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'trains.txt'), 'w') as f:
+                f.write(self.TRAINS)
+            with open(os.path.join(directory, 'stop_times.txt'), 'w') as f:
+                f.write('train_number,stop_sequence,station,arrival_time,departure_time,distance\n')
+                for n, (station, arrival, departure, distance) in enumerate(stops, start=1):
+                    f.write(f'22221,{n},{station},{arrival},{departure},{distance}\n')
+            return TimetableImporter().import_gtfs(directory)
+
+    def test_routes_are_timed_by_their_stops(self):
+        self.import_stops(('Pune', '', '06:00', 0), ('Lonavala', '07:10', '07:15', 64), ('Mumbai', '09:30', '', 192))
+        route = Route.objects.get(from_station='Lonavala', to_station='Mumbai')
+        self.assertEqual((route.departs, route.arrives), (time(7, 15), time(9, 30)))
+        self.assertEqual(route.distance, 128)
+        self.assertEqual(Train.objects.get(number='22221').departure_time, time(6, 0))
+
+    def test_routes_missing_from_the_feed_are_deactivated(self):
+        self.import_stops(('Pune', '', '06:00', 0), ('Lonavala', '07:10', '07:15', 64), ('Mumbai', '09:30', '', 192))
+        stats = self.import_stops(('Pune', '', '06:00', 0), ('Mumbai', '09:30', '', 192))
+        active = set(Route.objects.filter(active=True).values_list('from_station', 'to_station'))
+        self.assertEqual(active, {('Pune', 'Mumbai')})
+        self.assertEqual(Route.objects.count(), 3)
+        self.assertEqual(stats.routes_written, 2)
+
+        self.import_stops(('Pune', '', '06:00', 0), ('Lonavala', '07:10', '07:15', 64), ('Mumbai', '09:30', '', 192))
+        self.assertEqual(Route.objects.filter(active=True).count(), 3)
+        self.assertEqual(self.import_stops(
+            ('Pune', '', '06:00', 0), ('Lonavala', '07:10', '07:15', 64), ('Mumbai', '09:30', '', 192)
+        ).routes_written, 0)
+
+
+class ApiSessionTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def test_session_sets_the_csrf_cookie(self):
+        response = self.client.get('/api/v1/session/')
+        self.assertEqual(response.json(), {'authenticated': True, 'username': 'traveller'})
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_batch_needs_no_csrf_token(self):
+        response = self.client.post(
+            '/api/v1/batch/', {'requests': ['/api/v1/bookings/']}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['responses'][0]['status'], 200)
+
+    def test_booking_post_needs_the_csrf_token(self):
+        response = self.client.post('/api/v1/bookings/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        token = self.client.get('/api/v1/session/').cookies['csrftoken'].value
+        response = self.client.post(
+            '/api/v1/bookings/', {}, content_type='application/json', HTTP_X_CSRFTOKEN=token
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_pnr_is_not_publicly_cacheable(self):
+        booking = self.book(['1'])
+        response = self.client.get(f'/api/v1/pnr/{booking.pnr}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+
+class ApiTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_search_creates_no_routes(self):
+        response = self.client.get('/api/v1/search/', {
+            'from_station': 'Chennai Central', 'to_station': 'Howrah',
+            'travel_date': TRAVEL_DATE.isoformat(), 'passengers': 1, 'booking_type': 'regular',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(Route.objects.count(), 1)
+
+    def test_booking_a_class_the_train_does_not_carry_is_not_found(self):
+        SeatClass.objects.create(code='executive', name='Executive Chair Car', position=9)
+        RouteFare.objects.create(route=self.route, seat_class='executive', price=3000)
+        response = self.client.post('/api/v1/bookings/', {
+            'from_station': 'New Delhi', 'to_station': 'Mumbai Central',
+            'travel_date': TRAVEL_DATE.isoformat(), 'booking_type': 'regular',
+            'train': self.train.id, 'seat_class': 'executive', 'payment_method': 'upi',
+            'passengers': passengers(1),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_reports_a_non_json_item_on_its_own(self):
+        real_resolve = resolve
+
+        def fake_resolve(path):
+            match = real_resolve(path)
+            if match.url_name == 'session':
+                match.func = lambda request: HttpResponse('<html></html>')
+            return match
+
+        with mock.patch('booking.api.resolve', side_effect=fake_resolve):
+            response = self.client.post(
+                '/api/v1/batch/', {'requests': ['/api/v1/session/', '/api/v1/bookings/']},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        first, second = response.json()['responses']
+        self.assertEqual(first['status'], 200)
+        self.assertIn('error', first['body'])
+        self.assertEqual(second['status'], 200)
@@ -0,0 +1,81 @@
+"""Pre-rendered e-tickets.
+
+A booking's e-ticket page is rendered once, when the booking is confirmed,
+and stored as a TicketArtifact together with a content version. Views serve
+the stored page with an ETag and Last-Modified so that repeated refreshes
+are answered with 304s. Cancellations and seat changes render it again; the
+version only moves when the rendered content actually differs.
+
+If WeasyPrint is installed and ``E_TICKET_PDF`` is enabled, a PDF copy is
+stored alongside the HTML.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from railbooker.db_router import primary
+from .models import Booking, Seat, TicketArtifact
+
+try:
+    from weasyprint import HTML
+except ImportError:
+    HTML = None
+
+TEMPLATE = 'booking/e_ticket.html'
+
+
+def pdf_enabled():
+    return HTML is not None and getattr(settings, 'E_TICKET_PDF', False)
+
+
+def ticket_context(booking):
+    return {
+        'booking': booking,
+        'passengers': booking.passengers.all(),
+        'seats': booking.seats.all(),
+    }
+
+
+def render_ticket(booking_pk):
+    """Render a booking's e-ticket and store it if it changed; returns the artifact"""
+    booking = Booking.objects.select_related('user', 'train', 'route').prefetch_related(
+        'passengers', Prefetch('seats', queryset=Seat.objects.order_by('id')),
+    ).filter(pk=booking_pk).first()
+    if booking is None:
+        return None
+
+    # Rendered for the booking's owner, without a request or flash messages
+    html = render_to_string(TEMPLATE, {**ticket_context(booking), 'user': booking.user, 'messages': []})
+    digest = hashlib.sha256(html.encode()).hexdigest()
+
+    artifact = TicketArtifact.objects.filter(booking=booking).defer('html', 'pdf').first()
+    if artifact is not None and artifact.digest == digest:
+        return artifact
+    if artifact is None:
+        artifact = TicketArtifact(booking=booking, version=0)
+    artifact.booking = booking
+    artifact.version += 1
+    artifact.digest = digest
+    artifact.html = html
+    artifact.pdf = HTML(string=html, base_url=settings.BASE_DIR.as_uri()).write_pdf() if pdf_enabled() else None
+    artifact.rendered_at = timezone.now().replace(microsecond=0)
+    artifact.save()
+    return artifact
+
+
+def get_ticket(booking_id, user, pdf=False):
+    """The stored e-ticket of a user's booking, rendering it first if it was never stored"""
+    tickets = TicketArtifact.objects.select_related('booking').filter(
+        booking__booking_id=booking_id, booking__user=user
+    )
+    artifact = tickets.defer('html' if pdf else 'pdf').first()
+    if artifact is None:
+        pk = Booking.objects.filter(booking_id=booking_id, user=user).values_list('pk', flat=True).first()
+        if pk is not None:
+            # Rendering reads what it is about to write, so not from a replica
+            with primary():
+                artifact = render_ticket(pk)
+    return artifact
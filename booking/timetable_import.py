@@ -0,0 +1,433 @@
+"""Streaming timetable import into Train, TrainClass, Route and RouteFare.
+
+Two layouts are read, both as UTF-8 CSV with a header row:
+
+* A flat file with one row per route, carrying its train's columns too::
+
+    train_number,train_name,departure_time,arrival_time,duration,
+    first_ac_seats,second_ac_seats,third_ac_seats,sleeper_seats,general_seats,
+    from_station,to_station,distance,
+    first_ac_price,second_ac_price,third_ac_price,sleeper_price,general_price
+
+* A GTFS-like directory: ``trains.txt`` (train_number, train_name and the
+  five ``*_seats`` columns), ``stop_times.txt`` (train_number,
+  stop_sequence, station, arrival_time, departure_time, distance; grouped
+  by train as in GTFS) and an optional ``fares.txt`` (seat_class, per_km,
+  minimum). Every ordered pair of a train's stops becomes a Route priced by
+  distance and timed by its departure from the first stop and arrival at
+  the second. Times may run past 24:00 as in GTFS.
+
+The per-class columns become TrainClass and RouteFare rows; a class with no
+seats (or no fare) is not offered and its row, if any, is removed. A train's
+stored routes that are missing from the file are deactivated rather than
+deleted, since bookings point at them, and come back if the file lists them
+again. This needs a train's rows to be adjacent, as GTFS groups them; a
+train that turns up again further down only gains routes.
+
+Rows are read lazily and written in chunks, so memory use does not depend
+on the file size. Each chunk is compared with what is stored and only new or
+changed rows are upserted (``bulk_create`` with ``update_conflicts``), so a
+re-import of an unchanged timetable writes nothing. Bulk writes bypass the
+model signals; the search cache and the journey planner are told about the
+changed trains at the end, through the shared cache so that every web
+worker sees the change (see railbooker.caches).
+"""
+import csv
+import os
+import time
+from datetime import time as clock
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+
+from django.db import transaction
+
+from . import planner, search_cache, seat_classes, stations
+from .models import Train, TrainClass, Route, RouteFare
+
+# File column of each class's seats and base fare
+SEAT_COLUMNS = {
+    '1st-ac': 'first_ac_seats', '2nd-ac': 'second_ac_seats', '3rd-ac': 'third_ac_seats',
+    'sleeper': 'sleeper_seats', 'general': 'general_seats',
+}
+PRICE_COLUMNS = {
+    '1st-ac': 'first_ac_price', '2nd-ac': 'second_ac_price', '3rd-ac': 'third_ac_price',
+    'sleeper': 'sleeper_price', 'general': 'general_price',
+}
+TRAIN_FIELDS = ['name', 'departure_time', 'arrival_time', 'duration']
+ROUTE_FIELDS = ['from_code', 'to_code', 'distance', 'departure_time', 'arrival_time', 'active']
+
+# Rupees per km and minimum fare by class, when fares.txt does not say otherwise
+DEFAULT_FARE_RATES = {
+    '1st-ac': (Decimal('3.50'), Decimal('1000')),
+    '2nd-ac': (Decimal('2.10'), Decimal('700')),
+    '3rd-ac': (Decimal('1.50'), Decimal('500')),
+    'sleeper': (Decimal('0.60'), Decimal('200')),
+    'general': (Decimal('0.30'), Decimal('100')),
+}
+CENT = Decimal('0.01')
+
+
+class TimetableError(ValueError):
+    """Raised for a file that cannot be imported at all, such as a missing column"""
+
+
+class InvalidRow(ValueError):
+    """A malformed row, which is skipped and counted as rejected"""
+
+
+def _minutes(value):
+    """Minutes after midnight of an HH:MM[:SS] time, which may run past 24:00"""
+    try:
+        parts = [int(part) for part in value.strip().split(':')]
+        hours, minutes = parts[0], parts[1]
+    except (AttributeError, ValueError, IndexError):
+        raise InvalidRow(f'Invalid time {value!r}')
+    if not 0 <= minutes < 60 or hours < 0:
+        raise InvalidRow(f'Invalid time {value!r}')
+    return hours * 60 + minutes
+
+
+def _clock(minutes):
+    return clock((minutes // 60) % 24, minutes % 60)
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f'Invalid {name} {value!r}')
+
+
+def _money(value, name):
+    try:
+        return Decimal(value).quantize(CENT)
+    except (TypeError, InvalidOperation):
+        raise InvalidRow(f'Invalid {name} {value!r}')
+
+
+def _require(reader, columns, source):
+    missing = set(columns) - set(reader.fieldnames or [])
+    if missing:
+        raise TimetableError(f"{source} is missing column(s): {', '.join(sorted(missing))}")
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.rejected = 0
+        self.errors = []
+        self.trains_written = 0
+        self.routes_written = 0
+        self.classes_written = 0
+        self.unchanged = 0
+        self.changed_trains = set()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / max(self.elapsed, 0.001)
+
+    def reject(self, where, error):
+        self.rejected += 1
+        if len(self.errors) < 20:
+            self.errors.append(f'{where}: {error}')
+
+
+class TimetableImporter:
+    def __init__(self, chunk_size=2000, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.stats = ImportStats()
+        self._codes = {}
+        # Trains whose stale routes have been deactivated; one entry per train
+        self._swept = set()
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            if len(self._codes) > 100000:
+                self._codes.clear()
+            code = self._codes[name] = stations.station_code(name)
+        return code
+
+    def _report(self):
+        if self.progress:
+            self.progress(self.stats)
+
+    def _sync_classes(self, model, parent, value, rows):
+        """Write {(parent_id, seat_class): value} into a per-class table
+
+        Only new or changed rows are written; a falsy value removes the row.
+        Returns the ids of the parents that changed.
+        """
+        existing = {
+            row[:2]: row[2] for row in
+            model.objects.filter(**{f'{parent}_id__in': {key[0] for key in rows}}).values_list(
+                f'{parent}_id', 'seat_class', value
+            )
+        }
+        changed, stale = [], {}
+        for (parent_id, seat_class), amount in rows.items():
+            current = existing.get((parent_id, seat_class))
+            if not amount:
+                if current is not None:
+                    stale.setdefault(seat_class, []).append(parent_id)
+            elif current != amount:
+                changed.append(model(**{f'{parent}_id': parent_id, 'seat_class': seat_class, value: amount}))
+        if changed:
+            model.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=[parent, 'seat_class'], update_fields=[value],
+            )
+        for seat_class, parent_ids in stale.items():
+            model.objects.filter(**{f'{parent}_id__in': parent_ids}, seat_class=seat_class).delete()
+        self.stats.classes_written += len(changed) + sum(map(len, stale.values()))
+        return {getattr(row, f'{parent}_id') for row in changed}.union(*stale.values())
+
+    def upsert_trains(self, trains):
+        """Write new or changed trains from {number: fields}; returns {number: id}
+
+        ``fields`` carries the train's seats by class under ``classes``.
+        """
+        existing = {
+            row[0]: row for row in
+            Train.objects.filter(number__in=trains).values_list('number', 'id', *TRAIN_FIELDS)
+        }
+        changed = []
+        for number, fields in trains.items():
+            row = existing.get(number)
+            if row is not None and list(row[2:]) == [fields[name] for name in TRAIN_FIELDS]:
+                self.stats.unchanged += 1
+                continue
+            changed.append(Train(number=number, **{name: fields[name] for name in TRAIN_FIELDS}))
+        if changed:
+            Train.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=['number'],
+                update_fields=TRAIN_FIELDS + ['updated_at'],
+            )
+            self.stats.trains_written += len(changed)
+        ids = {number: row[1] for number, row in existing.items()}
+        new = [train.number for train in changed if train.number not in ids]
+        if new:
+            ids.update(Train.objects.filter(number__in=new).values_list('number', 'id'))
+        self.stats.changed_trains.update(ids[train.number] for train in changed)
+        self.stats.changed_trains.update(self._sync_classes(TrainClass, 'train', 'seats', {
+            (ids[number], seat_class): seats
+            for number, fields in trains.items() for seat_class, seats in fields['classes'].items()
+        }))
+        return ids
+
+    def upsert_routes(self, routes, complete=()):
+        """Write new or changed routes from {(train_id, from_station, to_station): fields}
+
+        ``fields`` carries the route's base fares by class under ``fares``.
+        Stored routes of the ``complete`` trains that are not in ``routes``
+        are deactivated.
+        """
+        train_ids = {key[0] for key in routes}
+        existing = {
+            row[:3]: row[3:] for row in
+            Route.objects.filter(train_id__in=train_ids).values_list(
+                'train_id', 'from_station', 'to_station', 'id', *ROUTE_FIELDS
+            )
+        }
+        changed = []
+        for key, fields in routes.items():
+            row = existing.get(key)
+            values = {name: fields[name] for name in ROUTE_FIELDS}
+            if row is not None and list(row[1:]) == list(values.values()):
+                self.stats.unchanged += 1
+                continue
+            changed.append(Route(train_id=key[0], from_station=key[1], to_station=key[2], **values))
+        ids = {key: row[0] for key, row in existing.items()}
+        if changed:
+            Route.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=['train', 'from_station', 'to_station'],
+                update_fields=ROUTE_FIELDS,
+            )
+            self.stats.routes_written += len(changed)
+            self.stats.changed_trains.update(route.train_id for route in changed)
+            if any((route.train_id, route.from_station, route.to_station) not in ids for route in changed):
+                ids.update(
+                    (row[:3], row[3]) for row in
+                    Route.objects.filter(train_id__in=train_ids).values_list(
+                        'train_id', 'from_station', 'to_station', 'id'
+                    )
+                )
+        stale = [
+            row[0] for key, row in existing.items()
+            if key[0] in complete and key not in routes and row[-1]
+        ]
+        if stale:
+            Route.objects.filter(id__in=stale).update(active=False)
+            self.stats.routes_written += len(stale)
+            self.stats.changed_trains.update(key[0] for key, row in existing.items() if row[0] in stale)
+        changed_routes = self._sync_classes(RouteFare, 'route', 'price', {
+            (ids[key], seat_class): price
+            for key, fields in routes.items() for seat_class, price in fields['fares'].items()
+        })
+        if changed_routes:
+            self.stats.changed_trains.update(key[0] for key in routes if ids[key] in changed_routes)
+
+    def _route_fields(self, from_station, to_station, distance, prices, departure=None, arrival=None):
+        return {
+            'from_code': self._code(from_station),
+            'to_code': self._code(to_station),
+            'distance': distance,
+            'departure_time': departure,
+            'arrival_time': arrival,
+            'active': True,
+            'fares': prices,
+        }
+
+    def _flush(self, trains, routes):
+        with transaction.atomic():
+            ids = self.upsert_trains(trains) if trains else {}
+            if routes:
+                # Every route's train is part of the same chunk, and all its routes
+                # are unless its rows are not adjacent in the file
+                complete = {ids[number] for number in trains if number not in self._swept}
+                self._swept.update(trains)
+                self.upsert_routes({
+                    (ids[number], from_station, to_station): fields
+                    for (number, from_station, to_station), fields in routes.items()
+                }, complete)
+        self._report()
+
+    def import_csv(self, f):
+        reader = csv.DictReader(f)
+        _require(reader, ['train_number', 'train_name', 'departure_time', 'arrival_time', 'duration',
+                          'from_station', 'to_station', 'distance',
+                          *SEAT_COLUMNS.values(), *PRICE_COLUMNS.values()], 'CSV file')
+        trains, routes = {}, {}
+        for line, row in enumerate(reader, start=2):
+            self.stats.rows += 1
+            number = row['train_number'].strip()
+            if len(routes) >= self.chunk_size and number not in trains:
+                # Flush between trains, so that a chunk holds all of a train's routes
+                self._flush(trains, routes)
+                trains, routes = {}, {}
+            try:
+                if not number or not row['from_station'].strip() or not row['to_station'].strip():
+                    raise InvalidRow('Missing train number or station')
+                train = {
+                    'name': row['train_name'].strip(),
+                    'departure_time': _clock(_minutes(row['departure_time'])),
+                    'arrival_time': _clock(_minutes(row['arrival_time'])),
+                    'duration': row['duration'].strip(),
+                    'classes': {cls: _int(row[name], name) for cls, name in SEAT_COLUMNS.items()},
+                }
+                key = (number, row['from_station'].strip(), row['to_station'].strip())
+                route = self._route_fields(
+                    key[1], key[2], _int(row['distance'], 'distance'),
+                    {cls: _money(row[name], name) for cls, name in PRICE_COLUMNS.items()},
+                )
+            except InvalidRow as e:
+                self.stats.reject(f'line {line}', e)
+                continue
+            trains[number] = train
+            routes[key] = route
+        if trains or routes:
+            self._flush(trains, routes)
+        return self.finish()
+
+    def _read_fares(self, path):
+        rates = dict(DEFAULT_FARE_RATES)
+        if not os.path.exists(path):
+            return rates
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            _require(reader, ['seat_class', 'per_km', 'minimum'], 'fares.txt')
+            for row in reader:
+                seat_class = row['seat_class'].strip()
+                if seat_class not in seat_classes.codes():
+                    raise TimetableError(f"fares.txt: unknown seat class {row['seat_class']!r}")
+                rates[seat_class] = (_money(row['per_km'], 'per_km'), _money(row['minimum'], 'minimum'))
+        return rates
+
+    def _read_trains(self, path):
+        """Stream trains.txt into {number: (name, seats)}; one small entry per train"""
+        trains = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            _require(reader, ['train_number', 'train_name', *SEAT_COLUMNS.values()], 'trains.txt')
+            for line, row in enumerate(reader, start=2):
+                try:
+                    trains[row['train_number'].strip()] = (
+                        row['train_name'].strip(),
+                        {cls: _int(row[name], name) for cls, name in SEAT_COLUMNS.items()},
+                    )
+                except InvalidRow as e:
+                    self.stats.reject(f'trains.txt:{line}', e)
+        return trains
+
+    def import_gtfs(self, directory):
+        rates = self._read_fares(os.path.join(directory, 'fares.txt'))
+        train_info = self._read_trains(os.path.join(directory, 'trains.txt'))
+        trains, routes = {}, {}
+        with open(os.path.join(directory, 'stop_times.txt'), newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            _require(reader, ['train_number', 'stop_sequence', 'station', 'arrival_time',
+                              'departure_time', 'distance'], 'stop_times.txt')
+            numbered = enumerate(reader, start=2)
+            for number, group in groupby(numbered, key=lambda item: item[1]['train_number'].strip()):
+                stops = []
+                for line, row in group:
+                    self.stats.rows += 1
+                    try:
+                        stops.append((
+                            _int(row['stop_sequence'], 'stop_sequence'),
+                            row['station'].strip(),
+                            _minutes(row['arrival_time'] or row['departure_time']),
+                            _minutes(row['departure_time'] or row['arrival_time']),
+                            _int(row['distance'], 'distance'),
+                        ))
+                    except InvalidRow as e:
+                        self.stats.reject(f'stop_times.txt:{line}', e)
+                if number not in train_info:
+                    self.stats.reject(f'stop_times.txt train {number}', 'not listed in trains.txt')
+                    continue
+                if len(stops) < 2:
+                    continue
+                stops.sort()
+                name, seats = train_info[number]
+                first_departure, last_arrival = stops[0][3], stops[-1][2]
+                span = last_arrival - first_departure
+                trains[number] = {
+                    'name': name,
+                    'departure_time': _clock(first_departure),
+                    'arrival_time': _clock(last_arrival),
+                    'duration': f'{span // 60}h {span % 60}m',
+                    'classes': seats,
+                }
+                for i, origin in enumerate(stops):
+                    for destination in stops[i + 1:]:
+                        distance = destination[4] - origin[4]
+                        prices = {
+                            cls: max(per_km * distance, minimum).quantize(CENT)
+                            for cls, (per_km, minimum) in rates.items()
+                        }
+                        routes[(number, origin[1], destination[1])] = self._route_fields(
+                            origin[1], destination[1], distance, prices,
+                            _clock(origin[3]), _clock(destination[2]),
+                        )
+                if len(routes) >= self.chunk_size:
+                    self._flush(trains, routes)
+                    trains, routes = {}, {}
+        if trains or routes:
+            self._flush(trains, routes)
+        return self.finish()
+
+    def finish(self):
+        changed = self.stats.changed_trains
+        if changed:
+            search_cache.invalidate()
+            if len(changed) > planner.MAX_INCREMENTAL_CHANGES:
+                planner.timetable_replaced()
+            else:
+                for train_id in changed:
+                    planner.train_changed(train_id)
+        return self.stats
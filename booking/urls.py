@@ -1,17 +1,32 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
 app_name = 'booking'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('stations/autocomplete/', views.station_autocomplete, name='station_autocomplete'),
+    path('search-cache/stats/', views.search_cache_stats, name='search_cache_stats'),
     path('passenger-details/', views.passenger_details, name='passenger_details'),
-    path('train-results/', views.train_results, name='train_results'),
+    path('train-results/', read_views.train_results, name='train_results'),
     path('payment/<int:train_id>/', views.payment, name='payment'),
     path('seat-selection/<int:train_id>/', views.seat_selection, name='seat_selection'),
+    path('coach-layouts/<str:name>/', views.coach_layout, name='coach_layout'),
+    path('seat-map/<int:train_id>/<str:travel_date>/<str:seat_class>/',
+         views.seat_map_json, name='seat_map_first_coach'),
+    path('seat-map/<int:train_id>/<str:travel_date>/<str:seat_class>/<str:coach>/',
+         views.seat_map_json, name='seat_map'),
     path('e-ticket/<str:booking_id>/', views.e_ticket, name='e_ticket'),
-    path('pnr-status/', views.pnr_status, name='pnr_status'),
-    path('train-status/', views.train_status, name='train_status'),
+    path('pnr-status/', read_views.pnr_status, name='pnr_status'),
+    path('train-status/', read_views.train_status, name='train_status'),
+    path('train-status/<str:train_number>/stream/', read_views.train_status_stream, name='train_status_stream'),
+    path('running-status/ingest/', views.running_status_ingest, name='running_status_ingest'),
     path('cancellation/', views.cancellation, name='cancellation'),
-    path('my-bookings/', views.my_bookings, name='my_bookings'),
+    path('my-bookings/', read_views.my_bookings, name='my_bookings'),
 ]
\ No newline at end of file
@@ -1,14 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
 from django.db.models import Q
-from .models import Train, Route, Booking, Passenger, Seat, Payment
-from .forms import TrainSearchForm, PassengerForm, PaymentForm, PNRStatusForm, TrainStatusForm
-import uuid
-from datetime import datetime, timedelta
+from railbooker.db_router import primary, use_replica
+from .models import Train, Route, RouteFare, Booking, Passenger, Seat, Payment, SeatInventory
+from .forms import TrainSearchForm, PassengerForm, PaymentForm, PNRStatusForm, TrainStatusForm, BookingFilterForm
+from .pagination import KeysetPage
+from . import (
+    fares, holds, idempotency, inventory, layouts, planner, pnr_cache, running_status, search_cache, seat_classes,
+    seat_maps, services, stations, tickets, waitlist,
+)
+import json
+from contextlib import nullcontext
+from datetime import date
 import random
 
 def index(request):
@@ -18,15 +31,27 @@ def index(request):
     if request.method == 'POST':
         form = TrainSearchForm(request.POST)
         if form.is_valid():
-            # Store search data in session
-            request.session['search_data'] = form.cleaned_data
+            # Store search data in the wizard state (dates as ISO strings, the state is JSON)
+            search_data = dict(form.cleaned_data)
+            search_data['travel_date'] = search_data['travel_date'].isoformat()
+            request.wizard['search_data'] = search_data
             return redirect('booking:passenger_details')
     
     return render(request, 'booking/index.html', {'form': form})
 
+def station_autocomplete(request):
+    """Station suggestions for the search form"""
+    results = stations.get_index().autocomplete(request.GET.get('q', ''))
+    return JsonResponse({'results': results})
+
+@staff_member_required
+def search_cache_stats(request):
+    """Hit/miss counters of this process's search cache"""
+    return JsonResponse(search_cache.stats())
+
 def passenger_details(request):
     """Passenger details form"""
-    search_data = request.session.get('search_data')
+    search_data = request.wizard.get('search_data')
     if not search_data:
         messages.error(request, 'Please search for trains first.')
         return redirect('booking:index')
@@ -44,12 +69,12 @@ def passenger_details(request):
                 valid_forms.append(form)
         
         if len(valid_forms) == passenger_count:
-            # Save passenger data in session
+            # Save passenger data in the wizard state
             passengers_data = []
             for form in valid_forms:
                 passengers_data.append(form.cleaned_data)
             
-            request.session['passengers_data'] = passengers_data
+            request.wizard['passengers_data'] = passengers_data
             return redirect('booking:train_results')
         else:
             messages.error(request, 'Please fill all passenger details correctly.')
@@ -65,94 +90,179 @@ def passenger_details(request):
     
     return render(request, 'booking/passenger_details.html', context)
 
+@use_replica
 def train_results(request):
     """Display available trains"""
-    search_data = request.session.get('search_data')
-    passengers_data = request.session.get('passengers_data')
+    search_data = request.wizard.get('search_data')
+    passengers_data = request.wizard.get('passengers_data')
     
     if not search_data or not passengers_data:
         messages.error(request, 'Please complete the search and passenger details first.')
         return redirect('booking:index')
     
-    # Get available trains (mock data for demo)
-    trains = Train.objects.all()[:3]  # Limit to 3 trains for demo
-    
-    # Get routes for pricing
-    routes = Route.objects.filter(
-        from_station__icontains=search_data['from_station'],
-        to_station__icontains=search_data['to_station']
+    seat_class = request.GET.get('seat_class')
+    trains, routes, itineraries, fare_table = search_cache.get_results(
+        search_data['from_station'],
+        search_data['to_station'],
+        search_data['travel_date'],
+        seat_class,
+        lambda: search_trains(search_data, seat_class)
     )
     
-    if not routes.exists():
-        # Create mock route data
-        for train in trains:
-            Route.objects.get_or_create(
-                train=train,
-                from_station=search_data['from_station'],
-                to_station=search_data['to_station'],
-                defaults={
-                    'distance': random.randint(200, 1500),
-                    'first_ac_price': random.randint(2500, 4000),
-                    'second_ac_price': random.randint(1800, 2500),
-                    'third_ac_price': random.randint(1200, 1800),
-                    'sleeper_price': random.randint(800, 1200),
-                    'general_price': random.randint(400, 800),
-                }
-            )
-        routes = Route.objects.filter(
-            from_station__icontains=search_data['from_station'],
-            to_station__icontains=search_data['to_station']
-        )
+    seats_left = inventory.seats_left(trains, search_data['travel_date'])
+    queues = waitlist.queues(trains, search_data['travel_date'])
+    add_class_options(routes, seats_left, queues, fare_table, search_data, passengers_data)
     
     context = {
         'trains': trains,
         'routes': routes,
+        'itineraries': itineraries,
         'search_data': search_data,
         'passengers_data': passengers_data,
     }
     
     return render(request, 'booking/train_results.html', context)
 
+def add_class_options(routes, seats_left, queues, fare_table, search_data, passengers_data):
+    """Availability (seats, RAC or waitlist) and the fare for the whole party in every class each route offers"""
+    totals = fare_table.totals(passengers_data, search_data.get('booking_type', 'regular'))
+    for route in routes:
+        left = seats_left.get(route.train_id, {})
+        route_queues = queues.get(route.train_id, {})
+        route.class_options = []
+        for code, label in seat_classes.catalogue():
+            if code not in left or code not in totals[route.id] or code not in route_queues:
+                continue
+            status = waitlist.status_for(left[code], route_queues[code], len(passengers_data))
+            route.class_options.append({
+                'code': code,
+                'label': label,
+                'seats_left': left[code],
+                'status': status,
+                'availability': waitlist.label(status, route_queues[code], left[code]),
+                'fare': totals[route.id][code],
+            })
+
+def search_trains(search_data, seat_class=None, create_mock_routes=True):
+    """Trains, routes, connecting journeys and the routes' fare table for a search, as cacheable values
+
+    Without ``create_mock_routes`` a pair with neither routes nor connections
+    gets no routes, and nothing is written.
+    """
+    # Get available trains (mock data for demo)
+    trains = Train.objects.all()
+    if seat_class:
+        trains = trains.filter(classes__seat_class=seat_class, classes__seats__gt=0)
+    trains = trains[:3]  # Limit to 3 trains for demo
+    
+    # Get routes for pricing
+    routes = stations.routes_between(search_data['from_station'], search_data['to_station'])
+    
+    wrote = False
+    if not routes.exists():
+        # No direct train, try journeys with one or two changes
+        itineraries = planner.plan(
+            stations.station_code(search_data['from_station']),
+            stations.station_code(search_data['to_station']),
+            search_data['travel_date']
+        )
+        if itineraries or not create_mock_routes:
+            return [], [], itineraries, fares.FareTable([])
+        
+        # Create mock route data
+        mock_prices = {
+            '1st-ac': (2500, 4000),
+            '2nd-ac': (1800, 2500),
+            '3rd-ac': (1200, 1800),
+            'sleeper': (800, 1200),
+            'general': (400, 800),
+        }
+        wrote = True
+        for train in trains:
+            route, created = Route.objects.get_or_create(
+                train=train,
+                from_station=search_data['from_station'],
+                to_station=search_data['to_station'],
+                defaults={'distance': random.randint(200, 1500)}
+            )
+            if created:
+                RouteFare.objects.bulk_create([
+                    RouteFare(route=route, seat_class=code, price=random.randint(low, high))
+                    for code, (low, high) in mock_prices.items()
+                ])
+    
+    # Routes just written on the primary may not have reached the replica yet
+    with primary() if wrote else nullcontext():
+        trains = list(trains)
+        routes = list(routes.select_related('train').prefetch_related('fares'))
+    return trains, routes, [], fares.FareTable(routes)
+
 @login_required
 def payment(request, train_id):
     """Payment processing"""
-    search_data = request.session.get('search_data')
-    passengers_data = request.session.get('passengers_data')
+    search_data = request.wizard.get('search_data')
+    passengers_data = request.wizard.get('passengers_data')
     
     if not search_data or not passengers_data:
         messages.error(request, 'Session expired. Please start booking again.')
         return redirect('booking:index')
     
     train = get_object_or_404(Train, id=train_id)
-    route = get_object_or_404(Route, 
-        train=train,
-        from_station__icontains=search_data['from_station'],
-        to_station__icontains=search_data['to_station']
+    route = get_object_or_404(
+        stations.routes_between(search_data['from_station'], search_data['to_station']).prefetch_related('fares'),
+        train=train
     )
     
     seat_class = request.GET.get('seat_class', 'general')
     
-    # Calculate price based on seat class
-    price_map = {
-        '1st-ac': route.first_ac_price,
-        '2nd-ac': route.second_ac_price,
-        '3rd-ac': route.third_ac_price,
-        'sleeper': route.sleeper_price,
-        'general': route.general_price,
-    }
+    # Calculate the fare with surcharges, concessions and taxes
+    fare_table = fares.FareTable([route])
+    base_price = fare_table.base_fare(route.id, seat_class)
+    if base_price is None or not inventory.class_capacity(train, seat_class):
+        messages.error(request, 'This class is not available on the selected train.')
+        return redirect('booking:train_results')
+    fare = fare_table.quote(
+        route.id, seat_class, passengers_data, search_data.get('booking_type', 'regular')
+    )
+    total_price = fare['total']
     
-    base_price = price_map.get(seat_class, route.general_price)
-    total_price = base_price * len(passengers_data)
+    free = inventory.class_free_seats(train, search_data['travel_date'], seat_class)
+    class_queue = waitlist.queues([train], search_data['travel_date'])[train.id][seat_class]
+    availability = waitlist.status_for(free, class_queue, len(passengers_data))
+    if availability is None:
+        messages.error(request, 'This class is full and its waitlist is closed.')
+        return redirect('booking:train_results')
     
     if request.method == 'POST':
         form = PaymentForm(request.POST)
-        if form.is_valid():
-            # Store payment data in session
-            request.session['payment_data'] = {
+        if form.is_valid() and availability != 'available':
+            # No seats to choose: the booking joins the RAC or waitlist queue
+            booking = join_waitlist(
+                request, train, route, seat_class, form.cleaned_data['payment_method'], total_price
+            )
+            if booking:
+                request.wizard.clear()
+                return redirect('booking:e_ticket', booking_id=booking.booking_id)
+        elif form.is_valid():
+            # Hold seats for the party so nobody else takes them while they choose;
+            # paying again (back button, other class) replaces the earlier hold
+            try:
+                hold_key = holds.grant(
+                    request.user, train, search_data['travel_date'], seat_class, len(passengers_data),
+                    replaces=(request.wizard.get('payment_data') or {}).get('hold_key')
+                )
+            except inventory.SeatUnavailable as e:
+                messages.error(request, str(e))
+                return redirect('booking:train_results')
+            
+            # Store payment data in the wizard state
+            request.wizard['payment_data'] = {
                 'train_id': train_id,
                 'seat_class': seat_class,
                 'total_price': float(total_price),
-                'payment_method': form.cleaned_data['payment_method']
+                'payment_method': form.cleaned_data['payment_method'],
+                'idempotency_key': idempotency.new_key(),
+                'hold_key': hold_key,
             }
             return redirect('booking:seat_selection', train_id=train_id)
     else:
@@ -164,7 +274,11 @@ def payment(request, train_id):
         'route': route,
         'seat_class': seat_class,
         'base_price': base_price,
+        'fare': fare,
         'total_price': total_price,
+        'availability': availability,
+        'availability_label': waitlist.label(availability, class_queue, free),
+        'idempotency_key': idempotency.new_key(),
         'search_data': search_data,
         'passengers_data': passengers_data,
     }
@@ -174,49 +288,64 @@ def payment(request, train_id):
 @login_required
 def seat_selection(request, train_id):
     """Seat selection page"""
-    search_data = request.session.get('search_data')
-    passengers_data = request.session.get('passengers_data')
-    payment_data = request.session.get('payment_data')
+    idempotency_key = idempotency.from_request(request) if request.method == 'POST' else None
+    if idempotency_key:
+        # A double submit or retry of a confirmed booking gets the original back
+        booking_id = idempotency.replayed(request.user, idempotency_key)
+        if booking_id:
+            return redirect('booking:e_ticket', booking_id=booking_id)
+    
+    search_data = request.wizard.get('search_data')
+    passengers_data = request.wizard.get('passengers_data')
+    payment_data = request.wizard.get('payment_data')
     
     if not all([search_data, passengers_data, payment_data]):
         messages.error(request, 'Session expired. Please start booking again.')
         return redirect('booking:index')
     
     train = get_object_or_404(Train, id=train_id)
+    seat_class = payment_data['seat_class']
     
-    # Generate mock seat layout
-    seats = []
-    for row in range(1, 6):
-        for seat_letter in ['A', 'B', 'C', 'D', 'E', 'F']:
-            seat_id = f"{row}{seat_letter}"
-            seat_type = 'window' if seat_letter in ['A', 'F'] else ('aisle' if seat_letter in ['C', 'D'] else 'middle')
-            status = 'occupied' if random.random() < 0.3 else 'available'
-            seats.append({
-                'id': seat_id,
-                'number': seat_id,
-                'type': seat_type,
-                'status': status,
-                'row': row
-            })
+    coaches = [coach for coach, capacity in inventory.coaches_for(train, seat_class, search_data['travel_date'])]
+    if not coaches:
+        messages.error(request, 'This class is not available on the selected train.')
+        return redirect('booking:train_results')
+    
+    hold = list(holds.active(payment_data.get('hold_key'), request.user).values_list('coach', 'expires_at'))
+    
+    coach = request.POST.get('coach') or request.GET.get('coach')
+    if coach not in coaches:
+        # Open the coach the held seats are in
+        coach = hold[0][0] if hold else coaches[0]
     
     if request.method == 'POST':
-        selected_seats = request.POST.getlist('selected_seats')
+        selected_seats = parse_selected_seats(request.POST.getlist('selected_seats'))
         if len(selected_seats) == len(passengers_data):
             # Create booking
-            booking = create_booking(request, train, selected_seats)
+            booking = create_booking(
+                request, train, coach, selected_seats,
+                idempotency_key or payment_data.get('idempotency_key'),
+            )
             if booking:
-                # Clear session data
-                for key in ['search_data', 'passengers_data', 'payment_data']:
-                    if key in request.session:
-                        del request.session[key]
+                # Clear wizard data
+                request.wizard.clear()
                 
                 return redirect('booking:e_ticket', booking_id=booking.booking_id)
         else:
             messages.error(request, f'Please select {len(passengers_data)} seats.')
     
+    holds.reap_if_due()
+    seat_inventory = inventory.get_inventory(train, search_data['travel_date'], seat_class, coach)
+    held, mine = holds.held_seats(train, search_data['travel_date'], seat_class, coach, payment_data.get('hold_key'))
+    
     context = {
         'train': train,
-        'seats': seats,
+        'seats': inventory.seat_map(seat_inventory, held, mine),
+        'seat_map_version': seat_inventory.version,
+        'seat_map_url': reverse('booking:seat_map', args=[train.id, search_data['travel_date'], seat_class, coach]),
+        'hold_expires_at': hold[0][1] if hold else None,
+        'coach': coach,
+        'coaches': coaches,
         'search_data': search_data,
         'passengers_data': passengers_data,
         'payment_data': payment_data,
@@ -225,75 +354,186 @@ def seat_selection(request, train_id):
     
     return render(request, 'booking/seat_selection.html', context)
 
-def create_booking(request, train, selected_seats):
+def coach_layout(request, name):
+    """A coach layout as JSON; layouts only change with a deploy, so clients keep them"""
+    try:
+        layout = layouts.get(name)
+    except KeyError:
+        raise Http404('No such coach layout.')
+    response = HttpResponse(layout.json, content_type='application/json')
+    response['ETag'] = layout.etag
+    patch_cache_control(response, public=True, max_age=24 * 60 * 60)
+    return get_conditional_response(request, etag=layout.etag, response=response)
+
+def seat_map_json(request, train_id, travel_date, seat_class, coach=None):
+    """Occupancy of a coach (by default the class's first) as JSON; ``?since=<version>`` returns only what changed after it
+    
+    Polls of a coach that has not changed, or changed a little, are answered
+    from the cache (see booking.seat_maps), after one version read when the
+    cache is per-process; the database is read for the first load and
+    whenever the cache cannot tell.
+    """
+    try:
+        travel_date = date.fromisoformat(travel_date)
+    except ValueError:
+        raise Http404('Invalid travel date.')
+    key = seat_maps.coach_key(train_id, travel_date, seat_class, coach)
+    since = request.GET.get('since', '')
+    since = int(since) if since.isdigit() else None
+    
+    version = None
+    if coach:
+        version = seat_maps.current_version(key, lambda: _stored_version(train_id, travel_date, seat_class, coach))
+    if version is not None:
+        not_modified = get_conditional_response(request, etag=seat_maps.etag(version))
+        if since == version or not_modified:
+            not_modified = not_modified or HttpResponseNotModified()
+            not_modified['ETag'] = seat_maps.etag(version)
+            return not_modified
+        diff = seat_maps.changes(key, since, version) if since is not None else None
+        if diff is not None:
+            return seat_map_response({'coach': coach, 'full': False, 'since': since, 'version': version, **diff})
+    
+    train = get_object_or_404(Train, id=train_id)
+    coaches = dict(inventory.coaches_for(train, seat_class, travel_date))
+    coach = coach or next(iter(coaches), None)
+    if coach not in coaches:
+        raise Http404('No such coach.')
+    key = seat_maps.coach_key(train_id, travel_date, seat_class, coach)
+    seat_inventory = SeatInventory.objects.filter(
+        train=train, travel_date=travel_date, seat_class=seat_class, coach=coach
+    ).first()
+    layout = layouts.get(seat_inventory.layout) if seat_inventory else layouts.for_class(seat_class)
+    version = seat_inventory.version if seat_inventory else 0
+    
+    payment_data = request.wizard.get('payment_data') or {}
+    hold_key = payment_data.get('hold_key') if request.user.is_authenticated else None
+    held, mine = holds.held_seats(train, travel_date, seat_class, coach, hold_key)
+    seat_maps.remember(key, version)
+    return seat_map_response({
+        'coach': coach,
+        'coaches': list(coaches),
+        'layout': layout.name,
+        'capacity': seat_inventory.capacity if seat_inventory else coaches[coach],
+        'full': True,
+        'version': version,
+        'taken': inventory.taken(seat_inventory) if seat_inventory else [],
+        'held': sorted(layout.index[number] for number in held if number in layout.index),
+        'mine': sorted(layout.index[number] for number in mine if number in layout.index),
+    })
+
+def _stored_version(train_id, travel_date, seat_class, coach):
+    return SeatInventory.objects.filter(
+        train_id=train_id, travel_date=travel_date, seat_class=seat_class, coach=coach
+    ).values_list('version', flat=True).first() or 0
+
+def seat_map_response(data):
+    response = JsonResponse(data)
+    response['ETag'] = seat_maps.etag(data['version'])
+    # Occupancy changes all the time: always revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def parse_selected_seats(values):
+    """Flatten comma separated seat ids posted by the seat map, keeping order"""
+    selected_seats = []
+    for value in values:
+        for seat_id in value.split(','):
+            seat_id = seat_id.strip().upper()
+            if seat_id and seat_id not in selected_seats:
+                selected_seats.append(seat_id)
+    return selected_seats
+
+def create_booking(request, train, coach, selected_seats, idempotency_key=None):
     """Helper function to create booking"""
     try:
-        search_data = request.session.get('search_data')
-        passengers_data = request.session.get('passengers_data')
-        payment_data = request.session.get('payment_data')
+        search_data = request.wizard.get('search_data')
+        passengers_data = request.wizard.get('passengers_data')
+        payment_data = request.wizard.get('payment_data')
         
         # Get route
-        route = Route.objects.get(
-            train=train,
-            from_station__icontains=search_data['from_station'],
-            to_station__icontains=search_data['to_station']
-        )
+        route = stations.routes_between(
+            search_data['from_station'], search_data['to_station']
+        ).get(train=train)
         
-        # Create booking
-        booking = Booking.objects.create(
-            booking_id=f"TKT{uuid.uuid4().hex[:8].upper()}",
+        return services.create_booking(
             user=request.user,
             train=train,
             route=route,
             travel_date=search_data['travel_date'],
             seat_class=payment_data['seat_class'],
             booking_type=search_data['booking_type'],
-            total_amount=payment_data['total_price'],
-            status='confirmed'
-        )
-        
-        # Create passengers and seats
-        for i, (passenger_data, seat_id) in enumerate(zip(passengers_data, selected_seats)):
-            passenger = Passenger.objects.create(**passenger_data)
-            booking.passengers.add(passenger)
-            
-            Seat.objects.create(
-                booking=booking,
-                seat_number=seat_id,
-                coach='A1',
-                seat_type='window' if seat_id[-1] in ['A', 'F'] else 'middle',
-                passenger=passenger
-            )
-        
-        # Create payment record
-        Payment.objects.create(
-            booking=booking,
-            amount=payment_data['total_price'],
+            coach=coach,
+            selected_seats=selected_seats,
+            passengers_data=passengers_data,
             payment_method=payment_data['payment_method'],
-            transaction_id=f"TXN{uuid.uuid4().hex[:10].upper()}",
-            status='completed'
+            total_amount=payment_data['total_price'],
+            idempotency_key=idempotency_key,
+            hold_key=payment_data.get('hold_key'),
         )
         
-        return booking
-        
     except Exception as e:
+        # A concurrent request with the same key may have committed first
+        booking_id = idempotency_key and idempotency.replayed(request.user, idempotency_key)
+        if booking_id:
+            return Booking.objects.get(booking_id=booking_id)
+        messages.error(request, f'Booking failed: {str(e)}')
+        return None
+
+def join_waitlist(request, train, route, seat_class, payment_method, total_amount):
+    """Helper function to book a full class onto its RAC or waitlist queue"""
+    idempotency_key = idempotency.from_request(request)
+    booking_id = idempotency_key and idempotency.replayed(request.user, idempotency_key)
+    if booking_id:
+        return Booking.objects.get(booking_id=booking_id)
+    
+    search_data = request.wizard.get('search_data')
+    try:
+        return services.join_waitlist(
+            user=request.user,
+            train=train,
+            route=route,
+            travel_date=search_data['travel_date'],
+            seat_class=seat_class,
+            booking_type=search_data['booking_type'],
+            passengers_data=request.wizard.get('passengers_data'),
+            payment_method=payment_method,
+            total_amount=total_amount,
+            idempotency_key=idempotency_key,
+        )
+    except inventory.SeatUnavailable as e:
         messages.error(request, f'Booking failed: {str(e)}')
         return None
 
 @login_required
+@use_replica
 def e_ticket(request, booking_id):
     """Display e-ticket"""
-    booking = get_object_or_404(Booking, booking_id=booking_id, user=request.user)
-    
-    context = {
-        'booking': booking,
-        'passengers': booking.passengers.all(),
-        'seats': booking.seats.all(),
-        'payment': booking.payment,
-    }
-    
-    return render(request, 'booking/e_ticket.html', context)
+    as_pdf = request.GET.get('format') == 'pdf'
+    if not as_pdf and len(messages.get_messages(request)):
+        # The stored page has no room for flash messages, render this one live
+        booking = get_object_or_404(Booking, booking_id=booking_id, user=request.user)
+        return render(request, 'booking/e_ticket.html', tickets.ticket_context(booking))
+    
+    ticket = tickets.get_ticket(booking_id, request.user, pdf=as_pdf)
+    if ticket is None or (as_pdf and not ticket.pdf):
+        raise Http404('No e-ticket found.')
+    
+    if as_pdf:
+        response = HttpResponse(bytes(ticket.pdf), content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="{booking_id}.pdf"'
+        response['ETag'] = ticket.etag('-pdf')
+    else:
+        response = HttpResponse(ticket.html)
+        response['ETag'] = ticket.etag()
+    response['Last-Modified'] = http_date(ticket.rendered_at.timestamp())
+    # Browsers keep the ticket but revalidate it, so cancellations show up at once
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(
+        request, etag=response['ETag'], last_modified=int(ticket.rendered_at.timestamp()), response=response
+    )
 
+@use_replica
 def pnr_status(request):
     """PNR status check"""
     form = PNRStatusForm()
@@ -303,9 +543,8 @@ def pnr_status(request):
         form = PNRStatusForm(request.POST)
         if form.is_valid():
             pnr = form.cleaned_data['pnr']
-            try:
-                booking = Booking.objects.get(pnr=pnr)
-            except Booking.DoesNotExist:
+            booking = pnr_cache.get_snapshot(pnr)
+            if booking is None:
                 messages.error(request, 'PNR not found.')
     
     context = {
@@ -315,8 +554,8 @@ def pnr_status(request):
     
     if booking:
         context.update({
-            'passengers': booking.passengers.all(),
-            'seats': booking.seats.all(),
+            'passengers': booking['passengers'],
+            'seats': booking['seats'],
         })
     
     return render(request, 'booking/pnr_status.html', context)
@@ -326,28 +565,18 @@ def train_status(request):
     form = TrainStatusForm()
     train_data = None
     
-    if request.method == 'POST':
-        form = TrainStatusForm(request.POST)
+    if request.method == 'POST' or 'query' in request.GET:
+        form = TrainStatusForm(request.POST if request.method == 'POST' else request.GET)
         if form.is_valid():
-            query = form.cleaned_data['query']
-            # Mock train status data
-            train_data = {
-                'name': 'Rajdhani Express',
-                'number': '12001',
-                'date': datetime.now().strftime('%d %b %Y'),
-                'status': 'Running On Time',
-                'current_station': 'Mathura Junction',
-                'next_station': 'Agra Cantt',
-                'delay': 0,
-                'stations': [
-                    {'name': 'New Delhi', 'code': 'NDLS', 'arrival': 'Source', 'departure': '06:00', 'distance': '0 km', 'status': 'completed'},
-                    {'name': 'Mathura Junction', 'code': 'MTJ', 'arrival': '07:45', 'departure': '07:47', 'distance': '145 km', 'status': 'current'},
-                    {'name': 'Agra Cantt', 'code': 'AGC', 'arrival': '08:30', 'departure': '08:32', 'distance': '200 km', 'status': 'upcoming'},
-                    {'name': 'Jhansi Junction', 'code': 'JHS', 'arrival': '10:15', 'departure': '10:20', 'distance': '415 km', 'status': 'upcoming'},
-                    {'name': 'Bhopal Junction', 'code': 'BPL', 'arrival': '12:30', 'departure': '12:35', 'distance': '680 km', 'status': 'upcoming'},
-                    {'name': 'Mumbai Central', 'code': 'BCT', 'arrival': '14:30', 'departure': 'Destination', 'distance': '1384 km', 'status': 'upcoming'},
-                ]
-            }
+            query = form.cleaned_data['query'].strip().upper()
+            # Accept a PNR as well as a train number
+            snapshot = pnr_cache.get_snapshot(query) if query.startswith('PNR') else None
+            train_number = snapshot['train']['number'] if snapshot else query
+            state = running_status.get_state(train_number)
+            if state:
+                train_data = running_status.position(state)
+            else:
+                messages.info(request, 'No running status is available for this train yet.')
     
     context = {
         'form': form,
@@ -356,6 +585,43 @@ def train_status(request):
     
     return render(request, 'booking/train_status.html', context)
 
+def train_status_stream(request, train_number):
+    """Server-sent events with the live position of a train
+    
+    A streaming response holds a WSGI worker thread for as long as it is
+    open, so this answers one poll: the current position and a ``retry``
+    telling the browser to reconnect after RUNNING_STATUS_STREAM_INTERVAL.
+    Under ASGI booking.async_views keeps the stream open instead.
+    """
+    interval = settings.RUNNING_STATUS_STREAM_INTERVAL
+    state = running_status.get_state(train_number)
+    data = running_status.position(state) if state else None
+    
+    response = HttpResponse(
+        f'retry: {interval * 1000}\n\n' + running_status.encode_event(data), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def running_status_ingest(request):
+    """Bulk position/delay updates from the running-status feed"""
+    token = settings.RUNNING_STATUS_INGEST_TOKEN
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return JsonResponse({'error': 'Invalid or missing ingest token.'}, status=403)
+    try:
+        payload = json.loads(request.body)
+        updates = payload['updates']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with an "updates" list.'}, status=400)
+    if not isinstance(updates, list):
+        return JsonResponse({'error': 'Expected a JSON object with an "updates" list.'}, status=400)
+    
+    accepted, rejected = running_status.ingest(updates)
+    return JsonResponse({'accepted': accepted, 'rejected': rejected})
+
 @login_required
 def cancellation(request):
     """Ticket cancellation"""
@@ -376,13 +642,7 @@ def cancellation(request):
             booking_id = request.POST.get('booking_id')
             try:
                 booking = Booking.objects.get(booking_id=booking_id, user=request.user)
-                booking.status = 'cancelled'
-                booking.save()
-                
-                # Update payment status
-                if hasattr(booking, 'payment'):
-                    booking.payment.status = 'refunded'
-                    booking.payment.save()
+                services.cancel_booking(booking)
                 
                 messages.success(request, f'Booking cancelled successfully. Refund will be processed within 5-7 business days.')
                 booking = None
@@ -403,16 +663,33 @@ def cancellation(request):
     return render(request, 'booking/cancellation.html', context)
 
 @login_required
+@use_replica
 def my_bookings(request):
     """User's booking history"""
-    bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
-    
-    paginator = Paginator(bookings, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    bookings = Booking.objects.filter(user=request.user).select_related('train', 'route')
+    
+    form = BookingFilterForm(request.GET or None)
+    filters = {}
+    if form.is_valid():
+        filters = form.cleaned_data
+        if filters['status']:
+            bookings = bookings.filter(status=filters['status'])
+        if filters['travel_date_from']:
+            bookings = bookings.filter(travel_date__gte=filters['travel_date_from'])
+        if filters['travel_date_to']:
+            bookings = bookings.filter(travel_date__lte=filters['travel_date_to'])
+    
+    page_obj = KeysetPage(
+        bookings,
+        per_page=10,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        params=filters
+    )
     
     context = {
         'page_obj': page_obj,
+        'filter_form': form,
     }
     
     return render(request, 'booking/my_bookings.html', context)
\ No newline at end of file
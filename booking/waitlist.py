@@ -0,0 +1,250 @@
+"""RAC and waitlist queues, promoted automatically as seats free up.
+
+A booking made when its class is full joins the queue of its train run and
+class instead of failing. It gets RAC (a side berth shared by two
+passengers) while the class's RAC berths last, and is waitlisted after that
+up to the class's waitlist limit. Bookings move through the queue whole and
+in booking order, so a party is never split across seats and berths, and
+every RAC booking is older than every waitlisted one.
+
+The queues live in the booking_waitlist_idx index, keyed by train run,
+class, status and booking id: the head of the RAC or waitlist queue is a
+seek plus a short range scan whatever the queue's length, and joining or
+leaving a queue is one index update. Their lengths in passengers are kept
+on the run's ClassSeatCount row (see booking.seat_calendar), moved in the
+same transaction as every status change, so no read sums a queue.
+``promote`` runs in the transaction that freed the seats. It reads the free
+seats and the heads of the queues once, claims seats for as many leading
+bookings as fit, writes them with bulk INSERTs and UPDATEs, then moves
+waitlisted bookings up into the RAC berths that were vacated.
+"""
+from collections import defaultdict
+
+from django.utils import timezone
+
+from . import inventory, pnr_cache, seat_calendar
+from .models import Booking, ClassSeatCount, Seat, TicketArtifact, TrainClass
+
+# Passengers sharing one RAC berth
+RAC_PER_BERTH = 2
+
+
+def queue(train, travel_date, seat_class):
+    """Queued bookings of a train run and class, head first"""
+    return Booking.objects.filter(
+        train=train, travel_date=travel_date, seat_class=seat_class, status__in=Booking.QUEUED_STATUSES
+    ).order_by('id')
+
+
+def head(train, travel_date, seat_class, status):
+    """The RAC or the waitlist queue of a train run and class, head first
+
+    One status at a time so the database reads the queue in index order
+    instead of sorting it.
+    """
+    return Booking.objects.filter(
+        train=train, travel_date=travel_date, seat_class=seat_class, status=status
+    ).order_by('id')
+
+
+def _queued_rows(trains, travel_date):
+    return ClassSeatCount.objects.filter(train__in=trains, travel_date=travel_date).values_list(
+        'train_id', 'seat_class', 'rac', 'waitlisted'
+    )
+
+
+def _limit_rows(trains):
+    return TrainClass.objects.filter(train__in=trains).values_list(
+        'train_id', 'seat_class', 'rac_berths', 'waitlist_limit'
+    )
+
+
+def _build_queues(limit_rows, queued_rows):
+    queues = {}
+    for train_id, seat_class, rac_berths, waitlist_limit in limit_rows:
+        queues.setdefault(train_id, {})[seat_class] = {
+            'rac': 0, 'waitlisted': 0,
+            'rac_capacity': rac_berths * RAC_PER_BERTH, 'waitlist_limit': waitlist_limit,
+        }
+    for train_id, seat_class, rac, waitlisted in queued_rows:
+        if seat_class in queues.get(train_id, {}):
+            queues[train_id][seat_class].update(rac=rac, waitlisted=waitlisted)
+    return queues
+
+
+def queues(trains, travel_date):
+    """{train_id: {seat_class: queue}} for the classes the trains offer, in two queries
+
+    Each queue holds the passengers in RAC and on the waitlist and the
+    class's limits, as read by ``status_for``.
+    """
+    return _build_queues(list(_limit_rows(trains)), list(_queued_rows(trains, travel_date)))
+
+
+async def aqueues(trains, travel_date):
+    """queues for async views"""
+    limit_rows = [row async for row in _limit_rows(trains)]
+    queued_rows = [row async for row in _queued_rows(trains, travel_date)]
+    return _build_queues(limit_rows, queued_rows)
+
+
+def status_for(free, class_queue, party_size):
+    """Where a new party of ``party_size`` goes: 'available', 'rac', 'waitlisted' or None when full
+
+    Free seats go to the queue first, so a class with anyone queued is not
+    available even if a seat is momentarily free.
+    """
+    rac, waitlisted = class_queue['rac'], class_queue['waitlisted']
+    if not rac and not waitlisted and free >= party_size:
+        return 'available'
+    if not waitlisted and rac + party_size <= class_queue['rac_capacity']:
+        return 'rac'
+    if waitlisted + party_size <= class_queue['waitlist_limit']:
+        return 'waitlisted'
+    return None
+
+
+def label(status, class_queue, free):
+    """Availability as shown on search results, e.g. 'AVAILABLE 12', 'RAC 3', 'WL 7' or 'REGRET'"""
+    if status == 'available':
+        return f'AVAILABLE {free}'
+    if status == 'rac':
+        return f"RAC {class_queue['rac'] + 1}"
+    if status == 'waitlisted':
+        return f"WL {class_queue['waitlisted'] + 1}"
+    return 'REGRET'
+
+
+def _lock_class(train, seat_class):
+    # Serializes queue changes of a class; SQLite serializes writers anyway
+    return TrainClass.objects.select_for_update().filter(train=train, seat_class=seat_class).first()
+
+
+def _class_queue(train_class, travel_date):
+    queued = ClassSeatCount.objects.filter(
+        train_id=train_class.train_id, travel_date=travel_date, seat_class=train_class.seat_class
+    ).values_list('rac', 'waitlisted').first() or (0, 0)
+    return {
+        'rac': queued[0], 'waitlisted': queued[1],
+        'rac_capacity': train_class.rac_berths * RAC_PER_BERTH,
+        'waitlist_limit': train_class.waitlist_limit,
+    }
+
+
+def join(train, travel_date, seat_class, party_size):
+    """Queue status for a new party, 'rac' or 'waitlisted'; call inside the booking's transaction
+
+    Raises SeatUnavailable if seats are free for the party (it should book
+    them) or the waitlist is full.
+    """
+    train_class = _lock_class(train, seat_class)
+    if train_class is None:
+        raise inventory.SeatUnavailable('This class is not available on the selected train.')
+    free = inventory.class_free_seats(train, travel_date, seat_class)
+    status = status_for(free, _class_queue(train_class, travel_date), party_size)
+    if status == 'available':
+        raise inventory.SeatUnavailable('Seats are available in this class; please select them.')
+    if status is None:
+        raise inventory.SeatUnavailable('The waitlist for this class is full.')
+    return status
+
+
+def _assign_seats(train, travel_date, seat_class, leading):
+    """Claim seats for the bookings of ``leading`` that fit, in order; returns their ids"""
+    allocated = inventory.allocate_seats(train, travel_date, seat_class, sum(size for _, size, _ in leading))
+    BookingPassenger = Booking.passengers.through
+    passengers = defaultdict(list)
+    for booking_id, passenger_id in BookingPassenger.objects.filter(
+        booking_id__in=[booking_id for booking_id, _, _ in leading]
+    ).order_by('id').values_list('booking_id', 'passenger_id'):
+        passengers[booking_id].append(passenger_id)
+
+    seats, promoted = [], []
+    for booking_id, party_size, _ in leading:
+        if len(allocated) < party_size:
+            break
+        taken, allocated = allocated[:party_size], allocated[party_size:]
+        seats.extend(
+            Seat(
+                booking_id=booking_id,
+                coach=coach,
+                seat_number=number,
+                seat_type=inventory.seat_type(seat_class, number),
+                passenger_id=passenger_id
+            )
+            for (coach, number), passenger_id in zip(taken, passengers[booking_id])
+        )
+        promoted.append(booking_id)
+
+    # A concurrent booking took some of the seats: return what no whole party can use
+    by_coach = defaultdict(list)
+    for coach, number in allocated:
+        by_coach[coach].append(number)
+    for coach, numbers in by_coach.items():
+        inventory.release_seats(train, travel_date, seat_class, coach, numbers)
+
+    Seat.objects.bulk_create(seats)
+    return promoted
+
+
+def promote(train, travel_date, seat_class):
+    """Confirm queued bookings in order while they fit in the free seats, then refill RAC
+
+    Call inside the transaction that freed the seats. Returns the ids of the
+    bookings that were confirmed.
+    """
+    train_class = _lock_class(train, seat_class)
+    if train_class is None:
+        return []
+    class_queue = _class_queue(train_class, travel_date)
+    if not class_queue['rac'] and not class_queue['waitlisted']:
+        return []
+
+    free = inventory.class_free_seats(train, travel_date, seat_class)
+    # RAC before the waitlist; every party has at least one passenger, so no
+    # more than the number of free seats can fit
+    leading, wanted, blocked = [], 0, False
+    for status in Booking.QUEUED_STATUSES:
+        if blocked or wanted >= free:
+            break
+        if not class_queue[status]:
+            continue
+        rows = head(train, travel_date, seat_class, status).values_list('id', 'party_size')[:free - wanted]
+        for booking_id, party_size in rows:
+            if wanted + party_size > free:
+                # A party that does not fit holds up everyone behind it
+                blocked = True
+                break
+            leading.append((booking_id, party_size, status))
+            wanted += party_size
+
+    promoted = _assign_seats(train, travel_date, seat_class, leading) if leading else []
+    now = timezone.now()
+    left = {status: 0 for status in Booking.QUEUED_STATUSES}
+    if promoted:
+        Booking.objects.filter(pk__in=promoted).update(status='confirmed', updated_at=now)
+        for booking_id, party_size, status in leading[:len(promoted)]:
+            class_queue[status] -= party_size
+            left[status] -= party_size
+
+    # Waitlisted bookings take the RAC berths left over, oldest first
+    room = class_queue['rac_capacity'] - class_queue['rac']
+    moved = []
+    if room > 0 and class_queue['waitlisted']:
+        rows = head(train, travel_date, seat_class, 'waitlisted').values_list('id', 'party_size')[:room]
+        for booking_id, party_size in rows:
+            if party_size > room:
+                break
+            moved.append(booking_id)
+            room -= party_size
+            left['waitlisted'] -= party_size
+            left['rac'] += party_size
+        Booking.objects.filter(pk__in=moved).update(status='rac', updated_at=now)
+    seat_calendar.record_queue(train, travel_date, seat_class, **left)
+
+    changed = promoted + moved
+    if changed:
+        # Stored e-tickets show the old status; they are rendered again on their next view
+        TicketArtifact.objects.filter(booking_id__in=changed).delete()
+        pnr_cache.evict(*Booking.objects.filter(pk__in=changed).values_list('pnr', flat=True))
+    return promoted
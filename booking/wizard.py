@@ -0,0 +1,211 @@
+"""State of the booking wizard (search -> passengers -> payment -> seats).
+
+The funnel used to keep its steps in the database-backed session, which
+rewrote the django_session row on every page. WizardMiddleware instead gives
+each request a ``request.wizard`` mapping that is loaded only when a view
+touches it and saved only when a step actually changed it, in one of two
+stores selected by ``BOOKING_WIZARD_STORE``:
+
+* ``'cache'`` (default): the state lives in the cache under a random id
+  kept in a signed cookie, and expires after ``BOOKING_WIZARD_TIMEOUT``.
+* ``'cookie'``: the whole state travels in a signed, compressed cookie.
+
+States are serialized as a version tag followed by compact JSON arrays in a
+fixed field order, so an old or foreign payload is simply discarded.
+"""
+import json
+import secrets
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+VERSION = 1
+COOKIE_NAME = 'rb_wizard'
+COOKIE_SALT = 'booking.wizard'
+
+# Field order of the compact encoding; extra keys are kept in a trailing dict
+SCHEMA = {
+    'search_data': ('from_station', 'to_station', 'travel_date', 'passengers', 'booking_type'),
+    'passengers_data': ('name', 'age', 'gender', 'id_proof'),
+    'payment_data': ('train_id', 'seat_class', 'total_price', 'payment_method'),
+}
+
+
+def _pack(record, fields):
+    packed = [record.get(field) for field in fields]
+    extra = {key: value for key, value in record.items() if key not in fields}
+    if extra:
+        packed.append(extra)
+    return packed
+
+
+def _unpack(packed, fields):
+    record = dict(zip(fields, packed))
+    if len(packed) > len(fields):
+        record.update(packed[len(fields)])
+    return record
+
+
+def encode(data):
+    payload = []
+    for key, fields in SCHEMA.items():
+        value = data.get(key)
+        if value is None:
+            payload.append(None)
+        elif key == 'passengers_data':
+            payload.append([_pack(passenger, fields) for passenger in value])
+        else:
+            payload.append(_pack(value, fields))
+    return f'{VERSION}|' + json.dumps(payload, separators=(',', ':'))
+
+
+def decode(raw):
+    """Rebuild a state dict, or return {} for anything unreadable or outdated"""
+    try:
+        version, body = raw.split('|', 1)
+        if int(version) != VERSION:
+            return {}
+        payload = json.loads(body)
+    except (AttributeError, ValueError):
+        return {}
+    data = {}
+    for (key, fields), value in zip(SCHEMA.items(), payload):
+        if value is None:
+            continue
+        if key == 'passengers_data':
+            data[key] = [_unpack(passenger, fields) for passenger in value]
+        else:
+            data[key] = _unpack(value, fields)
+    return data
+
+
+def _timeout():
+    return getattr(settings, 'BOOKING_WIZARD_TIMEOUT', 30 * 60)
+
+
+class CacheStore:
+    def _cache(self):
+        return caches[getattr(settings, 'BOOKING_WIZARD_CACHE_ALIAS', 'default')]
+
+    def load(self, request):
+        wizard_id = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        if not wizard_id:
+            return {}
+        raw = self._cache().get(f'wizard:{wizard_id}')
+        return decode(raw) if raw else {}
+
+    def save(self, request, response, data):
+        wizard_id = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        if not data:
+            if wizard_id:
+                self._cache().delete(f'wizard:{wizard_id}')
+            return
+        if not wizard_id:
+            wizard_id = secrets.token_urlsafe(18)
+            response.set_signed_cookie(
+                COOKIE_NAME, wizard_id, salt=COOKIE_SALT,
+                max_age=_timeout(), httponly=True, samesite='Lax',
+                secure=request.is_secure(),
+            )
+        self._cache().set(f'wizard:{wizard_id}', encode(data), _timeout())
+
+
+class CookieStore:
+    def load(self, request):
+        try:
+            raw = signing.loads(
+                request.COOKIES.get(COOKIE_NAME, ''), salt=COOKIE_SALT, max_age=_timeout()
+            )
+        except signing.BadSignature:
+            return {}
+        return decode(raw)
+
+    def save(self, request, response, data):
+        if not data:
+            response.delete_cookie(COOKIE_NAME)
+            return
+        response.set_cookie(
+            COOKIE_NAME, signing.dumps(encode(data), salt=COOKIE_SALT, compress=True),
+            max_age=_timeout(), httponly=True, samesite='Lax', secure=request.is_secure(),
+        )
+
+
+STORES = {'cache': CacheStore, 'cookie': CookieStore}
+
+
+class WizardState:
+    """Dict-like wizard state that loads lazily and tracks whether it changed"""
+
+    def __init__(self, request, store):
+        self._request = request
+        self._store = store
+        self._data = None
+        self.modified = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._store.load(self._request)
+        return self._data
+
+    async def aload(self):
+        """Load the state off the event loop, so async views can then read it without blocking"""
+        if self._data is None:
+            self._data = await sync_to_async(self._store.load)(self._request)
+        return self._data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __setitem__(self, key, value):
+        if self.data.get(key) != value:
+            self.data[key] = value
+            self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def clear(self):
+        if self.data:
+            self._data = {}
+            self.modified = True
+
+    def persist(self, response):
+        if self.modified:
+            self._store.save(self._request, response, self._data)
+            self.modified = False
+
+
+class WizardMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.store = STORES[getattr(settings, 'BOOKING_WIZARD_STORE', 'cache')]()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.wizard = WizardState(request, self.store)
+        response = self.get_response(request)
+        request.wizard.persist(response)
+        return response
+
+    async def __acall__(self, request):
+        request.wizard = WizardState(request, self.store)
+        response = await self.get_response(request)
+        if request.wizard.modified:
+            await sync_to_async(request.wizard.persist)(response)
+        return response
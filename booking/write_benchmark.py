@@ -0,0 +1,102 @@
+"""Multi-process write benchmark of the booking path on SQLite.
+
+Every worker process books through ``services.create_booking`` on a train of
+its own, one seat on a new travel date each time, so the workers compete for
+the database file rather than for seats. The same seeded database is run
+under each profile:
+
+* ``default``: SQLite as Django configures it out of the box (rollback
+  journal, five second busy timeout, no retries);
+* ``concurrent``: the profile from railbooker.sqlite (WAL, pragmas, the
+  configured busy timeout and retried write transactions).
+
+Used by the ``benchmark_writes`` management command.
+"""
+import multiprocessing
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from railbooker.sqlite import is_busy
+from . import benchmark, services
+from .models import Train, Route
+
+PROFILES = {
+    'default': {'settings': {'SQLITE_CONCURRENCY': False}, 'options': {}},
+    'concurrent': {'settings': {'SQLITE_CONCURRENCY': True}, 'options': None},
+}
+PASSENGER = {'name': 'Bench Passenger', 'age': 35, 'gender': 'Other', 'id_proof': 'BENCH'}
+
+
+def seed(workers):
+    """One train, route and user per worker"""
+    with override_settings(SQLITE_CONCURRENCY=False):
+        benchmark.seed(trains=workers, routes_per_train=1, users=workers)
+    connection.close()
+
+
+def _worker(db_name, profile, number, bookings, barrier, results):
+    config = PROFILES[profile]
+    connection.close()
+    connection.settings_dict['NAME'] = db_name
+    if config['options'] is not None:
+        connection.settings_dict['OPTIONS'] = dict(config['options'])
+    with override_settings(**config['settings']):
+        train = Train.objects.order_by('id')[number]
+        route = Route.objects.filter(train=train).first()
+        user = User.objects.get(username=f'bench{number}')
+        first_date = date.today() + timedelta(days=1)
+        latencies, errors = [], {'locked': 0, 'other': 0}
+        barrier.wait()
+        started = time.monotonic()
+        for k in range(bookings):
+            begin = time.perf_counter()
+            try:
+                services.create_booking(
+                    user=user, train=train, route=route, travel_date=first_date + timedelta(days=k),
+                    seat_class='general', booking_type='regular', coach='D1', selected_seats=['1A'],
+                    passengers_data=[PASSENGER], payment_method='upi', total_amount=500,
+                )
+            except OperationalError as e:
+                errors['locked' if is_busy(e) else 'other'] += 1
+            except Exception:
+                errors['other'] += 1
+            else:
+                latencies.append(time.perf_counter() - begin)
+        finished = time.monotonic()
+    connection.close()
+    results.put({'started': started, 'finished': finished, 'latencies': latencies, 'errors': errors})
+
+
+def run(db_name, profile, workers=4, bookings=100):
+    """Book from ``workers`` processes at once against ``db_name``; returns a summary"""
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    connection.close()
+    processes = [
+        context.Process(target=_worker, args=(db_name, profile, number, bookings, barrier, results))
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for report in reports for latency in report['latencies']]
+    wall = max(report['finished'] for report in reports) - min(report['started'] for report in reports)
+    return {
+        'profile': profile,
+        'workers': workers,
+        'booked': len(latencies),
+        'locked_errors': sum(report['errors']['locked'] for report in reports),
+        'other_errors': sum(report['errors']['other'] for report in reports),
+        'wall_seconds': round(wall, 3),
+        'bookings_per_second': round(len(latencies) / wall, 1) if wall else 0.0,
+        'p50_ms': round(benchmark.percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(benchmark.percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+    }
@@ -0,0 +1,72 @@
+"""Cache backends selected by ``CACHE_URL``.
+
+Several modules use the cache to tell other processes about a change: the
+search cache generation, PNR evictions, the planner and station index
+versions, read-replica pins, the booking wizard state, seat map versions and
+the seat hold reaper's throttle. That only works when every worker and
+management command talks to the same cache, so ``CACHE_URL`` names a shared
+backend:
+
+* ``redis://host:6379/0`` (needs the redis package)
+* ``memcached://host:11211`` (needs pymemcache)
+* ``db://table``: DatabaseCache, one table per alias; create them with
+  ``manage.py createcachetable``
+* ``locmem://``: a LocMemCache per process, for runserver and tests only
+
+``check --deploy`` reports a per-process cache as an error.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'locmem': LOCMEM,
+}
+
+
+def cache_config(url, alias, max_entries=None):
+    """CACHES entry for ``alias`` on the backend named by ``url``"""
+    scheme, _, location = url.partition('://')
+    if scheme not in BACKENDS:
+        raise ImproperlyConfigured(f'Unsupported CACHE_URL scheme {scheme!r}.')
+    config = {'BACKEND': BACKENDS[scheme], 'KEY_PREFIX': alias}
+    if scheme in ('redis', 'rediss'):
+        config['LOCATION'] = url
+    elif scheme == 'db':
+        # Separate tables, so culling one alias never drops the other's entries
+        config['LOCATION'] = location if alias == 'default' else f'{location}_{alias}'
+    elif scheme == 'locmem':
+        config['LOCATION'] = f'railbooker-{alias}'
+    else:
+        config['LOCATION'] = location
+    # Redis and Memcached evict on their own
+    if max_entries and scheme in ('db', 'locmem'):
+        config['OPTIONS'] = {'MAX_ENTRIES': max_entries}
+    return config
+
+
+def is_shared_url(url):
+    return not url.startswith('locmem:')
+
+
+def is_shared(alias='default'):
+    """Whether every process sees the same entries in a cache alias"""
+    return settings.CACHES[alias]['BACKEND'] != LOCMEM
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    return [
+        checks.Error(
+            f'The {alias!r} cache is local to each process, so invalidations and '
+            'seat map, wizard and replica pin state are not seen by other workers.',
+            hint='Set CACHE_URL to a redis://, memcached:// or db:// backend.',
+            id='railbooker.E001',
+        )
+        for alias in settings.CACHES if not is_shared(alias)
+    ]
@@ -0,0 +1,150 @@
+"""Read replicas for read-heavy views.
+
+Views opt in with the ``use_replica`` decorator (admin changelists with
+``ReplicaAdminMixin``); while such a view runs, ReplicaRouter sends reads of
+the apps in ``REPLICA_APPS`` to one of the aliases listed in
+``DATABASE_REPLICAS``. Everything else, every write and any read made inside
+a transaction on the primary stays on ``default``.
+
+Replicas lag behind the primary, so a user who just booked or cancelled is
+pinned to the primary for ``DATABASE_REPLICA_PIN_SECONDS`` (see
+booking.signals) and sees their own writes at once. The pin lives in the
+default cache, which must therefore be shared between workers. Data cached
+from a replica read is kept no longer than the pin window either, see
+``cache_timeout``.
+
+Locally a second SQLite file can stand in for the replica: refresh the path
+in ``DATABASE_REPLICA_NAMES`` with ``sqlite3 db.sqlite3 "VACUUM INTO 'replica.sqlite3'"``
+(a plain file copy misses what is still in the WAL, see railbooker.sqlite).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Apps whose reads may be served by a replica; sessions and auth stay on the
+# primary so a fresh login is never lost to replication lag
+REPLICA_APPS = {'booking'}
+PIN_KEY = 'replica:pin:{}'
+
+_replica = ContextVar('replica', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+
+
+def pin(user_id):
+    """Send this user's reads to the primary until the replicas have caught up"""
+    if user_id and replicas():
+        cache.set(PIN_KEY.format(user_id), True, _pin_seconds())
+
+
+def pinned(user):
+    return bool(user.is_authenticated and cache.get(PIN_KEY.format(user.pk)))
+
+
+def current():
+    """Alias of the replica reads are going to, or None"""
+    return _replica.get()
+
+
+def cache_timeout(timeout):
+    """Cap the lifetime of data read from a replica so lag cannot outlive the pin window"""
+    return min(timeout, _pin_seconds()) if current() else timeout
+
+
+def choose_replica(request):
+    """A replica alias for the request's reads, or None if there is none or the user is pinned"""
+    choices = replicas()
+    return random.choice(choices) if choices and not pinned(request.user) else None
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads to ``alias`` (None for the primary) for the duration of the block"""
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+def reading_from_replica(request):
+    return reading_from(choose_replica(request))
+
+
+def primary():
+    """Read from the primary inside a replica view, e.g. before writing what was read"""
+    return reading_from(None)
+
+
+def use_replica(view):
+    """Serve the reads of a read-only view from a replica; its writes still go to the primary
+
+    Async views work too: the context variable holding the alias is copied
+    into the threads their ORM calls run in.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # Looking up the user and the pin touches the database and the cache
+            alias = await sync_to_async(choose_replica)(request)
+            with reading_from(alias):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading_from_replica(request):
+            response = view(request, *args, **kwargs)
+            # Template responses run their queries when rendered
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaAdminMixin:
+    """Serve a ModelAdmin's changelist pages from a replica
+
+    POSTs (actions and list_editable saves) stay on the primary.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method not in ('GET', 'HEAD'):
+            return super().changelist_view(request, extra_context)
+        return use_replica(super().changelist_view)(request, extra_context)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or model._meta.app_label not in REPLICA_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in replicas()
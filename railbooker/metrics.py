@@ -0,0 +1,250 @@
+"""Per-view request metrics in the Prometheus text format.
+
+MetricsMiddleware records, for every request, its latency, status, the
+number and total time of database queries (through an execute wrapper that
+``track_queries`` installs on every connection) and the time spent rendering
+templates (through the TimedDjangoTemplates backend). The request being
+timed is kept in a context variable, so queries and renders that async views
+hand off to worker threads are still counted against it. Everything is labelled with the resolved URL
+name and exposed by ``metrics_view``.
+
+Recording never takes a lock: each thread writes to its own shard of
+counters, and a scrape adds the shards up. When a thread ends its shard is
+folded into a shared one for finished threads, so thread-per-request
+servers keep a bounded number of shards. Counters are per process, so with
+several workers each one has to be scraped (or labelled by pid).
+
+The endpoint needs ``METRICS_TOKEN`` as a bearer token, or a staff login
+when no token is configured.
+"""
+import bisect
+import os
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.crypto import constant_time_compare
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+_local = threading.local()
+_timings = ContextVar('request_timings', default=None)
+_shards = []
+_shards_lock = threading.Lock()
+_collectors = []
+
+
+class _Shard:
+    """Counters written by a single thread"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        histogram[0][bisect.bisect_left(BUCKETS, value)] += 1
+        histogram[1] += value
+
+    def merge(self, other):
+        for (name, labels), value in other.counters.items():
+            self.inc(name, labels, value)
+        for key, (buckets, total) in other.histograms.items():
+            histogram = self.histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0])
+            for i, count in enumerate(buckets):
+                histogram[0][i] += count
+            histogram[1] += total
+
+
+# Counters of threads that have ended
+_finished = _Shard()
+_shards.append(_finished)
+
+
+def _retire(shard):
+    with _shards_lock:
+        _shards.remove(shard)
+        _finished.merge(shard)
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        # Only registration is locked, once per thread
+        with _shards_lock:
+            _shards.append(shard)
+        weakref.finalize(threading.current_thread(), _retire, shard)
+    return shard
+
+
+def register_collector(collector):
+    """Add a callable returning [(name, type, labels, value), ...] to every scrape"""
+    _collectors.append(collector)
+
+
+class _RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.query_seconds += time.perf_counter() - started
+        timings.queries += 1
+
+
+def track_queries(sender, connection, **kwargs):
+    """connection_created receiver counting the connection's queries against the current request"""
+    connection.execute_wrappers.append(_record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _timings.set(_RequestTimings())
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = _timings.get()
+            _timings.reset(token)
+        self.record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        token = _timings.set(_RequestTimings())
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = _timings.get()
+            _timings.reset(token)
+        self.record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        # Clients choose the method, so anything unusual shares one label value
+        method = request.method if request.method in METHODS else 'other'
+        shard = _shard()
+        labels = (('view', view), ('method', method))
+        shard.observe('railbooker_request_duration_seconds', labels, elapsed)
+        shard.inc('railbooker_requests_total', labels + (('status', str(response.status_code)),))
+        shard.inc('railbooker_db_queries_total', (('view', view),), timings.queries)
+        shard.inc('railbooker_db_query_seconds_total', (('view', view),), timings.query_seconds)
+        shard.observe('railbooker_template_render_seconds', (('view', view),), timings.template_seconds)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings = _timings.get()
+            if timings is not None:
+                timings.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every top-level render"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels) + '}'
+
+
+def render_metrics():
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # dict.copy() runs without releasing the GIL, so it is safe against concurrent writers
+        for key, value in shard.counters.copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, total) in shard.histograms.copy().items():
+            merged = histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0])
+            for i, count in enumerate(list(buckets)):
+                merged[0][i] += count
+            merged[1] += total
+
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        declare(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (buckets, total) in sorted(histograms.items()):
+        declare(name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), buckets):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    for collector in _collectors:
+        for name, kind, labels, value in collector():
+            declare(name, kind)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    declare('railbooker_process_id', 'gauge')
+    lines.append(f'railbooker_process_id {os.getpid()}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, behind METRICS_TOKEN or, without one, staff only"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_active and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,10 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+
+from django.core.exceptions import ImproperlyConfigured
+
+from railbooker.caches import cache_config, is_shared_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,12 +32,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'railbooker.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'booking.wizard.WizardMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -41,7 +47,7 @@ ROOT_URLCONF = 'railbooker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'railbooker.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -56,15 +62,114 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'railbooker.wsgi.application'
+ASGI_APPLICATION = 'railbooker.asgi.application'
+
+# Serve the read-only views from booking.async_views; railbooker.asgi turns it on
+ASYNC_READ_VIEWS = config('ASYNC_READ_VIEWS', default=False, cast=bool)
+
+# SQLite concurrency profile, see railbooker.sqlite: WAL and the pragmas below
+# on every new connection, and booking writes retried when the file is locked
+SQLITE_CONCURRENCY = config('SQLITE_CONCURRENCY', default=True, cast=bool)
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=20, cast=int)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at checkpoints rather than at every commit; safe with WAL
+    'synchronous': 'NORMAL',
+    # Negative sizes are in KiB
+    'cache_size': -config('SQLITE_CACHE_KB', default=32000, cast=int),
+    'temp_store': 'MEMORY',
+    'busy_timeout': SQLITE_BUSY_TIMEOUT * 1000,
+}
+SQLITE_BUSY_RETRIES = 8
+SQLITE_BUSY_BACKOFF = 0.02
 
 # Database
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+        },
+        # Seconds a connection is kept for the next request, 0 to close after each.
+        # Always 0 under ASGI: async views run their queries on per-request
+        # threads, so a kept connection would never be reused or closed
+        'CONN_MAX_AGE': 0 if ASYNC_READ_VIEWS else config('CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas, one SQLite file (or database name) per replica; read-only
+# views opt in to them, see railbooker.db_router
+DATABASE_REPLICAS = []
+for n, name in enumerate(config('DATABASE_REPLICA_NAMES', default='', cast=Csv()), start=1):
+    alias = f'replica{n}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['railbooker.db_router.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they book or cancel
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# Cache, shared by every worker and management command: CACHE_URL is a
+# redis://, memcached://, db://<table> or locmem:// URL, see railbooker.caches.
+# Development keeps a per-process cache; otherwise the database cache is the
+# default (run createcachetable once)
+CACHE_URL = config('CACHE_URL', default='locmem://' if DEBUG else 'db://railbooker_cache')
+CACHES = {
+    'default': cache_config(CACHE_URL, 'default'),
+    'search': cache_config(
+        CACHE_URL, 'search', max_entries=config('SEARCH_CACHE_MAX_ENTRIES', default=5000, cast=int)
+    ),
+}
+
+# Train search results cache (alias from CACHES and entry lifetime in seconds)
+SEARCH_CACHE_ALIAS = 'search'
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=300, cast=int)
+
+# PNR snapshot lifetime in seconds; writes evict entries before they expire
+PNR_CACHE_TIMEOUT = config('PNR_CACHE_TIMEOUT', default=600, cast=int)
+
+# Live running status: feed token, cached state lifetime and SSE pacing (seconds);
+# streams stay open only under ASGI, WSGI answers one poll per reconnect
+RUNNING_STATUS_INGEST_TOKEN = config('RUNNING_STATUS_INGEST_TOKEN', default='')
+RUNNING_STATUS_TIMEOUT = 6 * 60 * 60
+RUNNING_STATUS_STREAM_INTERVAL = 5
+RUNNING_STATUS_STREAM_SECONDS = 10 * 60
+
+# Booking wizard state: 'cache' (id in a signed cookie) or 'cookie' (whole
+# state in a signed cookie), the cache alias used and its lifetime in seconds.
+# The cookie is signed, not encrypted, so it shows passengers' ID numbers to
+# anyone holding it. A per-process cache would lose the state whenever the
+# next step lands on another worker, so outside DEBUG 'cache' needs CACHE_URL
+BOOKING_WIZARD_STORE = config('BOOKING_WIZARD_STORE', default='cache')
+BOOKING_WIZARD_CACHE_ALIAS = 'default'
+BOOKING_WIZARD_TIMEOUT = 30 * 60
+if BOOKING_WIZARD_STORE == 'cache' and not DEBUG and not is_shared_url(CACHE_URL):
+    raise ImproperlyConfigured(
+        "BOOKING_WIZARD_STORE 'cache' needs a cache shared by every worker; set CACHE_URL or use 'cookie'."
+    )
+
+# Store a PDF copy of every e-ticket (needs WeasyPrint)
+E_TICKET_PDF = config('E_TICKET_PDF', default=False, cast=bool)
+
+# Seat holds between payment and seat selection: lease length and the least
+# time between two lazy sweeps of expired holds (seconds)
+SEAT_HOLD_SECONDS = config('SEAT_HOLD_SECONDS', default=600, cast=int)
+SEAT_HOLD_REAP_INTERVAL = config('SEAT_HOLD_REAP_INTERVAL', default=30, cast=int)
+
+# How long seat map versions and changes stay cached for polling clients (seconds)
+SEAT_MAP_CACHE_TIMEOUT = config('SEAT_MAP_CACHE_TIMEOUT', default=120, cast=int)
+
+# How long a used booking idempotency key stays in the cache (the table keeps it)
+IDEMPOTENCY_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Most sub-requests in one /api/v1/batch/ call, and ids in one availability or fares call
+API_BATCH_LIMIT = config('API_BATCH_LIMIT', default=20, cast=int)
+
+# Bearer token required by the /metrics endpoint; leave empty to allow staff logins only
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
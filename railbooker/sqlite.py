@@ -0,0 +1,74 @@
+"""Concurrency profile for SQLite deployments.
+
+With ``SQLITE_CONCURRENCY`` enabled every new SQLite connection is switched
+to WAL journaling, so readers no longer block the writer, and gets the
+synchronous, cache and busy-timeout pragmas from ``SQLITE_PRAGMAS``. Paired
+with ``CONN_MAX_AGE`` each worker thread keeps its connection (and its page
+cache) across requests instead of reopening the file.
+
+SQLite still allows a single writer. A transaction that started reading and
+then needs to write can fail at once with "database is locked" instead of
+waiting out the busy timeout, so write paths are wrapped in
+``retry_on_busy``, which reruns the whole transaction with jittered
+exponential backoff.
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+def enabled():
+    return getattr(settings, 'SQLITE_CONCURRENCY', False)
+
+
+def _in_memory(connection):
+    name = str(connection.settings_dict['NAME'])
+    return name == ':memory:' or 'mode=memory' in name
+
+
+def configure(sender, connection, **kwargs):
+    """connection_created receiver applying the profile's pragmas"""
+    if connection.vendor != 'sqlite' or not enabled():
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if _in_memory(connection):
+        pragmas.pop('journal_mode', None)
+        # Shared-cache readers fail at once on a table another connection is
+        # writing, where WAL readers would not wait at all
+        pragmas['read_uncommitted'] = 1
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_busy(error):
+    message = str(error).lower()
+    return isinstance(error, OperationalError) and ('locked' in message or 'busy' in message)
+
+
+def retry_on_busy(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Rerun a transactional write when SQLite reports the database as locked
+
+    Only the outermost call retries: inside another transaction the error is
+    left to the caller, whose transaction has to be rolled back as a whole.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            connection = connections[using]
+            attempts = getattr(settings, 'SQLITE_BUSY_RETRIES', 8)
+            if connection.vendor != 'sqlite' or not enabled() or connection.in_atomic_block:
+                attempts = 0
+            delay = getattr(settings, 'SQLITE_BUSY_BACKOFF', 0.02)
+            for attempt in range(attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if attempt == attempts or not is_busy(e):
+                        raise
+                time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+        return wrapper
+    return decorator(func) if func else decorator
@@ -0,0 +1,102 @@
+import * as React from "react"
+
+// Polls the seat map of a coach from the Django seat map endpoint. The
+// layout is fetched once per page load; polls send the version we hold and
+// get back 304 (nothing changed) or only the places taken and freed since.
+
+const POLL_INTERVAL = 5000
+
+export interface CoachLayout {
+  name: string
+  label: string
+  capacity: number
+  seats: { number: string; type: string }[]
+  // Bit indexes per row (a chair car row or a sleeper bay), null for the aisle
+  rows: (number | null)[][]
+}
+
+export interface SeatMap {
+  layout: CoachLayout
+  coach: string
+  coaches: string[]
+  capacity: number
+  version: number
+  taken: Set<number>
+  held: Set<number>
+  mine: Set<number>
+}
+
+const layouts = new Map<string, Promise<CoachLayout>>()
+
+function fetchLayout(name: string) {
+  if (!layouts.has(name)) {
+    layouts.set(name, fetch(`/coach-layouts/${name}/`).then((response) => response.json()))
+  }
+  return layouts.get(name)!
+}
+
+export function useSeatMap(trainId?: string, travelDate?: string, seatClass?: string, coach?: string) {
+  const [seatMap, setSeatMap] = React.useState<SeatMap | null>(null)
+  const [error, setError] = React.useState(false)
+
+  React.useEffect(() => {
+    if (!trainId || !travelDate || !seatClass) return
+    let cancelled = false
+    let version: number | null = null
+    let currentCoach = coach
+    const base = `/seat-map/${trainId}/${travelDate}/${seatClass}/`
+
+    const poll = async () => {
+      const url = currentCoach ? `${base}${currentCoach}/` : base
+      const response = await fetch(version === null ? url : `${url}?since=${version}`, {
+        credentials: "same-origin",
+      })
+      if (cancelled || response.status === 304) return
+      if (!response.ok) {
+        setError(true)
+        return
+      }
+      const data = await response.json()
+      if (data.full) {
+        const layout = await fetchLayout(data.layout)
+        if (cancelled) return
+        currentCoach = data.coach
+        setSeatMap({
+          layout,
+          coach: data.coach,
+          coaches: data.coaches,
+          capacity: data.capacity,
+          version: data.version,
+          taken: new Set(data.taken),
+          held: new Set(data.held),
+          mine: new Set(data.mine),
+        })
+      } else {
+        setSeatMap((previous) => {
+          if (!previous) return previous
+          const taken = new Set(previous.taken)
+          const held = new Set(previous.held)
+          const mine = new Set(previous.mine)
+          data.taken.forEach((index: number) => taken.add(index))
+          data.freed.forEach((index: number) => {
+            taken.delete(index)
+            held.delete(index)
+            mine.delete(index)
+          })
+          return { ...previous, taken, held, mine, version: data.version }
+        })
+      }
+      version = data.version
+      setError(false)
+    }
+
+    poll().catch(() => setError(true))
+    const timer = window.setInterval(() => poll().catch(() => setError(true)), POLL_INTERVAL)
+    return () => {
+      cancelled = true
+      window.clearInterval(timer)
+    }
+  }, [trainId, travelDate, seatClass, coach])
+
+  return { seatMap, error }
+}
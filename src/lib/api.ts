@@ -0,0 +1,74 @@
+// Client of the Django JSON API (/api/v1/). GETs are revalidated with the
+// ETag of the last response, so unchanged data costs an empty 304; batch()
+// runs several GETs in one round trip. POSTs send the csrftoken cookie back
+// as X-CSRFToken; session/ sets the cookie when the page has none yet.
+
+const BASE = "/api/v1"
+
+const cached = new Map<string, { etag: string; body: unknown }>()
+
+export class ApiError extends Error {
+  constructor(public status: number, public body: { error?: string; errors?: unknown }) {
+    super(body.error ?? `Request failed with status ${status}`)
+  }
+}
+
+function csrfToken() {
+  return document.cookie.match(/(?:^|; )csrftoken=([^;]+)/)?.[1] ?? ""
+}
+
+export function apiUrl(path: string, params: Record<string, string | number | string[] | undefined> = {}) {
+  const query = new URLSearchParams()
+  for (const [key, value] of Object.entries(params)) {
+    if (value === undefined) continue
+    if (Array.isArray(value)) value.forEach((item) => query.append(key, item))
+    else query.set(key, String(value))
+  }
+  const search = query.toString()
+  return `${BASE}/${path}${search ? `?${search}` : ""}`
+}
+
+export async function get<T>(url: string): Promise<T> {
+  const previous = cached.get(url)
+  const response = await fetch(url, {
+    credentials: "same-origin",
+    headers: previous ? { "If-None-Match": previous.etag } : {},
+  })
+  if (response.status === 304 && previous) return previous.body as T
+  const body = await response.json()
+  if (!response.ok) throw new ApiError(response.status, body)
+  const etag = response.headers.get("ETag")
+  if (etag) cached.set(url, { etag, body })
+  return body as T
+}
+
+async function ensureCsrfToken() {
+  if (!csrfToken()) await get(apiUrl("session/"))
+}
+
+async function post<T>(path: string, payload: unknown, headers: Record<string, string> = {}): Promise<T> {
+  await ensureCsrfToken()
+  const response = await fetch(`${BASE}/${path}`, {
+    method: "POST",
+    credentials: "same-origin",
+    headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken(), ...headers },
+    body: JSON.stringify(payload),
+  })
+  const body = await response.json()
+  if (!response.ok) throw new ApiError(response.status, body)
+  return body as T
+}
+
+export interface BatchResponse {
+  status: number
+  body: unknown
+}
+
+export async function batch(urls: string[]): Promise<BatchResponse[]> {
+  const { responses } = await post<{ responses: BatchResponse[] }>("batch/", { requests: urls })
+  return responses
+}
+
+export function createBooking(payload: Record<string, unknown>, idempotencyKey: string) {
+  return post<Record<string, unknown>>("bookings/", payload, { "Idempotency-Key": idempotencyKey })
+}
@@ -1,16 +1,17 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { useNavigate, useParams, useLocation } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import Header from "@/components/Header";
 import { Badge } from "@/components/ui/badge";
 import { Sparkles, Train, MapPin, Calendar, Users, CreditCard } from "lucide-react";
+import { useSeatMap } from "@/hooks/use-seat-map";
 
 interface Seat {
   id: string;
   number: string;
-  type: "window" | "middle" | "aisle";
-  status: "available" | "occupied" | "selected";
+  type: string;
+  status: "available" | "occupied" | "held";
   price: number;
 }
 
@@ -21,47 +22,32 @@ const SeatSelection = () => {
   const { searchData, passengerDetails, selectedTrain, seatClass, price, paymentConfirmed } = location.state || {};
 
   const [selectedSeats, setSelectedSeats] = useState<string[]>([]);
+  const [coach, setCoach] = useState<string | undefined>();
+  const { seatMap, error } = useSeatMap(trainId, searchData?.date, seatClass, coach);
 
-  const [seats] = useState<Seat[]>([
-    // Row 1
-    { id: "1A", number: "1A", type: "window", status: "available", price },
-    { id: "1B", number: "1B", type: "middle", status: "available", price },
-    { id: "1C", number: "1C", type: "aisle", status: "occupied", price },
-    { id: "1D", number: "1D", type: "aisle", status: "available", price },
-    { id: "1E", number: "1E", type: "middle", status: "available", price },
-    { id: "1F", number: "1F", type: "window", status: "available", price },
-    // Row 2
-    { id: "2A", number: "2A", type: "window", status: "available", price },
-    { id: "2B", number: "2B", type: "middle", status: "occupied", price },
-    { id: "2C", number: "2C", type: "aisle", status: "available", price },
-    { id: "2D", number: "2D", type: "aisle", status: "available", price },
-    { id: "2E", number: "2E", type: "middle", status: "available", price },
-    { id: "2F", number: "2F", type: "window", status: "occupied", price },
-    // Row 3
-    { id: "3A", number: "3A", type: "window", status: "available", price },
-    { id: "3B", number: "3B", type: "middle", status: "available", price },
-    { id: "3C", number: "3C", type: "aisle", status: "available", price },
-    { id: "3D", number: "3D", type: "aisle", status: "available", price },
-    { id: "3E", number: "3E", type: "middle", status: "available", price },
-    { id: "3F", number: "3F", type: "window", status: "available", price },
-    // Row 4
-    { id: "4A", number: "4A", type: "window", status: "available", price },
-    { id: "4B", number: "4B", type: "middle", status: "available", price },
-    { id: "4C", number: "4C", type: "aisle", status: "available", price },
-    { id: "4D", number: "4D", type: "aisle", status: "available", price },
-    { id: "4E", number: "4E", type: "middle", status: "occupied", price },
-    { id: "4F", number: "4F", type: "window", status: "available", price },
-    // Row 5
-    { id: "5A", number: "5A", type: "window", status: "available", price },
-    { id: "5B", number: "5B", type: "middle", status: "available", price },
-    { id: "5C", number: "5C", type: "aisle", status: "available", price },
-    { id: "5D", number: "5D", type: "aisle", status: "available", price },
-    { id: "5E", number: "5E", type: "middle", status: "available", price },
-    { id: "5F", number: "5F", type: "window", status: "available", price },
-  ]);
+  // Rows of the coach layout with each place's live status; null marks the aisle
+  const rows: (Seat | null)[][] = (seatMap?.layout.rows ?? []).map((cells) =>
+    cells
+      .filter((index) => index === null || index < seatMap!.capacity)
+      .map((index) => {
+        if (index === null) return null;
+        const { number, type } = seatMap!.layout.seats[index];
+        let status: Seat["status"] = "available";
+        if (seatMap!.taken.has(index) && !seatMap!.mine.has(index)) {
+          status = seatMap!.held.has(index) ? "held" : "occupied";
+        }
+        return { id: number, number, type, status, price };
+      })
+  ).filter((row) => row.some(Boolean));
+
+  // Drop picks someone else has booked since
+  useEffect(() => {
+    const unavailable = new Set(rows.flat().filter((seat) => seat && seat.status !== "available").map((seat) => seat!.id));
+    setSelectedSeats((picked) => (picked.some((id) => unavailable.has(id)) ? picked.filter((id) => !unavailable.has(id)) : picked));
+  }, [seatMap]);
 
   const handleSeatClick = (seatId: string, status: string) => {
-    if (status === "occupied") return;
+    if (status !== "available") return;
     
     if (selectedSeats.includes(seatId)) {
       setSelectedSeats(selectedSeats.filter(id => id !== seatId));
@@ -76,6 +62,7 @@ const SeatSelection = () => {
   const getSeatColor = (seat: Seat) => {
     if (selectedSeats.includes(seat.id)) return "bg-gradient-to-r from-green-400 to-emerald-500 text-white border-green-400 shadow-xl animate-pulse";
     if (seat.status === "occupied") return "bg-gradient-to-r from-red-400 to-red-600 text-white border-red-500 cursor-not-allowed opacity-75";
+    if (seat.status === "held") return "bg-gradient-to-r from-yellow-200 to-amber-300 text-gray-700 border-amber-400 cursor-not-allowed opacity-75";
     return "bg-gradient-to-r from-blue-50 to-purple-50 text-gray-700 border-gray-300 hover:from-blue-100 hover:to-purple-100 hover:border-blue-400 hover:shadow-lg cursor-pointer transform hover:scale-110 transition-all duration-200";
   };
 
@@ -83,6 +70,10 @@ const SeatSelection = () => {
     switch (type) {
       case "window": return "🪟";
       case "aisle": return "🚶";
+      case "lower": return "LB";
+      case "upper": return "UB";
+      case "side-lower": return "SL";
+      case "side-upper": return "SU";
       default: return "";
     }
   };
@@ -167,7 +158,7 @@ const SeatSelection = () => {
                     <Train className="h-6 w-6" />
                     <span>Coach Layout - {getSeatClassName(seatClass)}</span>
                   </span>
-                  <Badge variant="outline" className="bg-white/20 text-white border-white/30">Coach A1</Badge>
+                  <Badge variant="outline" className="bg-white/20 text-white border-white/30">Coach {seatMap?.coach ?? "…"}</Badge>
                 </CardTitle>
               </CardHeader>
               <CardContent className="p-8">
@@ -205,61 +196,59 @@ const SeatSelection = () => {
                     </div>
                   </div>
                   
+                  {seatMap && seatMap.coaches.length > 1 && (
+                    <div className="flex flex-wrap justify-center gap-2 mb-6">
+                      {seatMap.coaches.map((name) => (
+                        <Button
+                          key={name}
+                          size="sm"
+                          variant={name === seatMap.coach ? "default" : "outline"}
+                          onClick={() => {
+                            setSelectedSeats([]);
+                            setCoach(name);
+                          }}
+                        >
+                          {name}
+                        </Button>
+                      ))}
+                    </div>
+                  )}
+
+                  {!seatMap && (
+                    <p className="text-center text-gray-500 py-8">
+                      {error ? "The seat map is not available right now." : "Loading seat map…"}
+                    </p>
+                  )}
+
                   <div className="space-y-4">
-                    {[1, 2, 3, 4, 5].map((row) => (
-                      <div key={row} className="flex items-center justify-center space-x-3" style={{ animationDelay: `${row * 0.1}s` }}>
+                    {rows.map((row, rowIndex) => (
+                      <div key={rowIndex} className="flex items-center justify-center space-x-3" style={{ animationDelay: `${rowIndex * 0.1}s` }}>
                         <div className="w-10 h-10 bg-gradient-to-r from-blue-500 to-purple-500 text-white rounded-full flex items-center justify-center font-bold text-lg shadow-lg">
-                          {row}
-                        </div>
-                        
-                        {/* Left side seats */}
-                        <div className="flex space-x-2">
-                          {seats
-                            .filter(seat => seat.number.startsWith(row.toString()))
-                            .slice(0, 3)
-                            .map((seat) => (
-                              <div key={seat.id} className="relative animate-fade-in">
-                                <button
-                                  onClick={() => handleSeatClick(seat.id, seat.status)}
-                                  className={`w-14 h-14 border-2 rounded-xl font-bold text-sm ${getSeatColor(seat)}`}
-                                  disabled={seat.status === "occupied"}
-                                  title={`Seat ${seat.number} - ${seat.type}`}
-                                >
-                                  {seat.number.charAt(1)}
-                                </button>
-                                <div className="absolute -top-1 -right-1 text-lg">
-                                  {getSeatIcon(seat.type)}
-                                </div>
-                              </div>
-                            ))}
-                        </div>
-                        
-                        {/* Aisle */}
-                        <div className="w-16 border-l-4 border-r-4 border-blue-300 h-14 mx-6 flex items-center justify-center bg-gradient-to-r from-blue-100 to-purple-100 rounded-lg">
-                          <span className="text-blue-600 text-xs font-bold">AISLE</span>
+                          {rowIndex + 1}
                         </div>
-                        
-                        {/* Right side seats */}
-                        <div className="flex space-x-2">
-                          {seats
-                            .filter(seat => seat.number.startsWith(row.toString()))
-                            .slice(3, 6)
-                            .map((seat) => (
-                              <div key={seat.id} className="relative animate-fade-in">
-                                <button
-                                  onClick={() => handleSeatClick(seat.id, seat.status)}
-                                  className={`w-14 h-14 border-2 rounded-xl font-bold text-sm ${getSeatColor(seat)}`}
-                                  disabled={seat.status === "occupied"}
-                                  title={`Seat ${seat.number} - ${seat.type}`}
-                                >
-                                  {seat.number.charAt(1)}
-                                </button>
-                                <div className="absolute -top-1 -right-1 text-lg">
-                                  {getSeatIcon(seat.type)}
-                                </div>
+
+                        {row.map((seat, cellIndex) =>
+                          seat ? (
+                            <div key={seat.id} className="relative animate-fade-in">
+                              <button
+                                onClick={() => handleSeatClick(seat.id, seat.status)}
+                                className={`w-14 h-14 border-2 rounded-xl font-bold text-sm ${getSeatColor(seat)}`}
+                                disabled={seat.status !== "available"}
+                                title={`Seat ${seat.number} - ${seat.type}`}
+                              >
+                                {seat.number}
+                              </button>
+                              <div className="absolute -top-1 -right-1 text-xs">
+                                {getSeatIcon(seat.type)}
                               </div>
-                            ))}
-                        </div>
+                            </div>
+                          ) : (
+                            /* Aisle */
+                            <div key={`aisle-${cellIndex}`} className="w-16 border-l-4 border-r-4 border-blue-300 h-14 mx-6 flex items-center justify-center bg-gradient-to-r from-blue-100 to-purple-100 rounded-lg">
+                              <span className="text-blue-600 text-xs font-bold">AISLE</span>
+                            </div>
+                          )
+                        )}
                       </div>
                     ))}
                   </div>
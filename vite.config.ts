@@ -8,6 +8,12 @@ export default defineConfig(({ mode }) => ({
   server: {
     host: "::",
     port: 8080,
+    // Live data comes from the Django app
+    proxy: {
+      "/api": "http://localhost:8000",
+      "/seat-map": "http://localhost:8000",
+      "/coach-layouts": "http://localhost:8000",
+    },
   },
   plugins: [
     react(),